@@ -0,0 +1,4 @@
+# /benchmarks/__init__.py
+#
+# See /LICENCE.md for Copyright information
+"""Performance benchmarks for polysquare-cmake-linter."""
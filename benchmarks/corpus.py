@@ -0,0 +1,189 @@
+# /benchmarks/corpus.py
+#
+# Deterministic generator for synthetic CMake sources. Sources scale
+# along several axes independently, so that a slowdown can be pinned on
+# the thing that causes it:
+#
+# statements: Total number of statements in the file, including those
+#             inside function bodies.
+# depth:      How deeply if and foreach blocks are nested in each function.
+# variables:  Number of variables set, and mostly used, in each function.
+# privates:   Number of private function definitions, most of which are
+#             called from the toplevel.
+#
+# Like most real CMakeLists files, the toplevel also has if, while and
+# foreach blocks between the other statements.
+#
+# nested generates a single function with blocks nested thousands deep and
+# nothing indented, like some machine generated scripts, to stress the
+# linter on deep nesting without making the source huge.
+#
+# The same CorpusSpec always generates the same source.
+#
+# See /LICENCE.md for Copyright information
+"""Deterministic generator for synthetic CMake sources."""
+
+import random
+
+from collections import namedtuple
+
+CorpusSpec = namedtuple("CorpusSpec",
+                        "statements depth variables privates seed")
+
+# Namespace used for generated definitions, which should be passed to
+# linter.lint as the namespace option.
+NAMESPACE = "bench"
+
+INDENT = 4
+
+
+def spec(statements=200, depth=2, variables=8, privates=4, seed=0):
+    """Return a CorpusSpec with defaults for axes not given."""
+    return CorpusSpec(statements, depth, variables, privates, seed)
+
+
+class _Emitter(object):
+    """Collects lines of source and counts the statements among them."""
+
+    def __init__(self, indent=INDENT):
+        """Initialize with no lines, indenting each level by indent."""
+        super(_Emitter, self).__init__()
+        self.indent = indent
+        self.lines = []
+        self.statements = 0
+
+    def statement(self, level, text):
+        """Emit a statement at indent level."""
+        self.lines.append(" " * (self.indent * level) + text + "\n")
+        self.statements += 1
+
+    def footer(self, level, text):
+        """Emit the footer of a block, which is not a statement."""
+        self.lines.append(" " * (self.indent * level) + text + "\n")
+
+
+def _nested_blocks(emitter, rng, level, depth, argument):
+    """Emit depth nested if and foreach blocks, starting at level."""
+    footers = []
+
+    for index in range(0, depth):
+        if rng.random() < 0.5:
+            emitter.statement(level, "if (${{{0}}})".format(argument))
+            footers.append("endif (${{{0}}})".format(argument))
+        else:
+            loop_var = "LOOP_VAR_{0}".format(index)
+            emitter.statement(level, "foreach ({0} ${{{1}}})".format(
+                loop_var,
+                argument
+            ))
+            footers.append("endforeach ()")
+            argument = loop_var
+
+        level += 1
+        emitter.statement(level, "message (STATUS \"${{{0}}}\")".format(
+            argument
+        ))
+
+    for footer in reversed(footers):
+        level -= 1
+        emitter.footer(level, footer)
+
+
+def _function(emitter, rng, name, corpus_spec):
+    """Emit a function called name, with variables and nested blocks."""
+    emitter.statement(0, "function ({0} ARGUMENT)".format(name))
+
+    for index in range(0, corpus_spec.variables):
+        emitter.statement(1, "set (VARIABLE_{0} \"${{ARGUMENT}}\")".format(
+            index
+        ))
+
+    for index in range(0, corpus_spec.variables):
+        # Leave some variables unused, so that unused checks report them
+        if rng.random() < 0.9:
+            emitter.statement(1, "message (STATUS \"${{VARIABLE_{0}}}\")"
+                              .format(index))
+
+    _nested_blocks(emitter, rng, 1, corpus_spec.depth, "ARGUMENT")
+    emitter.footer(0, "endfunction ()")
+
+
+def _toplevel_block(emitter, index):
+    """Emit an if, while or foreach block at the toplevel."""
+    variable = "${{_PRIVATE_{0}}}".format(index - index % 4 + 1)
+    kind = index % 3
+    if kind == 0:
+        emitter.statement(0, "if ({0})".format(variable))
+        emitter.statement(1, "message (STATUS \"if\")")
+        emitter.statement(0, "elseif (${{PATH_{0}}})".format(index))
+        emitter.statement(1, "message (STATUS \"elseif\")")
+        emitter.statement(0, "else ()")
+        emitter.statement(1, "message (STATUS \"else\")")
+        emitter.footer(0, "endif ()")
+    elif kind == 1:
+        emitter.statement(0, "while ({0})".format(variable))
+        emitter.statement(1, "message (STATUS \"while\")")
+        emitter.footer(0, "endwhile ()")
+    else:
+        emitter.statement(0, "foreach (ITEM_{0} {1})".format(index,
+                                                             variable))
+        emitter.statement(1, "message (STATUS \"${{ITEM_{0}}}\")".format(
+            index
+        ))
+        emitter.footer(0, "endforeach ()")
+
+
+def generate(corpus_spec):
+    """Return CMake source generated for corpus_spec."""
+    rng = random.Random(corpus_spec.seed)
+    emitter = _Emitter()
+
+    private_names = ["_{0}_private_{1}".format(NAMESPACE, index)
+                     for index in range(0, corpus_spec.privates)]
+    for name in private_names:
+        _function(emitter, rng, name, corpus_spec)
+
+    for name in private_names:
+        # Leave some private definitions unused
+        if rng.random() < 0.9:
+            emitter.statement(0, "{0} (VALUE)".format(name))
+
+    index = 0
+    while emitter.statements < corpus_spec.statements:
+        if index % 4 == 0:
+            _function(emitter,
+                      rng,
+                      "{0}_function_{1}".format(NAMESPACE, index),
+                      corpus_spec)
+        elif index % 4 == 1:
+            emitter.statement(0, "set (_PRIVATE_{0} VALUE)".format(index))
+        elif index % 4 == 2:
+            emitter.statement(0, "message (STATUS \"${{_PRIVATE_{0}}}\")"
+                              .format(index - 1))
+        else:
+            emitter.statement(0, "{0}_function_{1} (${{PATH_{2}}})".format(
+                NAMESPACE,
+                index - 3,
+                index
+            ))
+
+        _toplevel_block(emitter, index)
+        index += 1
+
+    return "".join(emitter.lines)
+
+
+def nested(depth, seed=0):
+    """Return source for a function with blocks nested depth deep.
+
+    Nothing is indented, so the source only grows in proportion to depth.
+    """
+    rng = random.Random(seed)
+    emitter = _Emitter(indent=0)
+
+    emitter.statement(0, "function ({0}_nested ARGUMENT)".format(NAMESPACE))
+    _nested_blocks(emitter, rng, 1, depth, "ARGUMENT")
+    emitter.footer(0, "endfunction ()")
+    emitter.statement(0, "{0}_nested (VALUE)".format(NAMESPACE))
+
+    return "".join(emitter.lines)
@@ -0,0 +1,228 @@
+# /benchmarks/run.py
+#
+# Time linter.lint end to end, and each check on its own, over synthetic
+# corpora scaled along each axis of benchmarks.corpus. Results are
+# written as JSON and can be compared against a stored baseline:
+#
+#     python -m benchmarks.run --output baseline.json
+#     python -m benchmarks.run --baseline baseline.json
+#
+# The second command exits with a non-zero status if anything became
+# slower than the baseline by more than --threshold.
+#
+# Sources with blocks nested thousands deep, from benchmarks.corpus.nested,
+# are also linted, but only end to end, since timing each check on its
+# own would take too long.
+#
+# See /LICENCE.md for Copyright information
+"""Benchmarks for linter.lint over synthetic CMake sources."""
+
+import argparse
+
+import json
+
+import platform
+
+import sys
+
+import timeit
+
+from collections import namedtuple
+
+from benchmarks import corpus
+
+from polysquarecmakelinter import __version__
+from polysquarecmakelinter import linter
+
+# Options passed to every lint, so that checks taking options do work
+LINT_OPTIONS = {
+    "namespace": corpus.NAMESPACE,
+    "indent": corpus.INDENT
+}
+
+# How much each axis is multiplied by, relative to the base spec
+SCALES = (1, 4, 16)
+
+# How deeply blocks are nested in each stress source
+STRESS_DEPTHS = (1000, 4000)
+
+Regression = namedtuple("Regression", "name baseline current")
+
+
+def corpora(base=None, scales=SCALES):
+    """Return a list of (name, source) for base scaled along each axis.
+
+    Only one axis is scaled at a time, the others are left as in base.
+    """
+    base = base or corpus.spec()
+    result = []
+
+    for axis in ("statements", "depth", "variables", "privates"):
+        for scale in scales:
+            axis_spec = base._replace(**{axis: getattr(base, axis) * scale})
+            name = "{0}_x{1}".format(axis, scale)
+            result.append((name, corpus.generate(axis_spec)))
+
+    return result
+
+
+def stress_corpora(depths=STRESS_DEPTHS):
+    """Return a list of (name, source) for blocks nested to each depth."""
+    return [("nested_{0}".format(depth), corpus.nested(depth))
+            for depth in depths]
+
+
+def _best_time(function, repeat):
+    """Return the shortest time function took out of repeat runs."""
+    times = []
+    for _ in range(0, repeat):
+        start = timeit.default_timer()
+        function()
+        times.append(timeit.default_timer() - start)
+
+    return min(times)
+
+
+def time_corpus(source, repeat=3):
+    """Return a dict of timings for linting source.
+
+    The "lint" entry is the time to lint with all checks enabled, and
+    there is an entry for each check in linter.LINTER_FUNCTIONS, which
+    is the time to lint with only that check enabled.
+    """
+    timings = {
+        "lint": _best_time(lambda: linter.lint(source, **LINT_OPTIONS),
+                           repeat)
+    }
+
+    def _lint_only(code):
+        """Return function linting source with only code enabled."""
+        return lambda: linter.lint(source, whitelist=[code], **LINT_OPTIONS)
+
+    for code in sorted(linter.LINTER_FUNCTIONS.keys()):
+        timings[code] = _best_time(_lint_only(code), repeat)
+
+    return timings
+
+
+def _time_lint(source, repeat):
+    """Return a dict with only the time to lint source with all checks."""
+    return {
+        "lint": _best_time(lambda: linter.lint(source, **LINT_OPTIONS),
+                           repeat)
+    }
+
+
+def run(sources, repeat=3, stress_sources=()):
+    """Return a results dict for timing each (name, source) in sources.
+
+    Timings are flattened into keys of corpus name and timing name
+    separated by a colon, for example "depth_x4:unused/private". Only
+    the "lint" timing is taken for stress_sources.
+    """
+    results = dict()
+    timed = ([(n, s, time_corpus) for (n, s) in sources] +
+             [(n, s, _time_lint) for (n, s) in stress_sources])
+    for name, source, time_function in timed:
+        for timing, seconds in time_function(source, repeat).items():
+            results["{0}:{1}".format(name, timing)] = seconds
+
+    return {
+        "version": __version__,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "results": results
+    }
+
+
+def compare(current, baseline, threshold=0.1):
+    """Return a list of Regression in current relative to baseline.
+
+    A timing regressed if it is more than threshold (a fraction) slower
+    than the same timing in baseline. Timings only in one of the two
+    are not compared.
+    """
+    regressions = []
+    baseline_results = baseline["results"]
+
+    for name, seconds in sorted(current["results"].items()):
+        try:
+            before = baseline_results[name]
+        except KeyError:
+            continue
+
+        if seconds > before * (1.0 + threshold):
+            regressions.append(Regression(name, before, seconds))
+
+    return regressions
+
+
+def _parse_arguments(arguments=None):
+    """Return parsed command line arguments."""
+    parser = argparse.ArgumentParser(description="Benchmark the linter")
+    parser.add_argument("--output",
+                        type=str,
+                        default=None,
+                        help="""write results as JSON to this file""")
+    parser.add_argument("--baseline",
+                        type=str,
+                        default=None,
+                        help="""compare results to JSON in this file""")
+    parser.add_argument("--threshold",
+                        type=float,
+                        default=0.1,
+                        help="""fraction slower than the baseline which """
+                             """counts as a regression""")
+    parser.add_argument("--repeat",
+                        type=int,
+                        default=3,
+                        help="""number of times to run each timing""")
+    parser.add_argument("--statements",
+                        type=int,
+                        default=200,
+                        help="""statements in the base corpus""")
+    parser.add_argument("--stress-depths",
+                        type=int,
+                        nargs="*",
+                        default=list(STRESS_DEPTHS),
+                        help="""nesting depths of the stress sources, """
+                             """none to skip them""")
+    parser.add_argument("--seed",
+                        type=int,
+                        default=0,
+                        help="""seed for generating corpora""")
+
+    return parser.parse_args(arguments)
+
+
+def main(arguments=None):
+    """Run benchmarks and compare to a baseline if given."""
+    result = _parse_arguments(arguments)
+    base = corpus.spec(statements=result.statements, seed=result.seed)
+    current = run(corpora(base),
+                  result.repeat,
+                  stress_corpora(result.stress_depths))
+
+    if result.output:
+        with open(result.output, "w") as output_file:
+            json.dump(current, output_file, indent=2, sort_keys=True)
+    else:
+        for name, seconds in sorted(current["results"].items()):
+            sys.stdout.write("{0} {1:.6f}\n".format(name, seconds))
+
+    if result.baseline:
+        with open(result.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+        regressions = compare(current, baseline, result.threshold)
+        for regression in regressions:
+            sys.stderr.write("{0} regressed from {1:.6f}s "
+                             "to {2:.6f}s\n".format(*regression))
+
+        return len(regressions)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(min(main(), 1))
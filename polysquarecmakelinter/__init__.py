@@ -4,3 +4,5 @@
 #
 # See /LICENCE.md for Copyright information
 """Entry point when loading module."""
+
+__version__ = "0.0.15"
@@ -0,0 +1,170 @@
+# /polysquarecmakelinter/analysis.py
+#
+# Per-file analysis context shared by all checks. Each analysis product
+# (scope trees, call and definition indexes) is computed on first use
+# and then reused by every other check that asks for it.
+#
+# Checks declare which products they need up front (see types.Check),
+# so products which are needed together can be built in a single pass
+# and products which nobody needs are never built.
+#
+# See /LICENCE.md for Copyright information
+"""Per-file analysis context shared by all checks."""
+
+from polysquarecmakelinter import engine
+from polysquarecmakelinter import find_all
+from polysquarecmakelinter import find_variables_in_scopes
+from polysquarecmakelinter import ir
+from polysquarecmakelinter import timing
+
+
+PRODUCTS = frozenset([
+    "set_scopes",
+    "used_scopes",
+    "private_calls_and_definitions",
+    "toplevel_set_private_vars",
+    "variable_uses"
+])
+
+# Products which are built from other products
+_PRODUCT_INPUTS = {
+    "variable_uses": frozenset(["used_scopes"])
+}
+
+
+def requirements_of(checks):
+    """Return the union of products required by checks and their inputs."""
+    requirements = frozenset().union(*[c.requires for c in checks])
+    return requirements.union(*[_PRODUCT_INPUTS.get(r, frozenset())
+                                for r in requirements])
+
+
+def visits_of(checks):
+    """Return the union of node kinds visited by checks."""
+    return frozenset().union(*[c.visits for c in checks])
+
+
+class AnalysisContext(object):
+    """Lazily computed, cached analysis products for a single file."""
+
+    def __init__(self,
+                 contents,
+                 abstract_syntax_tree,
+                 skip=None,
+                 requirements=None,
+                 visits=None,
+                 profile=None):
+        """Initialize with file lines and the parsed tree.
+
+        abstract_syntax_tree may be a cmakeast tree or one already built
+        by ir.build, which is what products are built from.
+
+        skip is passed to the engine.Traversal for this file. requirements
+        is the set of products that checks declared they need, or None
+        if any product may be used. visits is the set of engine.Traversal
+        handlers that checks declared they subscribe to, or None if any
+        handler may be subscribed. Using a product or subscribing to a
+        handler which was not declared is an error.
+
+        If profile, a timing.Profile, is given, building each product is
+        timed, as is each handler subscribed while owner is set to the
+        name of a check.
+        """
+        super(AnalysisContext, self).__init__()
+        assert requirements is None or requirements <= PRODUCTS
+        self.contents = contents
+        self.tree = ir.build(abstract_syntax_tree)
+        self.traversal = engine.Traversal(self.tree, skip)
+        self.requirements = requirements
+        self.visits = visits
+        self.profile = profile or timing.NULL_PROFILE
+        self.owner = None
+        self._products = dict()
+
+    def _product(self, name, build, timer_name=None):
+        """Return product name, calling build on the tree if not cached."""
+        assert self.requirements is None or name in self.requirements, (
+            "{0} was not declared as a requirement".format(name)
+        )
+
+        try:
+            return self._products[name]
+        except KeyError:
+            with self.profile.timer("analysis", timer_name or name):
+                product = build(self.tree)
+
+            self._products[name] = product
+            return product
+
+    def _scopes_fused(self):
+        """Return true if set and used scopes are built in one pass."""
+        return self.requirements is None or (
+            "set_scopes" in self.requirements and
+            "used_scopes" in self.requirements
+        )
+
+    def _set_and_used_scopes(self, tree):
+        """Build a scope tree of set and used variables for both products."""
+        scopes = find_variables_in_scopes.set_and_used_in_tree(tree)
+        self._products["set_scopes"] = scopes
+        self._products["used_scopes"] = scopes
+        return scopes
+
+    def subscribe(self, **kwargs):
+        """Subscribe handlers to the shared traversal of this file."""
+        assert self.visits is None or set(kwargs.keys()) <= self.visits, (
+            "{0} not declared as visited".format(", ".join(kwargs.keys()))
+        )
+        if self.owner is not None:
+            kwargs = {
+                k: self.profile.timed("check", self.owner, v)
+                for (k, v) in kwargs.items()
+            }
+
+        self.traversal.subscribe(**kwargs)
+
+    @property
+    def set_scopes(self):
+        """Scope tree of variables set in this file."""
+        if self._scopes_fused():
+            return self._product("set_scopes",
+                                 self._set_and_used_scopes,
+                                 "set_and_used_scopes")
+
+        return self._product("set_scopes",
+                             find_variables_in_scopes.set_in_tree)
+
+    @property
+    def used_scopes(self):
+        """Scope tree of variables used in this file."""
+        if self._scopes_fused():
+            return self._product("used_scopes",
+                                 self._set_and_used_scopes,
+                                 "set_and_used_scopes")
+
+        return self._product("used_scopes",
+                             find_variables_in_scopes.used_in_tree)
+
+    @property
+    def private_calls_and_definitions(self):
+        """Tuple of private calls and private definitions in this file."""
+        return self._product("private_calls_and_definitions",
+                             find_all.private_calls_and_definitions)
+
+    @property
+    def toplevel_set_private_vars(self):
+        """Dict of private variables set at the toplevel of this file."""
+        return self._product("toplevel_set_private_vars",
+                             find_all.toplevel_set_private_vars)
+
+    @property
+    def variable_uses(self):
+        """Index of variable names to their uses within each used scope.
+
+        See find_variables_in_scopes.uses_by_name.
+        """
+        used_scopes = self.used_scopes
+        return self._product("variable_uses",
+                             lambda _: find_variables_in_scopes.uses_by_name(
+                                 used_scopes
+                             ))
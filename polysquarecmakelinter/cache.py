@@ -0,0 +1,584 @@
+# /polysquarecmakelinter/cache.py
+#
+# Cache of linter results keyed by a hash of the file contents and
+# everything else which can change the result of linting it. Since
+# the key does not depend on file paths or modification times, the
+# cache directory can be shared between checkouts and machines.
+#
+# Results are cached for each check on its own, so that enabling a new
+# check only runs that check on files which have not changed.
+#
+# Parsed trees are cached the same way, keyed only by the contents and
+# the versions of the parser and linter, so that they can be reused when
+# the checks or their options change. What each file exports to the
+# other files in its module is keyed by the contents and the checks
+# which export summaries.
+#
+# Values are kept in a single append-only data file with an index,
+# rather than one file per value, so that the cache directory stays
+# cheap to save and restore and can be bounded in size. Several linter
+# runs may share a cache directory at once, so writes take an advisory
+# lock and every value is stored with its key and a checksum.
+#
+# See /LICENCE.md for Copyright information
+"""Cache of linter results keyed by a hash of file contents and options."""
+
+import binascii
+
+import errno
+
+import hashlib
+
+import json
+
+import os
+
+import struct
+
+import tempfile
+
+import threading
+
+import zlib
+
+from collections import OrderedDict
+
+from contextlib import contextmanager
+
+from polysquarecmakelinter import __version__
+
+from polysquarecmakelinter.types import LinterFailure
+
+try:
+    from importlib import metadata  # suppress(import-error)
+except ImportError:
+    metadata = None
+
+try:
+    import fcntl  # suppress(import-error)
+except ImportError:
+    fcntl = None
+
+
+def _to_bytes(text):
+    """Return text encoded as UTF-8, if it is not already bytes."""
+    if isinstance(text, bytes):
+        return text
+
+    return text.encode("utf-8")
+
+
+def exports_key(contents, codes):
+    """Return a key for the summaries contents export to their module.
+
+    codes are the codes of the checks which export summaries. The key
+    changes if the contents, the checks or the version of the linter
+    change.
+    """
+    digest = hashlib.sha1()
+    digest.update(_to_bytes(json.dumps(["exports",
+                                        __version__,
+                                        sorted(codes)])))
+    digest.update(_to_bytes(contents))
+    return digest.hexdigest()
+
+
+_PARSER_VERSION = []
+
+
+def _parser_version():
+    """Return the installed version of cmakeast, or "unknown"."""
+    if not _PARSER_VERSION:
+        version = "unknown"
+        if metadata is not None:
+            try:
+                version = metadata.version("cmakeast")
+            except metadata.PackageNotFoundError:
+                pass
+
+        _PARSER_VERSION.append(version)
+
+    return _PARSER_VERSION[0]
+
+
+def tree_key(contents):
+    """Return a key for the tree parsed from contents.
+
+    The key changes if the contents, the version of cmakeast or the
+    version of the linter change, but not if the checks do.
+    """
+    digest = hashlib.sha1()
+    digest.update(_to_bytes(json.dumps(["tree",
+                                        __version__,
+                                        _parser_version()])))
+    digest.update(_to_bytes(contents))
+    return digest.hexdigest()
+
+
+def contents_digest(contents):
+    """Return a digest of contents, to pass to check_key."""
+    return hashlib.sha1(_to_bytes(contents)).hexdigest()
+
+
+def check_key(digest, code, options):
+    """Return a key for the result of check code on some contents.
+
+    digest is the contents_digest of the contents and options is a dict
+    of everything else the result depends on, such as the options the
+    check accepts.
+    """
+    return hashlib.sha1(_to_bytes(json.dumps([__version__,
+                                              code,
+                                              sorted(options.items()),
+                                              digest]))).hexdigest()
+
+
+def serialize_errors(errors):
+    """Serialize a list of (code, LinterFailure) tuples to bytes."""
+    return _to_bytes(json.dumps([[code,
+                                  error.description,
+                                  error.line,
+                                  error.replacement]
+                                 for code, error in errors]))
+
+
+def deserialize_errors(data):
+    """Deserialize bytes from serialize_errors to a list of errors.
+
+    Raises ValueError if data was not written by serialize_errors.
+    """
+    try:
+        return [(code, LinterFailure(description, line, replacement))
+                for code, description, line, replacement
+                in json.loads(data.decode("utf-8"))]
+    except (TypeError, ValueError) as error:
+        raise ValueError("Bad cached errors: {0}".format(str(error)))
+
+
+_SIZE_SUFFIXES = {
+    "K": 1024,
+    "M": 1024 ** 2,
+    "G": 1024 ** 3
+}
+
+
+def parse_size(size):
+    """Parse a size in bytes with an optional K, M or G suffix."""
+    multiplier = _SIZE_SUFFIXES.get(size[-1:].upper(), None)
+    if multiplier is None:
+        return int(size)
+
+    return int(size[:-1]) * multiplier
+
+
+_IndexRecord = struct.Struct("<20sQIQ")
+
+# Written before each value in the data file, with its key and checksum
+_ValueHeader = struct.Struct("<20sI")
+
+
+def _checksum(value):
+    """Return the checksum of value stored in its _ValueHeader."""
+    return zlib.crc32(value) & 0xffffffff
+
+
+@contextmanager
+def _file_locked(lock_file, operation):
+    """Hold an advisory lock on lock_file, where they are supported."""
+    if fcntl is None:
+        yield
+        return
+
+    fcntl.flock(lock_file.fileno(), operation)
+    try:
+        yield
+    finally:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+class _Entry(object):  # suppress(too-few-public-methods)
+    """Location of a value in the data file and when it was last used."""
+
+    __slots__ = ("offset", "length", "last_used")
+
+    def __init__(self, offset, length, last_used):
+        """Initialize members."""
+        super(_Entry, self).__init__()
+        self.offset = offset
+        self.length = length
+        self.last_used = last_used
+
+
+def _makedirs(directory):
+    """Create directory if it does not exist already."""
+    try:
+        os.makedirs(directory)
+    except OSError as error:
+        if error.errno != errno.EEXIST:
+            raise
+
+
+def _replace(source, destination):
+    """Move source over destination, even if it exists."""
+    # os.rename does not overwrite existing files on Windows
+    getattr(os, "replace", os.rename)(source, destination)
+
+
+class CacheStore(object):
+    """A cache of values in one append-only data file and one index.
+
+    The data file has values one after another, each after a header with
+    its key and a checksum. The index is a log of fixed-size records of
+    (key, offset, length, last used), where later records for a key
+    replace earlier ones. The index is read on first use, after which
+    each lookup is a dictionary lookup and a single read from the data
+    file. Compaction keeps the index at most twice as long as the number
+    of values in the store.
+
+    When the store is closed, the last used time of every value used is
+    appended to the index. If the data file is larger than max_size,
+    the least recently used values are evicted by compacting the store.
+
+    Keys are hexadecimal SHA1 digests, such as those from check_key. The
+    store is safe to use from multiple threads. Several processes may
+    use it at once, where advisory file locks are supported, since
+    writes and compaction hold a lock on a lock file. Values which were
+    moved by another process are found by their header not matching and
+    treated as not stored.
+    """
+
+    def __init__(self, directory, name, max_size=None):
+        """Open store called name in directory, creating it if needed."""
+        super(CacheStore, self).__init__()
+        _makedirs(directory)
+
+        self._data_path = os.path.join(directory, name + ".data")
+        self._index_path = os.path.join(directory, name + ".index")
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = None
+        self._used = set()
+        self._index_records = 0
+        self._tick = 1
+        self._lock_file = open(os.path.join(directory, name + ".lock"), "a")
+        self._data = open(self._data_path, "ab+")
+
+    def _read_index(self):
+        """Return a dict of keys to _Entry for records in the index."""
+        entries = dict()
+        self._index_records = 0
+        try:
+            with open(self._index_path, "rb") as index_file:
+                index = index_file.read()
+        except (IOError, OSError):
+            return entries
+
+        # Ignore a partially written record at the end of the index
+        record_size = _IndexRecord.size
+        usable = len(index) - (len(index) % record_size)
+        for position in range(0, usable, record_size):
+            key, offset, length, last_used = _IndexRecord.unpack_from(
+                index,
+                position
+            )
+            entries[key] = _Entry(offset, length, last_used)
+            self._index_records += 1
+
+        return entries
+
+    def _load_index(self):
+        """Load the index, if it has not been loaded yet."""
+        if self._entries is not None:
+            return
+
+        with _file_locked(self._lock_file, fcntl and fcntl.LOCK_SH):
+            self._entries = self._read_index()
+
+        self._tick = max([e.last_used for e in self._entries.values()] +
+                         [0]) + 1
+
+    def _replaced(self):
+        """Return true if another process replaced the data file."""
+        try:
+            on_disk = os.stat(self._data_path)
+        except OSError:
+            return True
+
+        opened = os.fstat(self._data.fileno())
+        return (on_disk.st_ino != opened.st_ino or
+                on_disk.st_dev != opened.st_dev)
+
+    def _sync(self):
+        """Reopen the store if another process compacted it.
+
+        This must be called with the lock file held exclusively. Values
+        used or put since the store was compacted are copied from the
+        old data file to the new one, since they are not in the index.
+        """
+        if not self._replaced():
+            return
+
+        old_data = self._data
+        self._data = open(self._data_path, "ab+")
+        entries = self._read_index()
+        self._data.seek(0, os.SEEK_END)
+        for key in self._used:
+            entry = self._entries[key]
+            old_data.seek(entry.offset)
+            record = old_data.read(_ValueHeader.size + entry.length)
+            if len(record) == _ValueHeader.size + entry.length:
+                entries[key] = _Entry(self._data.tell(),
+                                      entry.length,
+                                      entry.last_used)
+                self._data.write(record)
+
+        self._data.flush()
+        old_data.close()
+        self._entries = entries
+        self._used &= set(entries.keys())
+
+    def __enter__(self):
+        """Use this store as a context manager."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close this store."""
+        del exc_type
+        del exc_value
+        del traceback
+
+        self.close()
+
+    def size(self):
+        """Return the total size of all values in the store."""
+        with self._lock:
+            self._load_index()
+            return sum([e.length for e in self._entries.values()])
+
+    def get(self, key):
+        """Return value stored for key, or None if not stored."""
+        binary_key = binascii.unhexlify(key)
+
+        with self._lock:
+            self._load_index()
+            try:
+                entry = self._entries[binary_key]
+            except KeyError:
+                return None
+
+            self._data.seek(entry.offset)
+            header = self._data.read(_ValueHeader.size)
+            value = self._data.read(entry.length)
+            if (len(header) != _ValueHeader.size or
+                    len(value) != entry.length or
+                    _ValueHeader.unpack(header) != (binary_key,
+                                                    _checksum(value))):
+                return None
+
+            entry.last_used = self._tick
+            self._used.add(binary_key)
+            return value
+
+    def put(self, key, value):
+        """Store value for key."""
+        binary_key = binascii.unhexlify(key)
+
+        with self._lock:
+            self._load_index()
+            with _file_locked(self._lock_file, fcntl and fcntl.LOCK_EX):
+                self._sync()
+                self._data.seek(0, os.SEEK_END)
+                offset = self._data.tell()
+                self._data.write(_ValueHeader.pack(binary_key,
+                                                   _checksum(value)))
+                self._data.write(value)
+
+                # Flush while holding the lock, so that the next writer
+                # finds the end of the data file after this value
+                self._data.flush()
+
+            self._entries[binary_key] = _Entry(offset,
+                                               len(value),
+                                               self._tick)
+            self._used.add(binary_key)
+
+    def _append_used_to_index(self):
+        """Append a record for each value used to the index."""
+        with open(self._index_path, "ab") as index_file:
+            for key in self._used:
+                entry = self._entries[key]
+                index_file.write(_IndexRecord.pack(key,
+                                                   entry.offset,
+                                                   entry.length,
+                                                   entry.last_used))
+                self._index_records += 1
+
+        self._used = set()
+
+    def _needs_compaction(self):
+        """Return true if the store is too big or has too much garbage."""
+        live_size = sum([_ValueHeader.size + e.length
+                         for e in self._entries.values()])
+        self._data.seek(0, os.SEEK_END)
+
+        if (self._max_size is not None and
+                sum([e.length for e in self._entries.values()]) >
+                self._max_size):
+            return True
+
+        # Compact if more than half of the data file or index is garbage
+        return (self._data.tell() > 2 * live_size or
+                self._index_records > 2 * len(self._entries))
+
+    def compact(self):
+        """Evict values over max_size and drop unused space in the store.
+
+        The least recently used values are evicted first.
+        """
+        with self._lock:
+            self._load_index()
+            with _file_locked(self._lock_file, fcntl and fcntl.LOCK_EX):
+                self._sync()
+                self._append_used_to_index()
+                self._compact()
+
+    def _compact(self):
+        """Rewrite the data file and index with only live values.
+
+        This must be called with the lock file held exclusively. The
+        index is read again first, so that values other processes stored
+        are kept.
+        """
+        self._entries = self._read_index()
+        by_recent_use = sorted(self._entries.items(),
+                               key=lambda kv: (kv[1].last_used,
+                                               kv[1].offset),
+                               reverse=True)
+        kept = []
+        kept_size = 0
+        for key, entry in by_recent_use:
+            if (self._max_size is not None and
+                    kept_size + entry.length > self._max_size):
+                continue
+
+            kept.append((key, entry))
+            kept_size += entry.length
+
+        # Keep values in their existing order, which means the data
+        # file is read from start to end.
+        kept.sort(key=lambda kv: kv[1].offset)
+
+        directory = os.path.dirname(self._data_path)
+        data_handle, data_path = tempfile.mkstemp(dir=directory)
+        index_handle, index_path = tempfile.mkstemp(dir=directory)
+        entries = dict()
+
+        with os.fdopen(data_handle, "wb") as data_file:
+            with os.fdopen(index_handle, "wb") as index_file:
+                for key, entry in kept:
+                    self._data.seek(entry.offset)
+                    record = self._data.read(_ValueHeader.size +
+                                             entry.length)
+                    header = record[:_ValueHeader.size]
+                    value = record[_ValueHeader.size:]
+
+                    # Drop values which do not match their index record
+                    if (len(record) != _ValueHeader.size + entry.length or
+                            _ValueHeader.unpack(header) != (key,
+                                                            _checksum(value))):
+                        continue
+
+                    offset = data_file.tell()
+                    data_file.write(record)
+                    index_file.write(_IndexRecord.pack(key,
+                                                       offset,
+                                                       entry.length,
+                                                       entry.last_used))
+                    entries[key] = _Entry(offset,
+                                          entry.length,
+                                          entry.last_used)
+
+        self._data.close()
+        _replace(data_path, self._data_path)
+        _replace(index_path, self._index_path)
+
+        self._data = open(self._data_path, "ab+")
+        self._entries = entries
+        self._index_records = len(entries)
+        self._used = set()
+
+    def close(self):
+        """Record which values were used and evict if over max_size."""
+        with self._lock:
+            if self._data is None:
+                return
+
+            if self._entries is not None:
+                with _file_locked(self._lock_file,
+                                  fcntl and fcntl.LOCK_EX):
+                    self._sync()
+                    self._append_used_to_index()
+
+                    if self._needs_compaction():
+                        self._compact()
+
+            self._data.close()
+            self._data = None
+            self._lock_file.close()
+
+
+class MemoryStore(object):
+    """A cache of values in memory, with the same interface as CacheStore.
+
+    At most max_entries values are kept. The least recently used values
+    are evicted first. The store is safe to use from multiple threads.
+    """
+
+    def __init__(self, max_entries=4096):
+        """Initialize an empty store."""
+        super(MemoryStore, self).__init__()
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._values = OrderedDict()
+
+    def __enter__(self):
+        """Use this store as a context manager."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close this store."""
+        del exc_type
+        del exc_value
+        del traceback
+
+        self.close()
+
+    def size(self):
+        """Return the total size of all values in the store."""
+        with self._lock:
+            return sum([len(v) for v in self._values.values()])
+
+    def get(self, key):
+        """Return value stored for key, or None if not stored."""
+        with self._lock:
+            try:
+                value = self._values.pop(key)
+            except KeyError:
+                return None
+
+            self._values[key] = value
+            return value
+
+    def put(self, key, value):
+        """Store value for key, evicting the least recently used values."""
+        with self._lock:
+            self._values.pop(key, None)
+            self._values[key] = value
+            while len(self._values) > self._max_entries:
+                self._values.popitem(last=False)
+
+    def compact(self):
+        """Do nothing, since there is no unused space in memory."""
+
+    def close(self):
+        """Do nothing, so that the store can be used again."""
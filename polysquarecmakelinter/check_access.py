@@ -5,20 +5,35 @@
 # See /LICENCE.md for Copyright information
 """Linter checks for access rights."""
 
+from collections import namedtuple
+
 from polysquarecmakelinter import find_all
-from polysquarecmakelinter import find_variables_in_scopes
+from polysquarecmakelinter import util
 
 from polysquarecmakelinter.types import LinterFailure
 
+# Summary of private calls and the names of private definitions.
+PrivateCalls = namedtuple("PrivateCalls", "calls definitions")
+
+
+def summarize_private_calls(context):
+    """Summarize private calls and definitions."""
+    calls, defs = context.private_calls_and_definitions
+    return PrivateCalls([(name, line)
+                         for (name, lines) in calls.items()
+                         for line in lines],
+                        set(defs.keys()))
+
 
-def only_use_own_privates(abstract_syntax_tree):
+def only_use_own_privates(summaries):
     """Check that all private definitions used are defined here."""
-    calls, defs = find_all.private_calls_and_definitions(abstract_syntax_tree)
+    defs = set().union(*[s.definitions for s in summaries])
+    calls = util.group_lines([c for s in summaries for c in s.calls])
 
     errors = []
 
     for call, info in calls.items():
-        if call not in defs.keys():
+        if call not in defs:
             for line in info:
                 msg = "Used external private definition {0}".format(call)
                 errors.append(LinterFailure(msg, line))
@@ -27,18 +42,20 @@ def only_use_own_privates(abstract_syntax_tree):
 
 
 def _find_violating_priv_uses(variable, current_scope):
-    """Generate a list of uses of private variables not in this module."""
+    """Generate a list of uses of private variables not set in scopes.
+
+    The global scope is not searched, since it is shared between all
+    toplevel statements.
+    """
     for use in find_all.variables_used_in_expr(variable.node):
         if use.startswith("_"):
             # Used a private, check if it was set
             private_var_was_set = False
 
             traverse_scope = current_scope
-            while traverse_scope is not None:
+            while traverse_scope.parent is not None:
                 for set_var in traverse_scope.set_vars:
-                    if (set_var.node.contents == use and
-                            (set_var.node.line,
-                             set_var.node.col) != variable):
+                    if set_var.node.contents == use:
                         private_var_was_set = True
                         break
 
@@ -48,38 +65,72 @@ def _find_violating_priv_uses(variable, current_scope):
                 yield (use, variable.node.line)
 
 
-def only_use_own_priv_vars(ast):
-    """Check that all private variables used are defined here."""
-    used_privs = []
+# Summary of private variables used and not set in any scope other than
+# the global scope, in subscopes of the global scope and in the global
+# scope itself, the names of variables set in the global scope and the
+# names of private definitions.
+PrivateVariableUses = namedtuple("PrivateVariableUses",
+                                 "nested toplevel global_set definitions")
 
-    global_set_vars = find_variables_in_scopes.set_in_tree(ast)
-    global_used_vars = find_variables_in_scopes.used_in_tree(ast)
 
-    _, global_definitions = find_all.private_calls_and_definitions(ast)
+def summarize_private_variable_uses(context):
+    """Summarize private variables used but not set in their scope."""
+    nested = []
 
-    # The big assumption here is that the "scopes" structure in both
-    # trees are the same
-    def _scope_visitor(set_vars_scope, used_vars_scope):
-        """Visit scope's set vars and used vars.
+    global_set_vars = context.set_scopes
+    global_used_vars = context.used_scopes
 
-        If a var was private and used, but not set in this scope or any
-        parents, then report an error
-        """
+    _, global_definitions = context.private_calls_and_definitions
+
+    # The big assumption here is that the "scopes" structure in both
+    # trees are the same. Scopes are visited in post-order, so that uses
+    # in subscopes come before uses in the scope itself, with an explicit
+    # stack so that deeply nested scopes cannot exhaust the stack. The
+    # uses in each scope are found once all of its subscopes are done.
+    toplevel = []
+    stack = [(global_set_vars, global_used_vars, False)]
+    while stack:
+        set_vars_scope, used_vars_scope, subscopes_done = stack.pop()
         assert len(set_vars_scope.scopes) == len(used_vars_scope.scopes)
 
-        for index in range(0, len(set_vars_scope.scopes)):
-            _scope_visitor(set_vars_scope.scopes[index],
-                           used_vars_scope.scopes[index])
+        if not subscopes_done:
+            stack.append((set_vars_scope, used_vars_scope, True))
+            stack.extend([(s, u, False) for (s, u)
+                          in reversed(list(zip(set_vars_scope.scopes,
+                                               used_vars_scope.scopes)))])
+            continue
+
+        # If a var was private and used, but not set in this scope or any
+        # parents, then it is a violating use
+        if set_vars_scope is global_set_vars:
+            used_privs = toplevel
+        else:
+            used_privs = nested
 
         for variable in used_vars_scope.used_vars:
             used_privs.extend(list(_find_violating_priv_uses(variable,
                                                              set_vars_scope)))
 
-    _scope_visitor(global_set_vars, global_used_vars)
+    return PrivateVariableUses(nested,
+                               toplevel,
+                               set([v.node.contents
+                                    for v in global_set_vars.set_vars]),
+                               set(global_definitions.keys()))
+
+
+def only_use_own_priv_vars(summaries):
+    """Check that all private variables used are defined here."""
+    global_set = set().union(*[s.global_set for s in summaries])
+    definitions = set().union(*[s.definitions for s in summaries])
+
+    # Uses in subscopes are reported before uses in the global scope
+    used_privs = ([u for s in summaries for u in s.nested] +
+                  [u for s in summaries for u in s.toplevel])
 
     # Filter out definitions of private functions of the same name
     # as functions can be used as variables.
-    used_privs = [up for up in used_privs if up[0] not in global_definitions]
+    used_privs = [up for up in used_privs
+                  if up[0] not in global_set and up[0] not in definitions]
 
     err_msg = "Referenced external private variable {0}"
     return [LinterFailure(err_msg.format(u[0]), u[1]) for u in used_privs]
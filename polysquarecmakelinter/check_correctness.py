@@ -9,8 +9,6 @@ import re
 
 from collections import namedtuple
 
-from cmakeast import ast_visitor
-
 from cmakeast.ast import WordType
 
 from polysquarecmakelinter import util
@@ -42,8 +40,9 @@ _ALWAYS_QUOTE_MATCHERS_INT = (ALWAYS_QUOTE_VARIABLES_CONTAINING +
                                             re.compile(r"\${CMAKE_COMMAND}"))])
 
 
-def path_variables_quoted(contents, abstract_syntax_tree):
+def path_variables_quoted(context):
     """Check that each variable mutated is capitalized."""
+    contents = context.contents
     errors = []
 
     def _word_visitor(name, node, depth):
@@ -77,6 +76,6 @@ def path_variables_quoted(contents, abstract_syntax_tree):
                     errors.append(_generate_error(node))
                     return
 
-    ast_visitor.recurse(abstract_syntax_tree, word=_word_visitor)
+    context.subscribe(word=_word_visitor)
 
     return errors
@@ -5,20 +5,17 @@
 # See /LICENCE.md for Copyright information
 """Linter checks for script structure."""
 
-from cmakeast import ast_visitor
-
 from polysquarecmakelinter import util
 
 from polysquarecmakelinter.types import LinterFailure
 
 
-def definitions_namespaced(contents, abstract_syntax_tree, **kwargs):
+def definitions_namespaced(context, namespace=None):
     """Check that function and macro definitions are namespaced."""
+    contents = context.contents
     errors = []
 
-    try:
-        namespace = kwargs["namespace"]
-    except KeyError:
+    if namespace is None:
         return errors
 
     def _definition_handler(name, node, depth):
@@ -45,8 +42,7 @@ def definitions_namespaced(contents, abstract_syntax_tree, **kwargs):
 
             errors.append(LinterFailure(msg, node.line, replacement))
 
-    ast_visitor.recurse(abstract_syntax_tree,
-                        function_def=_definition_handler,
-                        macro_def=_definition_handler)
+    context.subscribe(function_def=_definition_handler,
+                      macro_def=_definition_handler)
 
     return errors
@@ -9,30 +9,23 @@ import re
 
 from collections import namedtuple
 
-from cmakeast import ast_visitor
-
 from cmakeast.ast import WordType
 
 from polysquarecmakelinter import find_set_variables
 from polysquarecmakelinter import ignore
+from polysquarecmakelinter import ir
 from polysquarecmakelinter import util
 
+from polysquarecmakelinter.ir import Kind
 from polysquarecmakelinter.types import LinterFailure
 
 _RE_DOUBLE_OUTER_QUOTES = re.compile("^\".*\"$")
 _RE_IS_DEFINITION = re.compile(r"function|macro")
 
-_RE_HEADERBODY_LIKE = re.compile(r"WhileStatement|"
-                                 "ForeachStatement|"
-                                 "FunctionDefinition|"
-                                 "MacroDefinition")
-_RE_FUNCTION_CALL = re.compile(r"FunctionCall")
-_RE_IF_BLOCK = re.compile(r"IfBlock")
-_RE_TOPLEVEL = re.compile(r"ToplevelBody")
-
 
-def space_before_call(contents, abstract_syntax_tree):
+def space_before_call(context):
     """Check that each function call is preceded by a single space."""
+    contents = context.contents
     errors = []
 
     def _call_handler(name, node):
@@ -62,14 +55,14 @@ def space_before_call(contents, abstract_syntax_tree):
                                             " ")
             errors.append(LinterFailure(msg, node.line, replacement))
 
-    ast_visitor.recurse(abstract_syntax_tree,
-                        function_call=ignore.visitor_depth(_call_handler))
+    context.subscribe(function_call=ignore.visitor_depth(_call_handler))
 
     return errors
 
 
-def lowercase_functions(contents, abstract_syntax_tree):
+def lowercase_functions(context):
     """Check that function / macro usage is all lowercase."""
+    contents = context.contents
     errors = []
 
     def _call_handler(name, node):
@@ -103,16 +96,16 @@ def lowercase_functions(contents, abstract_syntax_tree):
                                         definition_name_word.line,
                                         replacement))
 
-    ast_visitor.recurse(abstract_syntax_tree,
-                        function_call=ignore.visitor_depth(_call_handler),
-                        function_def=ignore.visitor_depth(_definition_handler),
-                        macro_def=ignore.visitor_depth(_definition_handler))
+    context.subscribe(function_call=ignore.visitor_depth(_call_handler),
+                      function_def=ignore.visitor_depth(_definition_handler),
+                      macro_def=ignore.visitor_depth(_definition_handler))
 
     return errors
 
 
-def uppercase_arguments(contents, abstract_syntax_tree):
+def uppercase_arguments(context):
     """Check that arguments to definitions are all uppercase."""
+    contents = context.contents
     errors = []
 
     def _definition_visitor(name, node):
@@ -133,36 +126,54 @@ def uppercase_arguments(contents, abstract_syntax_tree):
                                                 arg.contents.upper())
                 errors.append(LinterFailure(msg, arg.line, replacement))
 
-    ast_visitor.recurse(abstract_syntax_tree,
-                        function_def=ignore.visitor_depth(_definition_visitor),
-                        macro_def=ignore.visitor_depth(_definition_visitor))
+    definition_visitor = ignore.visitor_depth(_definition_visitor)
+    context.subscribe(function_def=definition_visitor,
+                      macro_def=definition_visitor)
 
     return errors
 
 
-def set_variables_capitalized(contents, abstract_syntax_tree):
+def first_violation(summaries):
+    """Return only the first error in summaries, which are lists of errors."""
+    for summary in summaries:
+        if summary:
+            return summary[:1]
+
+    return []
+
+
+def set_variables_capitalized(context):
     """Check that each variable mutated is capitalized."""
+    contents = context.contents
     errors = []
 
-    variables = find_set_variables.in_tree(abstract_syntax_tree)
-    for evaluate in variables:
-
-        evaluate_upper = evaluate.contents.upper()
-
-        # Argument should be either String or Variable and a transformation
-        # to uppercase should have no effect
-        if (util.is_word_sink_variable(evaluate.type) and
-                evaluate_upper != evaluate.contents):
-            desc = "{0} must be uppercase".format(evaluate.contents)
-            line = evaluate.line - 1
-            replacement = util.replace_word(contents[line],
-                                            evaluate.col - 1,
-                                            evaluate.contents,
-                                            evaluate_upper)
-            errors.append(LinterFailure(desc,
-                                        evaluate.line,
-                                        replacement))
-            break
+    def _call_visitor(name, node):
+        """Visit all function calls."""
+        assert name == "FunctionCall"
+
+        # Every violation is kept, so that first_violation can report the
+        # first one which is not suppressed. Which statements are visited
+        # depends on which other checks are enabled, so stopping at the
+        # first violation found would make the result depend on them.
+        for evaluate in find_set_variables.all_by_function_call(node):
+            evaluate_upper = evaluate.contents.upper()
+
+            # Argument should be either String or Variable and a
+            # transformation to uppercase should have no effect
+            if (util.is_word_sink_variable(evaluate.type) and
+                    evaluate_upper != evaluate.contents):
+                desc = "{0} must be uppercase".format(evaluate.contents)
+                line = evaluate.line - 1
+                replacement = util.replace_word(contents[line],
+                                                evaluate.col - 1,
+                                                evaluate.contents,
+                                                evaluate_upper)
+                errors.append(LinterFailure(desc,
+                                            evaluate.line,
+                                            replacement))
+                return
+
+    context.subscribe(function_call=ignore.visitor_depth(_call_visitor))
 
     return errors
 
@@ -279,7 +290,7 @@ def _check_alignment(arg,
     return align, None
 
 
-def func_args_aligned(contents, abstract_syntax_tree):
+def func_args_aligned(context):
     """Check that function arguments are aligned.
 
     Function arguments must be aligned either to the same line or
@@ -288,6 +299,7 @@ def func_args_aligned(contents, abstract_syntax_tree):
     align after the second argument, (eg the first argument to the defined
     function or macro)
     """
+    contents = context.contents
     errors = []
 
     def _call_visitor(name, node):
@@ -332,13 +344,13 @@ def func_args_aligned(contents, abstract_syntax_tree):
 
         errors.extend([e for e in _align_violations(node) if e is not None])
 
-    ast_visitor.recurse(abstract_syntax_tree,
-                        function_call=ignore.visitor_depth(_call_visitor))
+    context.subscribe(function_call=ignore.visitor_depth(_call_visitor))
     return errors
 
 
-def double_outer_quotes(contents, abstract_syntax_tree):
+def double_outer_quotes(context):
     """Check that all outer quotes are double quotes."""
+    contents = context.contents
     errors = []
 
     def _word_visitor(name, node):
@@ -355,75 +367,52 @@ def double_outer_quotes(contents, abstract_syntax_tree):
                                                 replacement_word)
                 errors.append(LinterFailure(msg, node.line, replacement))
 
-    ast_visitor.recurse(abstract_syntax_tree,
-                        word=ignore.visitor_depth(_word_visitor))
+    context.subscribe(word=ignore.visitor_depth(_word_visitor))
 
     return errors
 
 
-# The mccabe checker complains here but that's because it contains lots
-# of nested functions. There's not much we can do for that.
-def _visit_with_flat_if_depth(abstract_syntax_tree,  # NOQA
-                              function_visitor):
-    """Visit function calls with IfBlock nodes flattened."""
-    def _visit_header_body_block(node, depth):
-        """Handle header/body like statements."""
-        function_visitor(node.header, depth)
-
-        for sub in node.body:
-            _node_dispatch(sub, depth + 1)
+def _statement_calls(abstract_syntax_tree):
+    """Generate calls which are statements, headers or footers, in order.
 
-        if getattr(node, "footer", None) is not None:
-            function_visitor(node.footer, depth)
-
-    def _visit_if_block(node, depth):
-        """Handle if blocks."""
-        substatements = ([node.if_statement] +
-                         node.elseif_statements +
-                         [node.else_statement])
-
-        for substatement in substatements:
-            if substatement:
-                _visit_header_body_block(substatement, depth)
-
-        function_visitor(node.footer, depth)
-
-    def _visit_toplevel(node, depth):
-        """Handle toplevel blocks."""
-        assert depth == 0
-
-        for statement in node.statements:
-            _node_dispatch(statement, depth)
-
-    indent_node_dispatch = [
-        (_RE_HEADERBODY_LIKE, _visit_header_body_block),
-        (_RE_IF_BLOCK, _visit_if_block),
-        (_RE_FUNCTION_CALL, function_visitor),
-        (_RE_TOPLEVEL, _visit_toplevel)
-    ]
-
-    def _node_dispatch(node, depth):
-        """Dispatch per-node, handling depth like actual indent depth."""
-        for regex, handler in indent_node_dispatch:
-            if regex.match(node.__class__.__name__):
-                handler(node, depth)
-
-    _node_dispatch(abstract_syntax_tree, 0)
-
-
-def calls_indented_correctly(contents, abstract_syntax_tree, **kwargs):
+    Nodes are visited with an explicit stack rather than by recursion,
+    so that deeply nested blocks cannot exhaust the stack.
+    """
+    stack = [abstract_syntax_tree]
+    while stack:
+        node = stack.pop()
+        kind = node.kind
+
+        if kind == Kind.FunctionCall:
+            yield node
+        elif kind in ir.BLOCK_KINDS:
+            if node.footer is not None:
+                stack.append(node.footer)
+            stack.extend(reversed(node.body))
+            stack.append(node.header)
+        elif kind == Kind.IfBlock:
+            stack.append(node.footer)
+            for clause in reversed([node.if_statement] +
+                                   node.elseif_statements +
+                                   [node.else_statement]):
+                if clause is not None:
+                    stack.extend(reversed(clause.body))
+                    stack.append(clause.header)
+        elif kind == Kind.ToplevelBody:
+            stack.extend(reversed(node.statements))
+
+
+def calls_indented_correctly(context, indent=None):
     """Check that all calls to functions are indented at the correct level."""
+    contents = context.contents
     errors = []
 
-    try:
-        indent = kwargs["indent"]
-    except KeyError:
+    if indent is None:
         return errors
 
-    def _visit_function_call(node, depth):
-        """Handle function calls."""
+    for node in _statement_calls(context.tree):
         col = node.col
-        expected = 1 + (depth * indent)
+        expected = 1 + (node.depth * indent)
         if node.col != expected:
             delta = expected - node.col
             msg = "Expected {0} to be on column {1}".format(node.name,
@@ -434,6 +423,4 @@ def calls_indented_correctly(contents, abstract_syntax_tree, **kwargs):
                                             " " * max(0, delta))
             errors.append(LinterFailure(msg, node.line, replacement))
 
-    _visit_with_flat_if_depth(abstract_syntax_tree, _visit_function_call)
-
     return errors
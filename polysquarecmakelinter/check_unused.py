@@ -5,84 +5,78 @@
 # See /LICENCE.md for Copyright information
 """Linter checks for Linter checks for unused definitions."""
 
-import re
+from collections import namedtuple
 
 from cmakeast.ast import WordType
 
-from polysquarecmakelinter import find_all
-from polysquarecmakelinter import find_variables_in_scopes
+from polysquarecmakelinter import util
 
 from polysquarecmakelinter.types import LinterFailure
 
-_RE_VARIABLE_USE = re.compile(r"(?<![^\${])[0-9A-Za-z_]+(?![^]}])")
 
+def _variable_used(name, exclude_node, uses):
+    """Check if name is used anywhere in uses other than exclude_node.
 
-def _variable_used_in_scope(name, exclude_node, used_scope):
-    """Check if node was used in used_scope or its subscopes."""
-    def _is_candidate_use(use, exclude_node):
-        """Check if use.node is not node, but also a candidate."""
-        if use.node == exclude_node:
-            return False
-
-        used_vars_in_node = _RE_VARIABLE_USE.findall(use.node.contents)
-        for used_var in used_vars_in_node:
-            if used_var == name:
-                return True
-
-    used_vs = used_scope.used_vars
-    matched_uses = [u for u in used_vs if _is_candidate_use(u, exclude_node)]
-
-    # Found use, done
-    if len(matched_uses):
-        return True
-
-    # Didn't find use - keep going down if possible:
-    for subscope in used_scope.scopes:
-        if _variable_used_in_scope(name, exclude_node, subscope):
+    uses is the index of a scope in AnalysisContext.variable_uses.
+    """
+    for node in uses.get(name, ()):
+        if node != exclude_node:
             return True
 
     return False
 
 
-def vars_in_func_used(abstract_syntax_tree):
+def vars_in_func_used(context):
     """Check that variables defined in a function are used later."""
     errors = []
 
-    set_scopes = find_variables_in_scopes.set_in_tree(abstract_syntax_tree)
-    used_scopes = find_variables_in_scopes.used_in_tree(abstract_syntax_tree)
+    set_scopes = context.set_scopes
+    used_scopes = context.used_scopes
+    variable_uses = context.variable_uses
 
     # Iterate through the set and used variables - making sure that any set
     # variables are used somewhere down the scope chain
-    def _scope_visitor(set_scope, used_scope):
-        """Visit both scopes at the same level."""
-        assert len(set_scope.scopes) == len(used_scope.scopes)
+    def _check_scope(set_scope, used_scope):
+        """Check set vars in a scope, returning false to skip subscopes."""
+        for var in set_scope.set_vars:
+            if var.node.type != WordType.Variable:
+                return False
+
+            if not _variable_used(var.node.contents,
+                                  var.node,
+                                  variable_uses[id(used_scope)]):
+                msg = "Unused local variable {0}".format(var.node.contents)
+                errors.append(LinterFailure(msg, var.node.line))
 
-        # Ignore the global scope
-        if id(set_scopes) != id(set_scope):
-            for var in set_scope.set_vars:
-                if var.node.type != WordType.Variable:
-                    return
+        return True
 
-                if not _variable_used_in_scope(var.node.contents,
-                                               var.node,
-                                               used_scope):
-                    msg = "Unused local variable {0}".format(var.node.contents)
-                    errors.append(LinterFailure(msg, var.node.line))
+    # Both scope trees are visited together in pre-order, with an explicit
+    # stack so that deeply nested scopes cannot exhaust the stack.
+    stack = [(set_scopes, used_scopes)]
+    while stack:
+        set_scope, used_scope = stack.pop()
+        assert len(set_scope.scopes) == len(used_scope.scopes)
 
-        for index in range(0, len(set_scope.scopes)):
-            _scope_visitor(set_scope.scopes[index],
-                           used_scope.scopes[index])
+        # Ignore the global scope
+        if (id(set_scopes) != id(set_scope) and
+                not _check_scope(set_scope, used_scope)):
+            continue
 
-    _scope_visitor(set_scopes, used_scopes)
+        stack.extend(reversed(list(zip(set_scope.scopes,
+                                       used_scope.scopes))))
 
     return errors
 
 
-def private_vars_at_toplevel(abstract_syntax_tree):
-    """Check that private variables defined at the top level are used later."""
-    errors = []
+# Summary of private variables set at the toplevel and the private
+# variables used other than where they were set.
+PrivateVariables = namedtuple("PrivateVariables", "set_at used")
+
 
-    variables_set = find_all.toplevel_set_private_vars(abstract_syntax_tree)
+def summarize_private_vars_at_toplevel(context):
+    """Summarize private variables set at the top level and their uses."""
+    variables_set = context.toplevel_set_private_vars
+    uses = context.variable_uses[id(context.used_scopes)]
 
     def _not_in_variables_set(node):
         """Return false if in variables_set."""
@@ -91,39 +85,62 @@ def private_vars_at_toplevel(abstract_syntax_tree):
         except KeyError:
             return True
 
-    def _starts_with_underscore(name):
-        """Return true if variable name starts with an underscore."""
-        return name.startswith("_")
+    used = set([name for (name, nodes) in uses.items()
+                if (name.startswith("_") and
+                    any([_not_in_variables_set(n) for n in nodes]))])
+
+    return PrivateVariables([(name, line)
+                             for (name, places) in variables_set.items()
+                             for (line, _) in places],
+                            used)
 
-    variables_used = find_all.variables_used_matching(abstract_syntax_tree,
-                                                      _not_in_variables_set,
-                                                      _starts_with_underscore)
 
-    # Check the intersection
-    for var in variables_set.keys():
-        if var not in variables_used.keys():
+def private_vars_at_toplevel(summaries):
+    """Check that private variables defined at the top level are used later."""
+    errors = []
+
+    used = set().union(*[s.used for s in summaries])
+    set_at = util.group_lines([p for s in summaries for p in s.set_at])
+
+    for var, lines in set_at.items():
+        if var not in used:
             msg = "Unused set variable at toplevel {0}".format(var)
-            errors.append(LinterFailure(msg, variables_set[var][0][0]))
+            errors.append(LinterFailure(msg, lines[0]))
 
     return errors
 
 
-def private_definitions_used(abstract_syntax_tree):
-    """Check that all private definitions are used by this module."""
-    calls, defs = find_all.private_calls_and_definitions(abstract_syntax_tree)
+# Summary of private definitions and the names of private calls and all
+# variables used.
+PrivateDefinitions = namedtuple("PrivateDefinitions",
+                                "definitions calls used")
 
-    errors = []
+
+def summarize_private_definitions(context):
+    """Summarize private definitions and what is called and used."""
+    calls, defs = context.private_calls_and_definitions
 
     # There's no scoping of functions defined within other functions, so
     # we search from the root of the tree.
-    global_scope = find_variables_in_scopes.used_in_tree(abstract_syntax_tree)
+    global_uses = context.variable_uses[id(context.used_scopes)]
+
+    return PrivateDefinitions([(name, line)
+                               for (name, lines) in defs.items()
+                               for line in lines],
+                              set(calls.keys()),
+                              set(global_uses.keys()))
+
+
+def private_definitions_used(summaries):
+    """Check that all private definitions are used by this module."""
+    errors = []
+
+    calls = set().union(*[s.calls for s in summaries])
+    used = set().union(*[s.used for s in summaries])
+    defs = util.group_lines([d for s in summaries for d in s.definitions])
 
     for definition, info in defs.items():
-        not_in_function_calls = definition not in calls.keys()
-        not_used_as_variable = not _variable_used_in_scope(definition,
-                                                           None,
-                                                           global_scope)
-        if not_in_function_calls and not_used_as_variable:
+        if definition not in calls and definition not in used:
             for line in info:
                 msg = "Unused private definition {0}".format(definition)
                 errors.append(LinterFailure(msg, line))
@@ -0,0 +1,231 @@
+# /polysquarecmakelinter/daemon.py
+#
+# A long running linter process serving requests over a Unix domain
+# socket, and a thin client for it.
+#
+# Each request is the command line the client was run with and its
+# working directory. The daemon runs the linter with that command line
+# as if it had been run directly, and replies with what was written to
+# stdout and stderr and the exit status, which the client reproduces.
+#
+# Messages are JSON, prefixed with their length as a four byte big
+# endian integer.
+#
+# This module only imports the standard library, so that the client
+# starts without paying for importing the linter.
+#
+# See /LICENCE.md for Copyright information
+"""A long running linter process serving requests over a Unix socket."""
+
+import errno
+
+import json
+
+import os
+
+import socket
+
+import struct
+
+import sys
+
+_LENGTH = struct.Struct(">I")
+
+
+def supported():
+    """Return true if Unix domain sockets are available."""
+    return getattr(socket, "AF_UNIX", None) is not None
+
+
+def strip_option(arguments, option):
+    """Return a tuple of the value of option and arguments without it.
+
+    option is a long option taking one value, given either as a separate
+    argument or after an equals sign. The value is None if option is not
+    in arguments.
+    """
+    value = None
+    rest = []
+    iterator = iter(arguments)
+
+    for argument in iterator:
+        if argument == option:
+            value = next(iterator, None)
+        elif argument.startswith(option + "="):
+            value = argument[len(option) + 1:]
+        else:
+            rest.append(argument)
+
+    return (value, rest)
+
+
+def _send(connection, message):
+    """Send message, a JSON-serializable object, over connection."""
+    data = json.dumps(message).encode("utf-8")
+    connection.sendall(_LENGTH.pack(len(data)) + data)
+
+
+def _receive_exactly(connection, length):
+    """Receive exactly length bytes from connection, or None at EOF."""
+    chunks = []
+    while length:
+        chunk = connection.recv(min(length, 65536))
+        if not chunk:
+            return None
+
+        chunks.append(chunk)
+        length -= len(chunk)
+
+    return b"".join(chunks)
+
+
+def _receive(connection):
+    """Receive a message sent with _send, or None at EOF."""
+    header = _receive_exactly(connection, _LENGTH.size)
+    if header is None:
+        return None
+
+    data = _receive_exactly(connection, _LENGTH.unpack(header)[0])
+    if data is None:
+        return None
+
+    return json.loads(data.decode("utf-8"))
+
+
+def _remove_stale_socket(socket_path):
+    """Remove socket_path if nothing is listening on it any more."""
+    if not os.path.exists(socket_path):
+        return
+
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except socket.error:
+        os.remove(socket_path)
+        return
+    finally:
+        probe.close()
+
+    raise RuntimeError("A daemon is already listening on "
+                       "{0}".format(socket_path))
+
+
+def serve(socket_path, run, ready=None):
+    """Serve requests on socket_path until asked to stop.
+
+    run is called with the arguments and working directory of each
+    request and returns a tuple of exit status, stdout and stderr.
+    Requests are handled one at a time, in the order they arrive. If
+    ready is given, it is called once the socket is listening.
+    """
+    _remove_stale_socket(socket_path)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        server.bind(socket_path)
+        server.listen(64)
+
+        if ready is not None:
+            ready()
+
+        while True:
+            connection = server.accept()[0]
+            try:
+                request = _receive(connection)
+                if request is None:
+                    continue
+
+                if request.get("stop"):
+                    _send(connection, {"status": 0, "stdout": "",
+                                       "stderr": ""})
+                    return 0
+
+                status, stdout, stderr = run(request["arguments"],
+                                             request["cwd"])
+                _send(connection, {"status": status,
+                                   "stdout": stdout,
+                                   "stderr": stderr})
+            except socket.error as error:
+                # The client went away, which should not stop the daemon
+                if error.errno not in (errno.EPIPE, errno.ECONNRESET):
+                    raise
+            finally:
+                connection.close()
+    finally:
+        server.close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def request(socket_path, arguments, stop=False):
+    """Send arguments to the daemon on socket_path and return its reply.
+
+    The reply is a tuple of exit status, stdout and stderr. Raises
+    socket.error if the daemon cannot be reached.
+    """
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(socket_path)
+        _send(connection, {"arguments": arguments,
+                           "cwd": os.getcwd(),
+                           "stop": stop})
+        reply = _receive(connection)
+    finally:
+        connection.close()
+
+    if reply is None:
+        raise socket.error(errno.ECONNRESET,
+                           "Daemon closed the connection")
+
+    return (reply["status"], reply["stdout"], reply["stderr"])
+
+
+def forward(socket_path, arguments, stop=False):
+    """Run arguments on the daemon and reproduce its output.
+
+    Returns the exit status, or None if the daemon could not be reached.
+    """
+    try:
+        status, stdout, stderr = request(socket_path, arguments, stop)
+    except socket.error:
+        return None
+
+    sys.stdout.write(stdout)
+    sys.stderr.write(stderr)
+    return status
+
+
+def client_main(arguments=None):
+    """Entry point for the thin client.
+
+    Takes the same arguments as the linter, and --connect SOCKET. If
+    --connect is not given, the POLYSQUARE_CMAKE_LINTER_SOCKET
+    environment variable is used. If the daemon cannot be reached, lints
+    in this process instead.
+    """
+    if arguments is None:
+        arguments = sys.argv[1:]
+
+    socket_path, rest = strip_option(arguments, "--connect")
+    socket_path = socket_path or os.environ.get("POLYSQUARE_CMAKE_LINTER_"
+                                                "SOCKET")
+
+    stop = "--stop-daemon" in rest
+    if stop:
+        rest.remove("--stop-daemon")
+
+    if socket_path is not None and supported():
+        status = forward(socket_path, rest, stop)
+        if status is not None:
+            return status
+
+    if stop:
+        sys.stderr.write("No daemon to stop\n")
+        return 1
+
+    from polysquarecmakelinter import linter
+    return linter.main(rest)
+
+
+if __name__ == "__main__":
+    sys.exit(client_main())
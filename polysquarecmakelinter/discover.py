@@ -0,0 +1,107 @@
+# /polysquarecmakelinter/discover.py
+#
+# Find the CMake files to lint in directories given on the command line.
+#
+# Directories are walked with os.scandir, which avoids a stat call for
+# each entry on most platforms, and files are generated as they are
+# found, so that linting can start before the walk finishes.
+#
+# See /LICENCE.md for Copyright information
+"""Find the CMake files to lint in directories."""
+
+import fnmatch
+
+import os
+
+try:
+    from os import scandir as _scandir  # suppress(no-name-in-module)
+except ImportError:
+    try:
+        from scandir import scandir as _scandir  # suppress(import-error)
+    except ImportError:
+        _scandir = None  # suppress(invalid-name)
+
+
+def is_cmake_file(name):
+    """Return true if a file called name should be linted."""
+    return name == "CMakeLists.txt" or name.endswith(".cmake")
+
+
+def excluded(relative_path, excludes):
+    """Return true if relative_path matches any glob in excludes.
+
+    Globs are matched against both the whole path, relative to the
+    directory being walked and with forward slashes, and its last
+    component, so "build" excludes any directory called build and
+    "third_party/*" excludes everything directly inside third_party.
+    """
+    name = relative_path.rsplit("/", 1)[-1]
+    for exclude in excludes:
+        if (fnmatch.fnmatchcase(name, exclude) or
+                fnmatch.fnmatchcase(relative_path, exclude)):
+            return True
+
+    return False
+
+
+def _is_real_directory(path):
+    """Return true if path is a directory and not a symbolic link."""
+    return os.path.isdir(path) and not os.path.islink(path)
+
+
+def _entries(directory):
+    """Return a sorted list of (name, is_directory) for directory.
+
+    Symbolic links to directories are not counted as directories, so
+    that the walk cannot loop.
+    """
+    if _scandir is not None:
+        entries = [(e.name, e.is_dir(follow_symlinks=False))
+                   for e in _scandir(directory)]
+    else:
+        entries = [(n, _is_real_directory(os.path.join(directory, n)))
+                   for n in os.listdir(directory)]
+
+    return sorted(entries)
+
+
+def walk(directory, excludes=()):
+    """Generate the paths of CMake files inside directory, recursively.
+
+    Files and directories matching excludes are skipped, and so is
+    everything inside excluded directories. Files are generated in
+    sorted order within each directory, before its subdirectories.
+    """
+    pending = [(directory, "")]
+
+    while pending:
+        path, relative = pending.pop()
+        subdirectories = []
+
+        for name, is_directory in _entries(path):
+            entry_relative = relative + name
+            if excluded(entry_relative, excludes):
+                continue
+
+            if is_directory:
+                subdirectories.append((os.path.join(path, name),
+                                       entry_relative + "/"))
+            elif is_cmake_file(name):
+                yield os.path.join(path, name)
+
+        pending.extend(reversed(subdirectories))
+
+
+def files(paths, excludes=()):
+    """Generate the files to lint for paths given on the command line.
+
+    Directories in paths are walked for CMake files. Other paths are
+    generated as they are, whatever they are called, so that files
+    can always be linted by naming them.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for found in walk(path, excludes):
+                yield found
+        else:
+            yield path
@@ -0,0 +1,152 @@
+# /polysquarecmakelinter/engine.py
+#
+# Single traversal of the AST which dispatches each node to every check
+# that subscribed to its kind.
+#
+# See /LICENCE.md for Copyright information
+"""Single traversal of the AST dispatching nodes to subscribed checks."""
+
+from collections import namedtuple
+
+from polysquarecmakelinter import ir
+
+_NodeInfo = namedtuple("_NodeInfo", "handler single multi")
+
+
+def _node(handler, single=None, multi=None):
+    """Return a _NodeInfo with some elements defaulted."""
+    return _NodeInfo(handler=handler,
+                     single=(single if single else []),
+                     multi=(multi if multi else []))
+
+
+# This mirrors the table in cmakeast.ast_visitor, so that handler names
+# and visiting order are the same as ast_visitor.recurse.
+_NODE_INFO_TABLE = {
+    "ToplevelBody": _node("toplevel", multi=["statements"]),
+    "WhileStatement": _node("while_stmnt", single=["header", "footer"],
+                            multi=["body"]),
+    "ForeachStatement": _node("foreach", single=["header", "footer"],
+                              multi=["body"]),
+    "FunctionDefinition": _node("function_def", single=["header", "footer"],
+                                multi=["body"]),
+    "MacroDefinition": _node("macro_def", single=["header", "footer"],
+                             multi=["body"]),
+    "IfBlock": _node("if_block", single=["if_statement",
+                                         "else_statement",
+                                         "footer"],
+                     multi=["elseif_statements"]),
+    "IfStatement": _node("if_stmnt", single=["header"], multi=["body"]),
+    "ElseIfStatement": _node("elseif_stmnt", single=["header"],
+                             multi=["body"]),
+    "ElseStatement": _node("else_stmnt", single=["header"], multi=["body"]),
+    "FunctionCall": _node("function_call", multi=["arguments"]),
+    "Word": _node("word")
+}
+
+HANDLER_NAMES = frozenset([i.handler for i in _NODE_INFO_TABLE.values()])
+
+# Nodes which can appear as a statement in a body.
+_STATEMENT_NODES = frozenset([
+    "FunctionCall",
+    "IfBlock",
+    "ForeachStatement",
+    "WhileStatement",
+    "FunctionDefinition",
+    "MacroDefinition"
+])
+
+
+class Traversal(object):
+    """A single walk over an AST shared by many checks.
+
+    Checks call subscribe() with the same handler keyword arguments
+    that ast_visitor.recurse takes. When run() is called, the tree is
+    walked exactly once and each node is handed to every handler
+    subscribed to its kind, in the order that the handlers subscribed.
+
+    If skip is given, it is called with each statement before it is
+    visited. If it returns true, neither the statement nor anything
+    inside it is visited.
+
+    The tree is walked as built by ir.build, so handlers are handed
+    ir nodes, and abstract_syntax_tree may be either a cmakeast tree or
+    one which is already built.
+    """
+
+    def __init__(self, abstract_syntax_tree, skip=None):
+        """Initialize with the tree to walk and no subscribers."""
+        super(Traversal, self).__init__()
+        self.tree = ir.build(abstract_syntax_tree)
+        self._handlers = dict()
+        self._skip = skip
+
+    def subscribe(self, **kwargs):
+        """Subscribe handlers to node kinds, eg function_call=handler."""
+        for name, handler in kwargs.items():
+            assert name in HANDLER_NAMES
+            self._handlers.setdefault(name, []).append(handler)
+
+    def run(self):
+        """Walk the tree once, dispatching to all subscribed handlers."""
+        if not self._handlers:
+            return
+
+        # Words have no children, so if nobody is interested in them
+        # there is no need to descend into the arguments of calls.
+        skip_words = "word" not in self._handlers
+        skip = self._skip
+
+        # Indexed by the kind of each node, so that dispatching does not
+        # look up the name of its class. Attributes holding children are
+        # reversed, since children are pushed onto the stack in reverse
+        # so that they are visited in order.
+        dispatch = [None] * len(ir.KIND_NAMES)
+        for node_name, info in _NODE_INFO_TABLE.items():
+            dispatch[ir.KINDS[node_name]] = (
+                node_name,
+                self._handlers.get(info.handler, ()),
+                list(reversed(info.single)),
+                [] if (skip_words and node_name == "FunctionCall")
+                else list(reversed(info.multi)),
+                (skip is not None and node_name in _STATEMENT_NODES)
+            )
+
+        # Nodes are visited with an explicit stack rather than by
+        # recursion, so that deeply nested blocks cannot exhaust the
+        # stack.
+        stack = [(self.tree, 0)]
+        push = stack.append
+        pop = stack.pop
+        while stack:
+            node, depth = pop()
+            node_name, handlers, single, multi, check_skip = dispatch[
+                node.kind
+            ]
+
+            if check_skip and skip(node):
+                continue
+
+            for handler in handlers:
+                handler(node_name, node, depth)
+
+            depth += 1
+            for attribute in multi:
+                stack.extend([(child, depth) for child
+                              in reversed(getattr(node, attribute))])
+
+            for attribute in single:
+                child = getattr(node, attribute)
+                if child is not None:
+                    push((child, depth))
+
+
+def recurse(abstract_syntax_tree, **kwargs):
+    """Walk abstract_syntax_tree once, like cmakeast's ast_visitor.recurse.
+
+    Unlike ast_visitor.recurse, the walk uses an explicit stack, so that
+    deeply nested blocks cannot exhaust the stack.
+    """
+    traversal = Traversal(abstract_syntax_tree)
+    traversal.subscribe(**kwargs)
+    traversal.run()
@@ -7,12 +7,14 @@
 
 import re
 
-from cmakeast import ast_visitor
-
+from polysquarecmakelinter import engine
 from polysquarecmakelinter import find_set_variables
 from polysquarecmakelinter import find_variables_in_scopes
+from polysquarecmakelinter import ir
 from polysquarecmakelinter import util
 
+from polysquarecmakelinter.ir import Kind
+
 _RE_VARIABLE_USE = re.compile(r"(?<![^\${])[0-9A-Za-z_]+(?![^]}])")
 
 
@@ -24,10 +26,8 @@ def _append_line_occurence(tracker, name, line):
     tracker[name].append(line)
 
 
-def calls(abstract_syntax_tree, track_call):
-    """Return a dict of calls mapped to where they occurred."""
-    call_lines = {}
-
+def _call_tracker(call_lines, track_call):
+    """Return a function_call handler recording calls into call_lines."""
     def _call_handler(name, node, depth):
         """Visit all calls in this module."""
         assert name == "FunctionCall"
@@ -37,16 +37,11 @@ def calls(abstract_syntax_tree, track_call):
         if track_call(node):
             _append_line_occurence(call_lines, node.name, node.line)
 
-    ast_visitor.recurse(abstract_syntax_tree,
-                        function_call=_call_handler)
-
-    return call_lines
+    return _call_handler
 
 
-def definitions(abstract_syntax_tree, track_definition):
-    """Return a dict of definitions mapped to where they occurred."""
-    definition_lines = {}
-
+def _definition_tracker(definition_lines, track_definition):
+    """Return a definition handler recording into definition_lines."""
     def _definition_handler(name, node, depth):
         """Visit all definitions."""
         assert name == "FunctionDefinition" or name == "MacroDefinition"
@@ -59,23 +54,53 @@ def definitions(abstract_syntax_tree, track_definition):
                                    node.header.arguments[0].contents,
                                    node.line)
 
-    ast_visitor.recurse(abstract_syntax_tree,
-                        function_def=_definition_handler,
-                        macro_def=_definition_handler)
+    return _definition_handler
+
+
+def calls(abstract_syntax_tree, track_call):
+    """Return a dict of calls mapped to where they occurred."""
+    call_lines = {}
+
+    engine.recurse(abstract_syntax_tree,
+                   function_call=_call_tracker(call_lines, track_call))
+
+    return call_lines
+
+
+def definitions(abstract_syntax_tree, track_definition):
+    """Return a dict of definitions mapped to where they occurred."""
+    definition_lines = {}
+    definition_handler = _definition_tracker(definition_lines,
+                                             track_definition)
+
+    engine.recurse(abstract_syntax_tree,
+                   function_def=definition_handler,
+                   macro_def=definition_handler)
 
     return definition_lines
 
 
 def private_calls_and_definitions(abstract_syntax_tree):
     """Return a tuple of all private calls and definitions."""
+    def _call_is_private(node):
+        """Check if a call is private."""
+        return node.name.startswith("_")
+
     def _definition_is_private(node):
         """Check if a definition is private."""
         return node.header.arguments[0].contents.startswith("_")
 
-    private_calls = calls(abstract_syntax_tree,
-                          lambda x: x.name.startswith("_"))
-    private_defs = definitions(abstract_syntax_tree,
-                               _definition_is_private)
+    private_calls = {}
+    private_defs = {}
+    definition_handler = _definition_tracker(private_defs,
+                                             _definition_is_private)
+
+    # Both are found in the same walk over the tree
+    engine.recurse(abstract_syntax_tree,
+                   function_call=_call_tracker(private_calls,
+                                               _call_is_private),
+                   function_def=definition_handler,
+                   macro_def=definition_handler)
 
     return (private_calls, private_defs)
 
@@ -95,18 +120,15 @@ def toplevel_set_private_vars(abstract_syntax_tree):
     """
     set_variables = {}
 
-    for statement in abstract_syntax_tree.statements:
+    for statement in ir.build(abstract_syntax_tree).statements:
 
         # We only want bare function calls, not definitions or the like
-        if statement.__class__.__name__ != "FunctionCall":
+        if statement.kind != Kind.FunctionCall:
             continue
 
         # Scan the statement for any variables set and append
-        set_variable = find_set_variables.by_function_call(statement)
-
-        if set_variable is not None:
-            if (set_variable and
-                    util.is_word_sink_variable(set_variable.type) and
+        for set_variable in find_set_variables.all_by_function_call(statement):
+            if (util.is_word_sink_variable(set_variable.type) and
                     set_variable.contents.startswith("_")):
                 _append_to_set_variables(set_variable.contents,
                                          set_variable,
@@ -117,7 +139,7 @@ def toplevel_set_private_vars(abstract_syntax_tree):
 
 def variables_used_in_expr(word_node):
     """Return a set of variable names "used" by a node."""
-    assert word_node.__class__.__name__ == "Word"
+    assert word_node.kind == Kind.Word
 
     used_variables_set = {}
     uses = _RE_VARIABLE_USE.findall(word_node.contents)
@@ -133,16 +155,28 @@ def variables_used_in_expr(word_node):
 
 def variables_used_matching(abstract_syntax_tree,
                             node_matcher,
-                            name_matcher):
-    """Return a set of variable names used whose nodes satisfy matchers."""
-    variables_used = {}
+                            name_matcher,
+                            used_scopes=None):
+    """Return a set of variable names used whose nodes satisfy matchers.
 
-    global_scope = find_variables_in_scopes.used_in_tree(abstract_syntax_tree)
+    If used_scopes, the result of find_variables_in_scopes.used_in_tree,
+    is already available, pass it to avoid building it again.
+    """
+    variables_used = {}
 
-    def _visit_scope(scope):
-        """Visit a scope."""
-        for subscope in scope.scopes:
-            _visit_scope(subscope)
+    if used_scopes is None:
+        tree = abstract_syntax_tree
+        used_scopes = find_variables_in_scopes.used_in_tree(tree)
+
+    # Scopes are visited in post-order, with an explicit stack so that
+    # deeply nested scopes cannot exhaust the stack
+    stack = [(used_scopes, False)]
+    while stack:
+        scope, subscopes_done = stack.pop()
+        if not subscopes_done:
+            stack.append((scope, True))
+            stack.extend([(s, False) for s in reversed(scope.scopes)])
+            continue
 
         for word, _ in scope.used_vars:
 
@@ -157,6 +191,4 @@ def variables_used_matching(abstract_syntax_tree,
 
                 _append_to_set_variables(match, word, variables_used)
 
-    _visit_scope(global_scope)
-
     return variables_used
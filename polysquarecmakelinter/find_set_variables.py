@@ -7,8 +7,7 @@
 
 from collections import namedtuple
 
-from cmakeast import ast_visitor
-
+from polysquarecmakelinter import engine
 from polysquarecmakelinter import ignore
 
 
@@ -24,160 +23,223 @@ class _SetVariable(namedtuple("_SetVariable",
         return super(_SetVariable, cls).__new__(cls, cmd, find, sub)
 
 
-def _find_arg_no_factory(mixin):
-    """Generate a function which returns a class with a mixin."""
-    def _find_arg_no(num):
-        """Return an argument finder for argument at num."""
-        class Finder(mixin, object):  # suppress(too-few-public-methods)
-            """Finder for arguments after num."""
+# Kinds of Finder
+ARG_NO = 0
+AFTER_ARG = 1
 
-            def __call__(self, arguments):  # suppress(no-self-use)
-                """Return argument at num."""
-                try:
-                    return arguments[num]
-                except IndexError:
-                    return None
 
-        return Finder()
+# suppress(too-few-public-methods)
+class Finder(namedtuple("Finder", "kind key")):
+    """Where to find the variable set in the arguments to a call.
+
+    If kind is ARG_NO, then the variable is the argument at index key.
+    If kind is AFTER_ARG, then the variable is the argument after the
+    first one with the contents key, or nothing if there is no such
+    argument. Calling a Finder with a list of arguments
+    returns the argument found, or None.
+    """
 
-    return _find_arg_no
+    __slots__ = ()
 
+    def __call__(self, arguments):
+        """Return the argument found in arguments."""
+        return find_argument(self, arguments)
 
-def _find_after_arg_factory(mixin):
-    """Generate a function which returns a class with a mixin."""
-    def _find_after_arg(argument):
-        """Return an argument finder for an argument after argument."""
-        class Finder(mixin, object):  # suppress(too-few-public-methods)
-            """Finder for arguments after argument."""
 
-            def __call__(self, arguments):  # suppress(no-self-use)
-                """Return argument after argument or None if not found."""
-                try:
-                    argument_index = 1
-                    for argument_index in range(1, len(arguments)):
-                        if arguments[argument_index - 1].contents == argument:
-                            break
+def find_argument(finder, arguments):
+    """Return the argument in arguments described by finder, or None."""
+    if finder.kind == ARG_NO:
+        try:
+            return arguments[finder.key]
+        except IndexError:
+            return None
 
-                    return arguments[argument_index]
-                except IndexError:
-                    return None
+    assert finder.kind == AFTER_ARG
 
-        return Finder()
+    for argument_index in range(1, len(arguments)):
+        if arguments[argument_index - 1].contents == finder.key:
+            return arguments[argument_index]
 
-    return _find_after_arg
+    return None
 
 
-class _EmptyMixin(object):  # suppress(too-few-public-methods)
-    """An empty mixin to pass to argument factories."""
+def _arg_no(num):
+    """Return a Finder for the argument at num."""
+    return Finder(ARG_NO, num)
 
 
-def all_functions(arg_no_mixin_generator=lambda n: _EmptyMixin,
-                  after_arg_mixin_generator=lambda a: _EmptyMixin):
-    """Return a list of _SetVariable for all functions setting variables.
+def _after_arg(argument):
+    """Return a Finder for the argument after argument."""
+    return Finder(AFTER_ARG, argument)
 
-    Use arg_no_mixin_generator and after_arg_mixin_generator to customize the
-    instance of the find attribute attached to each _SetVariable, eg, to add
-    your own functions.
-    """
-    def _find_arg_no(num):
-        """Wrap _find_arg_no_factory and adds mixin."""
-        return _find_arg_no_factory(arg_no_mixin_generator(num))(num)
-
-    def _find_after_arg(arg):
-        """Wrap _find_after_arg_factory and adds mixin."""
-        return _find_after_arg_factory(after_arg_mixin_generator(arg))(arg)
-
-    return [
-        _SetVariable("aux_source_directory", _find_arg_no(1)),
-        _SetVariable("build_command", _find_arg_no(0)),
-        _SetVariable("cmake_host_system_information", _find_arg_no(1),
-                     sub="RESULT"),
-        _SetVariable("cmake_policy", _find_arg_no(2), sub="GET"),
-        _SetVariable("execute_process", _find_after_arg("RESULT_VARIABLE")),
-        _SetVariable("execute_process", _find_after_arg("OUTPUT_VARIABLE")),
-        _SetVariable("execute_process", _find_after_arg("ERROR_VARIABLE")),
-        _SetVariable("file", _find_arg_no(2), sub="READ"),
-        _SetVariable("file", _find_arg_no(2), sub="STRINGS"),
-        _SetVariable("file", _find_arg_no(2), sub="MD5"),
-        _SetVariable("file", _find_arg_no(2), sub="SHA1"),
-        _SetVariable("file", _find_arg_no(2), sub="SHA224"),
-        _SetVariable("file", _find_arg_no(2), sub="SHA256"),
-        _SetVariable("file", _find_arg_no(2), sub="SHA384"),
-        _SetVariable("file", _find_arg_no(2), sub="SHA512"),
-        _SetVariable("file", _find_arg_no(1), sub="GLOB"),
-        _SetVariable("file", _find_arg_no(1), sub="GLOB_RECURSE"),
-        _SetVariable("file", _find_arg_no(1), sub="RELATIVE_PATH"),
-        _SetVariable("file", _find_arg_no(2), sub="TO_CMAKE_PATH"),
-        _SetVariable("file", _find_arg_no(2), sub="TO_NATIVE_PATH"),
-        _SetVariable("file", _find_after_arg("LOG"), sub="DOWNLOAD"),
-        _SetVariable("file", _find_after_arg("LOG"), sub="UPLOAD"),
-        _SetVariable("file", _find_after_arg("STATUS"), sub="DOWNLOAD"),
-        _SetVariable("file", _find_after_arg("STATUS"), sub="UPLOAD"),
-        _SetVariable("file", _find_arg_no(2), sub="TIMESTAMP"),
-        _SetVariable("find_file", _find_arg_no(0)),
-        _SetVariable("find_library", _find_arg_no(0)),
-        _SetVariable("find_path", _find_arg_no(0)),
-        _SetVariable("find_program", _find_arg_no(0)),
-        _SetVariable("get_cmake_property", _find_arg_no(0)),
-        _SetVariable("get_directory_property", _find_arg_no(0)),
-        _SetVariable("get_filename_component", _find_arg_no(0)),
-        _SetVariable("get_property", _find_arg_no(0)),
-        _SetVariable("get_source_file_property", _find_arg_no(1)),
-        _SetVariable("get_target_property", _find_arg_no(0)),
-        _SetVariable("get_test_property", _find_arg_no(0)),
-        _SetVariable("include", _find_after_arg("RESULT_VARIABLE")),
-        _SetVariable("separate_arguments", _find_arg_no(1)),
-        _SetVariable("set", _find_arg_no(0)),
-        _SetVariable("unset", _find_arg_no(0)),
-        _SetVariable("try_compile", _find_after_arg("RESULT_VAR")),
-        _SetVariable("try_compile", _find_after_arg("OUTPUT_VARIABLE")),
-        _SetVariable("try_run", _find_after_arg("RUN_RESULT_VAR")),
-        _SetVariable("try_run", _find_after_arg("COMPILE_RESULT_VAR")),
-        _SetVariable("try_run", _find_after_arg("RUN_OUTPUT_VARIABLE")),
-        _SetVariable("try_run", _find_after_arg("OUTPUT_VARIABLE")),
-        _SetVariable("list", _find_arg_no(2), sub="LENGTH"),
-        _SetVariable("list", _find_arg_no(-1), sub="GET"),
-        _SetVariable("list", _find_arg_no(3), sub="FIND"),
-        _SetVariable("list", _find_arg_no(2), sub="REMOVE_ITEM"),
-        _SetVariable("list", _find_arg_no(1), sub="REMOVE_AT"),
-        _SetVariable("list", _find_arg_no(1), sub="REMOVE_DUPLICATES"),
-        _SetVariable("list", _find_arg_no(1), sub="REVERSE"),
-        _SetVariable("list", _find_arg_no(1), sub="SORT"),
-        _SetVariable("list", _find_arg_no(1), sub="APPEND"),
-        _SetVariable("list", _find_arg_no(1), sub="INSERT"),
-        _SetVariable("match", _find_arg_no(1), sub="EXPR")
-    ]
 
 # Default list of _SetVariable functions.
-_FIND_AFTER_ARG_INT = _find_after_arg_factory(_EmptyMixin)
+FUNCTIONS_SETTING_VARIABLES = [
+    _SetVariable("aux_source_directory", _arg_no(1)),
+    _SetVariable("build_command", _arg_no(0)),
+    _SetVariable("cmake_host_system_information", _arg_no(1), sub="RESULT"),
+    _SetVariable("cmake_policy", _arg_no(2), sub="GET"),
+    _SetVariable("execute_process", _after_arg("RESULT_VARIABLE")),
+    _SetVariable("execute_process", _after_arg("OUTPUT_VARIABLE")),
+    _SetVariable("execute_process", _after_arg("ERROR_VARIABLE")),
+    _SetVariable("file", _arg_no(2), sub="READ"),
+    _SetVariable("file", _arg_no(2), sub="STRINGS"),
+    _SetVariable("file", _arg_no(2), sub="MD5"),
+    _SetVariable("file", _arg_no(2), sub="SHA1"),
+    _SetVariable("file", _arg_no(2), sub="SHA224"),
+    _SetVariable("file", _arg_no(2), sub="SHA256"),
+    _SetVariable("file", _arg_no(2), sub="SHA384"),
+    _SetVariable("file", _arg_no(2), sub="SHA512"),
+    _SetVariable("file", _arg_no(1), sub="GLOB"),
+    _SetVariable("file", _arg_no(1), sub="GLOB_RECURSE"),
+    _SetVariable("file", _arg_no(1), sub="RELATIVE_PATH"),
+    _SetVariable("file", _arg_no(2), sub="TO_CMAKE_PATH"),
+    _SetVariable("file", _arg_no(2), sub="TO_NATIVE_PATH"),
+    _SetVariable("file", _after_arg("LOG"), sub="DOWNLOAD"),
+    _SetVariable("file", _after_arg("LOG"), sub="UPLOAD"),
+    _SetVariable("file", _after_arg("STATUS"), sub="DOWNLOAD"),
+    _SetVariable("file", _after_arg("STATUS"), sub="UPLOAD"),
+    _SetVariable("file", _arg_no(2), sub="TIMESTAMP"),
+    _SetVariable("find_file", _arg_no(0)),
+    _SetVariable("find_library", _arg_no(0)),
+    _SetVariable("find_path", _arg_no(0)),
+    _SetVariable("find_program", _arg_no(0)),
+    _SetVariable("get_cmake_property", _arg_no(0)),
+    _SetVariable("get_directory_property", _arg_no(0)),
+    _SetVariable("get_filename_component", _arg_no(0)),
+    _SetVariable("get_property", _arg_no(0)),
+    _SetVariable("get_source_file_property", _arg_no(1)),
+    _SetVariable("get_target_property", _arg_no(0)),
+    _SetVariable("get_test_property", _arg_no(0)),
+    _SetVariable("include", _after_arg("RESULT_VARIABLE")),
+    _SetVariable("separate_arguments", _arg_no(1)),
+    _SetVariable("set", _arg_no(0)),
+    _SetVariable("unset", _arg_no(0)),
+    _SetVariable("try_compile", _after_arg("RESULT_VAR")),
+    _SetVariable("try_compile", _after_arg("OUTPUT_VARIABLE")),
+    _SetVariable("try_run", _after_arg("RUN_RESULT_VAR")),
+    _SetVariable("try_run", _after_arg("COMPILE_RESULT_VAR")),
+    _SetVariable("try_run", _after_arg("RUN_OUTPUT_VARIABLE")),
+    _SetVariable("try_run", _after_arg("OUTPUT_VARIABLE")),
+    _SetVariable("list", _arg_no(2), sub="LENGTH"),
+    _SetVariable("list", _arg_no(-1), sub="GET"),
+    _SetVariable("list", _arg_no(3), sub="FIND"),
+    _SetVariable("list", _arg_no(2), sub="REMOVE_ITEM"),
+    _SetVariable("list", _arg_no(1), sub="REMOVE_AT"),
+    _SetVariable("list", _arg_no(1), sub="REMOVE_DUPLICATES"),
+    _SetVariable("list", _arg_no(1), sub="REVERSE"),
+    _SetVariable("list", _arg_no(1), sub="SORT"),
+    _SetVariable("list", _arg_no(1), sub="APPEND"),
+    _SetVariable("list", _arg_no(1), sub="INSERT"),
+    _SetVariable("match", _arg_no(1), sub="EXPR")
+]
 
-FUNCTIONS_SETTING_VARIABLES = all_functions()
 _FUNCTIONS_SETTING_VARS_INT = (FUNCTIONS_SETTING_VARIABLES +
                                [_SetVariable("set_property",
-                                             _FIND_AFTER_ARG_INT("PROPERTY"),
+                                             _after_arg("PROPERTY"),
                                              sub="GLOBAL")])
 
 
+def _index_by_signature(set_variables):
+    """Return a dict of (cmd, sub) to the Finders for that signature.
+
+    Finders are kept in the order they appear in set_variables.
+    """
+    index = dict()
+    for set_variable in set_variables:
+        key = (set_variable.cmd, set_variable.sub)
+        index.setdefault(key, []).append(set_variable.find)
+
+    # by_function_call assumes that each command either always or never
+    # has a subcommand
+    commands_with_sub = set([c for (c, s) in index.keys() if s is not None])
+    commands_without = set([c for (c, s) in index.keys() if s is None])
+    assert not commands_with_sub & commands_without
+
+    return index
+
+_FINDERS_BY_SIGNATURE = _index_by_signature(_FUNCTIONS_SETTING_VARS_INT)
+
+# Finder subclasses with a mixin, keyed by mixin
+_MIXIN_FINDERS = dict()
+
+
+def _with_mixin(finder, mixin):
+    """Return finder as an instance of a Finder subclass with mixin."""
+    try:
+        finder_class = _MIXIN_FINDERS[mixin]
+    except KeyError:
+        finder_class = type("Finder", (mixin, Finder), dict())
+        _MIXIN_FINDERS[mixin] = finder_class
+
+    return finder_class(*finder)
+
+
+def all_functions(arg_no_mixin_generator=None,
+                  after_arg_mixin_generator=None):
+    """Return a list of _SetVariable for all functions setting variables.
+
+    Use arg_no_mixin_generator and after_arg_mixin_generator to customize the
+    instance of the find attribute attached to each _SetVariable, eg, to add
+    your own functions. Each is called with the key of the Finder and
+    returns a mixin class.
+    """
+    mixin_generators = {
+        ARG_NO: arg_no_mixin_generator,
+        AFTER_ARG: after_arg_mixin_generator
+    }
+
+    def _customized(set_variable):
+        """Return set_variable with a mixin added to its Finder."""
+        generator = mixin_generators[set_variable.find.kind]
+        if generator is None:
+            return set_variable
+
+        mixin = generator(set_variable.find.key)
+        return set_variable._replace(find=_with_mixin(set_variable.find,
+                                                      mixin))
+
+    return [_customized(s) for s in FUNCTIONS_SETTING_VARIABLES]
+
+
+def _finders_for_call(node):
+    """Return the Finders for the signature of the call node."""
+    try:
+        return _FINDERS_BY_SIGNATURE[(node.name, None)]
+    except KeyError:
+        pass
+
+    try:
+        return _FINDERS_BY_SIGNATURE[(node.name, node.arguments[0].contents)]
+    except (KeyError, IndexError):
+        return ()
+
+
+def all_by_function_call(node):
+    """Return a list of all variables (as word nodes) set by a function call.
+
+    For example, execute_process can set both RESULT_VARIABLE and
+    OUTPUT_VARIABLE. The variables are in the order of the table of
+    functions setting variables, without duplicates.
+    """
+    variables = []
+    for finder in _finders_for_call(node):
+        evaluate = find_argument(finder, node.arguments)
+        if evaluate and not any([v is evaluate for v in variables]):
+            variables.append(evaluate)
+
+    return variables
+
+
 def by_function_call(node):
-    """Return a variable (as a word node) set by a function call, if any."""
-    for matcher in _FUNCTIONS_SETTING_VARS_INT:
-        if matcher.cmd == node.name:
-            # Exclude where subcommand does not match
-            # Note: pylint trips up on the generated code and believes that
-            # matcher has no attribute named "sub". This is incorrect, so
-            # a warning is suppressed here.
-            if matcher.sub is not None:  # suppress(no-member)
-                try:
-                    if (matcher.sub !=  # suppress(no-member)
-                            node.arguments[0].contents):
-                        continue
-                except IndexError:
-                    continue
-
-            evaluate = matcher.find(node.arguments)
-
-            if evaluate:
-                return evaluate
+    """Return a variable (as a word node) set by a function call, if any.
+
+    If the call sets more than one variable, only the first is returned.
+    """
+    for finder in _finders_for_call(node):
+        evaluate = find_argument(finder, node.arguments)
+        if evaluate:
+            return evaluate
 
     return None
 
@@ -190,11 +252,9 @@ def in_tree(abstract_syntax_tree):
         """Visit all function calls."""
         assert name == "FunctionCall"
 
-        evaluate = by_function_call(node)
-        if evaluate:
-            variables.append(evaluate)
+        variables.extend(all_by_function_call(node))
 
-    ast_visitor.recurse(abstract_syntax_tree,
-                        function_call=ignore.visitor_depth(_call_visitor))
+    engine.recurse(abstract_syntax_tree,
+                   function_call=ignore.visitor_depth(_call_visitor))
 
     return variables
@@ -48,11 +48,16 @@
 # See /LICENCE.md for Copyright information
 """Find all set variables and order by scope."""
 
+import bisect
+
 import re
 
 from collections import namedtuple
 
 from polysquarecmakelinter import find_set_variables
+from polysquarecmakelinter import ir
+
+from polysquarecmakelinter.ir import Kind
 
 Variable = namedtuple("Variable", "node source")
 ScopeInfo = namedtuple("ScopeInfo", "name type")
@@ -122,6 +127,13 @@ class ScopeType(object):  # suppress(too-few-public-methods)
     Global = 3
 
 
+_NODE_SCOPE_TYPES = {
+    Kind.ForeachStatement: ScopeType.Foreach,
+    Kind.MacroDefinition: ScopeType.Macro,
+    Kind.FunctionDefinition: ScopeType.Function
+}
+
+
 class _Scope(object):  # suppress(too-few-public-methods)
     """A place where variables are hoisted."""
 
@@ -133,18 +145,17 @@ class _Scope(object):  # suppress(too-few-public-methods)
         self.info = info
         self.scopes = []
 
-    def add_subscope(self, name, node, parent, factory):
-        """Add a new subscope."""
-        assert node.__class__.__name__ != "ToplevelBody"
-
-        node_scope_types = {
-            "ForeachStatement": ScopeType.Foreach,
-            "MacroDefinition": ScopeType.Macro,
-            "FunctionDefinition": ScopeType.Function
-        }
+        # The type of the nearest scope variables are hoisted to, which
+        # is the first one enclosing this one that is not a foreach loop.
+        if info.type == ScopeType.Foreach and parent is not None:
+            self.hoist_type = parent.hoist_type
+        else:
+            self.hoist_type = info.type
 
-        assert node.__class__.__name__ in node_scope_types
-        scope_type = node_scope_types[node.__class__.__name__]
+    def add_subscope(self, name, node, parent, factory):
+        """Add a new subscope for node, an ir node."""
+        assert node.kind in _NODE_SCOPE_TYPES
+        scope_type = _NODE_SCOPE_TYPES[node.kind]
 
         self.scopes.append(factory(ScopeInfo(name,
                                              scope_type),
@@ -155,103 +166,116 @@ def traverse_scopes(abstract_syntax_tree,  # NOQA
                     body_function_call,
                     header_function_call,
                     factory):
-    """Find all set variables in tree and orders into scopes."""
+    """Find all set variables in tree and orders into scopes.
+
+    abstract_syntax_tree is built with ir.build if it is not already.
+
+    The tree is walked with an explicit stack of visits rather than by
+    recursion, so that deeply nested blocks cannot exhaust the stack.
+    Each visit is a tuple of a function, a node, the enclosing scope
+    and the header scope. Visiting a block returns the visits for its
+    header and body, in order.
+    """
     global_scope = factory(ScopeInfo("toplevel", ScopeType.Global), None)
 
-    def _header_body_visitor(enclosing_scope, header_scope, header, body):
-        """Visit a header-body like node."""
+    def _header_body_visits(enclosing_scope, header_scope, header, body):
+        """Return the visits for a header-body like node."""
+        visits = []
         if header is not None:
-
-            header_function_call(header, enclosing_scope, header_scope)
+            visits.append((header_function_call,
+                           header,
+                           enclosing_scope,
+                           header_scope))
 
         for statement in body:
-            _node_recurse(statement, enclosing_scope, header_scope)
+            visits.append((_visit_node,
+                           statement,
+                           enclosing_scope,
+                           header_scope))
 
-    def _node_recurse(node, enclosing_scope, header_scope):
-        """Visit any node, adjusts scopes."""
-        def _handle_if_block(node):
-            """Handle if blocks."""
-            _header_body_visitor(enclosing_scope,
-                                 header_scope,
-                                 node.if_statement.header,
-                                 node.if_statement.body)
-
-            for elseif in node.elseif_statements:
-                _header_body_visitor(enclosing_scope,
-                                     header_scope,
-                                     elseif.header,
-                                     elseif.body)
+        return visits
 
-            if node.else_statement:
-                _header_body_visitor(enclosing_scope,
+    def _handle_if_block(node, enclosing_scope, header_scope):
+        """Handle if blocks."""
+        visits = _header_body_visits(enclosing_scope,
                                      header_scope,
-                                     node.else_statement.header,
-                                     node.else_statement.body)
-
-        def _handle_foreach_statement(node):
-            """Handle foreach statements."""
-            header_scope.add_subscope("foreach", node, header_scope, factory)
-
-            _header_body_visitor(enclosing_scope,
-                                 header_scope.scopes[-1],
-                                 node.header,
-                                 node.body)
-
-        def _handle_while_statement(node):
-            """Handle while statements."""
-            _header_body_visitor(enclosing_scope,
-                                 header_scope,
-                                 node.header,
-                                 node.body)
-
-        def _handle_function_declaration(node):
-            """Handle function declarations."""
-            header_scope.add_subscope(node.header.arguments[0].contents,
-                                      node,
-                                      header_scope,
-                                      factory)
-
-            _header_body_visitor(header_scope.scopes[-1],
-                                 header_scope.scopes[-1],
-                                 node.header,
-                                 node.body)
-
-        def _handle_macro_declaration(node):
-            """Handle macro declarations."""
-            header_scope.add_subscope(node.header.arguments[0].contents,
-                                      node,
-                                      header_scope,
-                                      factory)
-
-            _header_body_visitor(header_scope.scopes[-1],
-                                 header_scope.scopes[-1],
-                                 node.header,
-                                 node.body)
-
-        def _handle_function_call(node):
-            """Handle function calls - does nothing, nothing to recurse."""
-            body_function_call(node, enclosing_scope, header_scope)
-
-        def _handle_toplevel_body(node):
-            """Handle the special toplevel body node."""
-            _header_body_visitor(enclosing_scope,
-                                 header_scope,
-                                 None,
-                                 node.statements)
-
-        node_dispatch = {
-            "IfBlock": _handle_if_block,
-            "ForeachStatement": _handle_foreach_statement,
-            "WhileStatement": _handle_while_statement,
-            "FunctionDefinition": _handle_function_declaration,
-            "MacroDefinition": _handle_macro_declaration,
-            "ToplevelBody": _handle_toplevel_body,
-            "FunctionCall": _handle_function_call
-        }
-
-        node_dispatch[node.__class__.__name__](node)
-
-    _node_recurse(abstract_syntax_tree, global_scope, global_scope)
+                                     node.if_statement.header,
+                                     node.if_statement.body)
+
+        for elseif in node.elseif_statements:
+            visits.extend(_header_body_visits(enclosing_scope,
+                                              header_scope,
+                                              elseif.header,
+                                              elseif.body))
+
+        if node.else_statement:
+            visits.extend(_header_body_visits(enclosing_scope,
+                                              header_scope,
+                                              node.else_statement.header,
+                                              node.else_statement.body))
+
+        return visits
+
+    def _handle_foreach_statement(node, enclosing_scope, header_scope):
+        """Handle foreach statements."""
+        header_scope.add_subscope("foreach", node, header_scope, factory)
+
+        return _header_body_visits(enclosing_scope,
+                                   header_scope.scopes[-1],
+                                   node.header,
+                                   node.body)
+
+    def _handle_while_statement(node, enclosing_scope, header_scope):
+        """Handle while statements."""
+        return _header_body_visits(enclosing_scope,
+                                   header_scope,
+                                   node.header,
+                                   node.body)
+
+    def _handle_definition(node, enclosing_scope, header_scope):
+        """Handle function and macro declarations."""
+        del enclosing_scope
+
+        header_scope.add_subscope(node.header.arguments[0].contents,
+                                  node,
+                                  header_scope,
+                                  factory)
+
+        return _header_body_visits(header_scope.scopes[-1],
+                                   header_scope.scopes[-1],
+                                   node.header,
+                                   node.body)
+
+    def _handle_toplevel_body(node, enclosing_scope, header_scope):
+        """Handle the special toplevel body node."""
+        return _header_body_visits(enclosing_scope,
+                                   header_scope,
+                                   None,
+                                   node.statements)
+
+    node_dispatch = {
+        Kind.IfBlock: _handle_if_block,
+        Kind.ForeachStatement: _handle_foreach_statement,
+        Kind.WhileStatement: _handle_while_statement,
+        Kind.FunctionDefinition: _handle_definition,
+        Kind.MacroDefinition: _handle_definition,
+        Kind.ToplevelBody: _handle_toplevel_body,
+        Kind.FunctionCall: body_function_call
+    }
+
+    def _visit_node(node, enclosing_scope, header_scope):
+        """Visit any node, adjusts scopes."""
+        return node_dispatch[node.kind](node, enclosing_scope, header_scope)
+
+    stack = [(_visit_node,
+              ir.build(abstract_syntax_tree),
+              global_scope,
+              global_scope)]
+    while stack:
+        function, node, enclosing_scope, header_scope = stack.pop()
+        visits = function(node, enclosing_scope, header_scope)
+        if visits:
+            stack.extend(reversed(visits))
 
     return global_scope
 
@@ -272,7 +296,6 @@ def _scope_to_bind_var_to(function_call, enclosing):
     # Another special case for set_property with GLOBAL as the
     # first argument. Create a notional "variable"
     elif function_call.name == "set_property":
-        assert len(function_call.arguments[0]) >= 3
         if function_call.arguments[0].contents == "GLOBAL":
             while enclosing.parent is not None:
                 enclosing = enclosing.parent
@@ -280,153 +303,266 @@ def _scope_to_bind_var_to(function_call, enclosing):
     return enclosing
 
 
+class SetVariablesScope(_Scope):  # suppress(too-few-public-methods)
+    """Set variables in this scope."""
+
+    def __init__(self, info, parent):
+        """Initialize set_vars member."""
+        super(SetVariablesScope, self).__init__(info, parent)
+        self.set_vars = []
+
+
+class UsedVariablesScope(_Scope):  # suppress(too-few-public-methods)
+    """Used variables in this scope."""
+
+    def __init__(self, info, parent):
+        """Initialize used_vars member."""
+        super(UsedVariablesScope, self).__init__(info, parent)
+        self.used_vars = []
+
+
+class SetAndUsedVariablesScope(_Scope):  # suppress(too-few-public-methods)
+    """Both set and used variables in this scope."""
+
+    def __init__(self, info, parent):
+        """Initialize set_vars and used_vars members."""
+        super(SetAndUsedVariablesScope, self).__init__(info, parent)
+        self.set_vars = []
+        self.used_vars = []
+
+
+_SET_BODY_VAR_TYPES = {
+    ScopeType.Macro: VariableSource.MacroVar,
+    ScopeType.Function: VariableSource.FunctionVar,
+    ScopeType.Global: VariableSource.GlobalVar
+}
+
+_SET_HEADER_VAR_TYPES = {
+    ScopeType.Foreach: VariableSource.ForeachVar,
+    ScopeType.Function: VariableSource.FunctionArg,
+    ScopeType.Macro: VariableSource.MacroArg
+}
+
+_SET_HEADER_VARIABLES = {
+    "foreach": lambda h: [h.arguments[0]],
+    "function": lambda h: h.arguments[1:],
+    "macro": lambda h: h.arguments[1:]
+}
+
+
+def _set_body_function_call(node, enclosing, body_header):
+    """Handle function calls in a body and provides scope."""
+    del body_header
+
+    set_vars = find_set_variables.all_by_function_call(node)
+    if set_vars:
+
+        # Special case for "set" and PARENT_SCOPE/CACHE scope
+        enclosing = _scope_to_bind_var_to(node, enclosing)
+
+        var_type = _SET_BODY_VAR_TYPES[enclosing.info.type]
+        enclosing.set_vars.extend([Variable(v, var_type) for v in set_vars])
+
+
+def _set_header_function_call(node, header_enclosing, header):
+    """Handle the "header" function call and provides scope."""
+    del header_enclosing
+
+    try:
+        nodes = _SET_HEADER_VARIABLES[node.name](node)
+    except KeyError:
+        return
+
+    var_type = _SET_HEADER_VAR_TYPES[header.info.type]
+    header.set_vars += [Variable(v, var_type) for v in nodes]
+
+
+_USED_BODY_VAR_TYPES = {
+    ScopeType.Foreach: VariableSource.ForeachVar,
+    ScopeType.Function: VariableSource.FunctionVar,
+    ScopeType.Macro: VariableSource.MacroVar,
+    ScopeType.Global: VariableSource.GlobalVar
+}
+
+
+_USED_KW_EXCLUDE = {
+    "if": IF_KEYWORDS,
+    "elseif": IF_KEYWORDS,
+    "while": IF_KEYWORDS,
+    "foreach": FOREACH_KEYWORDS,
+    "function": [],
+    "macro": [],
+    "else": []
+}
+
+_USED_HEADER_POS_EXCLUDE = {
+    "if": lambda _: False,
+    "elseif": lambda _: False,
+    "while": lambda _: False,
+    "foreach": lambda n: n == 0,
+    "function": lambda _: True,
+    "macro": lambda _: True,
+    "else": lambda _: True
+}
+
+_STARTS_NEW_HEADER = ["foreach", "function", "macro"]
+
+
+def _used_body_function_call(node, body_enclosing, header):
+    """Handle function calls in a node body."""
+    del body_enclosing
+
+    var_type = _USED_BODY_VAR_TYPES[header.info.type]
+    header.used_vars.extend([Variable(a, var_type)
+                             for a in node.arguments
+                             if _RE_VARIABLE_USE.search(a.contents)])
+
+
+def _used_header_function_call(node, header_enclosing, current_header):
+    """Handle function calls in a node header."""
+    del header_enclosing
+
+    if node.name in _STARTS_NEW_HEADER:
+        header = current_header.parent
+    else:
+        header = current_header
+
+    variable_type = _USED_BODY_VAR_TYPES[header.hoist_type]
+    kw_exclude = _USED_KW_EXCLUDE[node.name]
+    pos_exclude = _USED_HEADER_POS_EXCLUDE[node.name]
+
+    for index, argument in enumerate(node.arguments):
+        is_var_use = _RE_VARIABLE_USE.search(argument.contents) is not None
+        not_kw_excluded = argument.contents not in kw_exclude
+        not_pos_excluded = not pos_exclude(index)
+
+        if is_var_use and not_kw_excluded and not_pos_excluded:
+            header.used_vars.append(Variable(argument, variable_type))
+
+
 def set_in_tree(abstract_syntax_tree):
     """Find variables set by scopes."""
-    def scope_factory(info, parent):
-        """Construct a "set variables" scope."""
-        class SetVariablesScope(_Scope):  # suppress(too-few-public-methods)
-            """Set variables in this scope."""
-
-            def __init__(self, info, parent):
-                """Initialize set_vars member."""
-                super(SetVariablesScope, self).__init__(info, parent)
-                self.set_vars = []
-
-        return SetVariablesScope(info, parent)
-
-    def body_function_call(node, enclosing, body_header):
-        """Handle function calls in a body and provides scope."""
-        del body_header
-
-        var_types = {
-            ScopeType.Macro: VariableSource.MacroVar,
-            ScopeType.Function: VariableSource.FunctionVar,
-            ScopeType.Global: VariableSource.GlobalVar
-        }
-
-        set_var = find_set_variables.by_function_call(node)
-        if set_var:
-
-            # Special case for "set" and PARENT_SCOPE/CACHE scope
-            enclosing = _scope_to_bind_var_to(node, enclosing)
-
-            info = enclosing.info
-            enclosing.set_vars.append(Variable(set_var,
-                                               var_types[info.type]))
-
-    def header_function_call(node, header_enclosing, header):
-        """Handle the "header" function call and provides scope."""
-        del header_enclosing
-
-        def _get_header_vars(header):
-            """Add variables implicitly set by header function call."""
-            header_variables = {
-                "foreach": lambda h: [h.arguments[0]],
-                "function": lambda h: h.arguments[1:],
-                "macro": lambda h: h.arguments[1:]
-            }
-
-            try:
-                return header_variables[header.name](header)
-            except KeyError:
-                return []
-
-        var_types = {
-            ScopeType.Foreach: VariableSource.ForeachVar,
-            ScopeType.Function: VariableSource.FunctionArg,
-            ScopeType.Macro: VariableSource.MacroArg
-        }
-
-        nodes = _get_header_vars(node)
-        info = header.info
-        header.set_vars += [Variable(v, var_types[info.type]) for v in nodes]
-
     return traverse_scopes(abstract_syntax_tree,
-                           body_function_call,
-                           header_function_call,
-                           scope_factory)
+                           _set_body_function_call,
+                           _set_header_function_call,
+                           SetVariablesScope)
 
 
 def used_in_tree(abstract_syntax_tree):
     """Find variables used in scopes."""
-    def scope_factory(info, parent):
-        """Construct a "set variables" scope."""
-        class UsedVariablesScope(_Scope):  # suppress(too-few-public-methods)
-            """Used variables in this scope."""
-
-            def __init__(self, info, parent):
-                """Initialize used_vars member."""
-                super(UsedVariablesScope, self).__init__(info, parent)
-                self.used_vars = []
-
-        return UsedVariablesScope(info, parent)
-
-    def body_function_call(node, body_enclosing, header):
-        """Handle function calls in a node body."""
-        del body_enclosing
-
-        var_types = {
-            ScopeType.Foreach: VariableSource.ForeachVar,
-            ScopeType.Function: VariableSource.FunctionVar,
-            ScopeType.Macro: VariableSource.MacroVar,
-            ScopeType.Global: VariableSource.GlobalVar
-        }
-
-        info = header.info
-        header.used_vars.extend([Variable(a,
-                                          var_types[info.type])
-                                 for a in node.arguments
-                                 if _RE_VARIABLE_USE.search(a.contents)])
-
-    def header_function_call(node, header_enclosing, current_header):
-        """Handle function calls in a node header."""
-        del header_enclosing
-
-        var_types = {
-            ScopeType.Foreach: lambda p: var_types[p.info.type](p.parent),
-            ScopeType.Function: lambda _: VariableSource.FunctionVar,
-            ScopeType.Macro: lambda _: VariableSource.MacroVar,
-            ScopeType.Global: lambda _: VariableSource.GlobalVar
-        }
-
-        starts_new_header = ["foreach", "function", "macro"]
-        if node.name in starts_new_header:
-            header = current_header.parent
-        else:
-            header = current_header
-
-        sct = header.info.type
-
-        kw_exclude = {
-            "if":  IF_KEYWORDS,
-            "elseif": IF_KEYWORDS,
-            "while": IF_KEYWORDS,
-            "foreach": FOREACH_KEYWORDS,
-            "function": [],
-            "macro": [],
-            "else": []
-        }
-
-        header_pos_exclude = {
-            "if": lambda _: False,
-            "elseif": lambda _: False,
-            "while": lambda _: False,
-            "foreach": lambda n: n == 0,
-            "function": lambda _: True,
-            "macro": lambda _: True,
-            "else": lambda _: True
-        }
-
-        for index, argument in enumerate(node.arguments):
-            is_var_use = _RE_VARIABLE_USE.search(argument.contents) is not None
-            not_kw_excluded = argument.contents not in kw_exclude[node.name]
-            not_pos_excluded = not header_pos_exclude[node.name](index)
-
-            if is_var_use and not_kw_excluded and not_pos_excluded:
-                variable_type = var_types[sct](header.parent)
-                header.used_vars.append(Variable(argument, variable_type))
+    return traverse_scopes(abstract_syntax_tree,
+                           _used_body_function_call,
+                           _used_header_function_call,
+                           UsedVariablesScope)
+
+
+def set_and_used_in_tree(abstract_syntax_tree):
+    """Find variables set and used by scopes in a single traversal.
+
+    The returned scope tree has both set_vars and used_vars, so it can be
+    used in place of the results of both set_in_tree and used_in_tree.
+    """
+    def _body_function_call(node, enclosing, header):
+        """Handle function calls in a body for both set and used vars."""
+        _set_body_function_call(node, enclosing, header)
+        _used_body_function_call(node, enclosing, header)
+
+    def _header_function_call(node, enclosing, header):
+        """Handle header function calls for both set and used vars."""
+        _set_header_function_call(node, enclosing, header)
+        _used_header_function_call(node, enclosing, header)
 
     return traverse_scopes(abstract_syntax_tree,
-                           body_function_call,
-                           header_function_call,
-                           scope_factory)
+                           _body_function_call,
+                           _header_function_call,
+                           SetAndUsedVariablesScope)
+
+
+class _SubtreeUses(object):
+    """Uses of each variable name in a scope and all of its subscopes.
+
+    Behaves like a read-only dict of names to lists of word nodes. Uses
+    are shared between all scopes in a tree, ordered by the position of
+    the scope they are in, so that each scope only needs to know which
+    positions it and its subscopes span.
+    """
+
+    def __init__(self, uses, first, end):
+        """Initialize for scopes at positions first up to end."""
+        super(_SubtreeUses, self).__init__()
+        self._uses = uses
+        self._first = first
+        self._end = end
+
+    def get(self, name, default=None):
+        """Return the nodes using name, or default if there are none."""
+        try:
+            positions, nodes = self._uses[name]
+        except KeyError:
+            return default
+
+        low = bisect.bisect_left(positions, self._first)
+        high = bisect.bisect_left(positions, self._end, low)
+        if low == high:
+            return default
+
+        return nodes[low:high]
+
+    def items(self):
+        """Return a list of (name, nodes) for every name used."""
+        result = []
+        for name in self._uses:
+            nodes = self.get(name)
+            if nodes is not None:
+                result.append((name, nodes))
+
+        return result
+
+    def keys(self):
+        """Return a list of every name used."""
+        return [name for (name, _) in self.items()]
+
+
+def uses_by_name(scope_tree):
+    """Index the uses of each variable name in scope_tree in one pass.
+
+    scope_tree is the result of used_in_tree or set_and_used_in_tree.
+    Returns a dict mapping the id of each scope to a dict-like object of
+    variable names to the word nodes which use them in that scope or any
+    of its subscopes.
+
+    Scopes are numbered in pre-order, so that the subscopes of each scope
+    have the positions just after it. Building the index takes time in
+    proportion to the number of scopes and uses, however deeply the
+    scopes are nested.
+    """
+    uses = dict()
+
+    # Scopes in pre-order
+    scopes = []
+    stack = [scope_tree]
+    while stack:
+        scope = stack.pop()
+        position = len(scopes)
+        scopes.append(scope)
+        stack.extend(reversed(scope.scopes))
+
+        for use in scope.used_vars:
+            for name in _RE_VARIABLE_USE.findall(use.node.contents):
+                positions, nodes = uses.setdefault(name, ([], []))
+                positions.append(position)
+                nodes.append(use.node)
+
+    # Reversed, every scope comes after all of its subscopes, so the
+    # number of positions each spans can be added up
+    spans = dict()
+    for scope in reversed(scopes):
+        spans[id(scope)] = 1 + sum([spans[id(s)] for s in scope.scopes])
+
+    index = dict()
+    for position, scope in enumerate(scopes):
+        index[id(scope)] = _SubtreeUses(uses,
+                                        position,
+                                        position + spans[id(scope)])
+
+    return index
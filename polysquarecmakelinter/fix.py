@@ -0,0 +1,110 @@
+# /polysquarecmakelinter/fix.py
+#
+# Apply as many replacements from linter errors as possible in one pass,
+# then re-lint in memory until nothing else can be fixed.
+#
+# See /LICENCE.md for Copyright information
+"""Apply replacements from linter errors in batches."""
+
+from collections import namedtuple
+
+# An edit replaces the characters between start and end on line (all
+# zero-indexed) with text.
+Edit = namedtuple("Edit", "line start end text")
+
+# Upper bound on re-lint passes, in case fixes never settle down.
+MAX_PASSES = 16
+
+
+def edit_for_replacement(line_index, original, replacement):
+    """Return the smallest Edit turning original into replacement."""
+    max_common = min(len(original), len(replacement))
+
+    prefix = 0
+    while (prefix < max_common and
+           original[prefix] == replacement[prefix]):
+        prefix += 1
+
+    suffix = 0
+    while (suffix < max_common - prefix and
+           original[-1 - suffix] == replacement[-1 - suffix]):
+        suffix += 1
+
+    return Edit(line_index,
+                prefix,
+                len(original) - suffix,
+                replacement[prefix:len(replacement) - suffix])
+
+
+def _conflicts(edit, accepted):
+    """Return true if edit overlaps with the last accepted edit."""
+    # Two insertions at the same place are also treated as conflicting,
+    # since there is no way to tell which should come first.
+    return edit.start < accepted.end or edit.start == accepted.start
+
+
+def apply_errors(file_lines, errors):
+    """Apply all non-conflicting replacements in errors to file_lines.
+
+    errors is a list of (code, LinterFailure) tuples. Returns a tuple of
+    the fixed lines and the errors that were applied. Errors which
+    conflict with an earlier one on the same line are left alone, so that
+    they can be found again by re-linting the fixed lines.
+    """
+    edits_by_line = dict()
+    for error in errors:
+        replacement = error[1].replacement
+        if replacement is None:
+            continue
+
+        line_index = error[1].line - 1
+        edit = edit_for_replacement(line_index,
+                                    file_lines[line_index],
+                                    replacement)
+        edits_by_line.setdefault(line_index, []).append((edit, error))
+
+    fixed_lines = list(file_lines)
+    applied = []
+
+    for line_index, edits in edits_by_line.items():
+        edits.sort(key=lambda e: (e[0].start, e[0].end))
+        accepted = []
+        for edit, error in edits:
+            if accepted and _conflicts(edit, accepted[-1][0]):
+                continue
+
+            accepted.append((edit, error))
+
+        # Apply from the end of the line so earlier offsets stay valid
+        line = fixed_lines[line_index]
+        for edit, error in reversed(accepted):
+            line = line[:edit.start] + edit.text + line[edit.end:]
+            applied.append(error)
+
+        fixed_lines[line_index] = line
+
+    applied.sort(key=lambda e: e[1].line)
+    return (fixed_lines, applied)
+
+
+def to_fixed_point(contents, errors, relint):
+    """Fix contents until re-linting finds nothing else that can be fixed.
+
+    errors are the errors already found in contents and relint is a
+    function taking new contents and returning errors in them. Returns
+    a tuple of the fixed contents, the errors that were fixed and the
+    errors that remain.
+    """
+    fixed = []
+
+    for _ in range(0, MAX_PASSES):
+        fixed_lines, applied = apply_errors(contents.splitlines(True),
+                                            errors)
+        if not applied:
+            break
+
+        fixed.extend(applied)
+        contents = "".join(fixed_lines)
+        errors = relint(contents)
+
+    return (contents, fixed, errors)
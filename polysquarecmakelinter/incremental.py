@@ -0,0 +1,214 @@
+# /polysquarecmakelinter/incremental.py
+#
+# Incremental linting for editor integrations, which re-lint the same
+# buffer after every edit.
+#
+# A file is split into chunks of consecutive lines, each starting at a
+# toplevel statement and running up to the line before the next one, so
+# that the chunks cover every line of the file. Checks are run on each
+# chunk separately and the summary from each check is kept for each
+# chunk. After an edit, only the chunks covering the edited lines are
+# parsed and checked again, and the errors for the file are found by
+# reducing the summaries of all the chunks.
+#
+# See /LICENCE.md for Copyright information
+"""Incremental linting for editor integrations."""
+
+import bisect
+
+from collections import namedtuple
+
+from cmakeast import ast
+
+from polysquarecmakelinter import linter
+from polysquarecmakelinter import nolint
+from polysquarecmakelinter import util
+
+from polysquarecmakelinter.types import shift_summary
+
+# The result of linting some contents, to be passed to relint after they
+# are edited. errors is a list of (code, LinterFailure) as returned by
+# linter.lint for contents.
+LintState = namedtuple("LintState",
+                       "contents lines chunks errors linter_functions options")
+
+# Lines first to last of a file and a dict of each check's summary for
+# the statements on those lines. unterminated is true if a quote opened
+# on those lines is never closed, in which case the meaning of the lines
+# depends on the lines before them.
+_Chunk = namedtuple("_Chunk", "first last summaries unterminated")
+
+_UNTERMINATED = (ast.TokenType.BeginDoubleQuotedLiteral,
+                 ast.TokenType.BeginSingleQuotedLiteral)
+
+
+class _RegionNotClosed(Exception):
+    """A quote opened in a region is not closed before the region ends."""
+
+
+def _group_statements(statements):
+    """Return lists of statements which start on a different line.
+
+    Statements are grouped if a statement starts on the same line
+    that the previous one ends.
+    """
+    groups = []
+    group_last = 0
+
+    for statement in statements:
+        first, last = util.statement_lines(statement)
+        if groups and first <= group_last:
+            groups[-1].append(statement)
+        else:
+            groups.append([statement])
+
+        group_last = max(group_last, last)
+
+    return groups
+
+
+def _chunks_for_region(lines, first, last, linter_functions, options):
+    """Parse lines first to last and return a list of _Chunk covering them.
+
+    Raises if the lines do not parse on their own, or _RegionNotClosed if
+    they leave a quote open and are not the last lines.
+    """
+    if first > last:
+        return []
+
+    region = lines[first - 1:last]
+    text = "".join(region)
+    tokens = ast.tokenize(text)
+
+    unterminated = any([t.type in _UNTERMINATED for t in tokens])
+    if unterminated and last < len(lines):
+        raise _RegionNotClosed()
+
+    groups = _group_statements(util.parse(text, tokens).statements)
+
+    # Lines before the first statement belong to the first chunk and
+    # lines after the last statement belong to the last chunk
+    starts = [first] + [g[0].line + first - 1 for g in groups[1:]]
+    ends = [s - 1 for s in starts[1:]] + [last]
+
+    chunks = []
+    for group, start, end in zip(groups or [[]], starts, ends):
+        summaries = linter.run_checks(region,
+                                      ast.ToplevelBody(statements=group),
+                                      linter_functions,
+                                      options)
+        chunks.append(_Chunk(start, end, {
+            code: shift_summary(summary, first - 1)
+            for (code, summary) in summaries
+        }, unterminated))
+
+    return chunks
+
+
+def _errors(contents_lines, chunks, linter_functions):
+    """Return errors not suppressed in contents_lines for all chunks."""
+    suppressions = nolint.SuppressionMap(contents_lines)
+    errors = []
+    for code, check in linter_functions.items():
+        summaries = [suppressions.unsuppressed(code, chunk.summaries[code])
+                     for chunk in chunks]
+        for error in check.reduce(summaries):
+            errors.append((code, error))
+
+    return suppressions.filter(errors)
+
+
+def _lint_all(state, contents):
+    """Lint all of contents with the same checks and options as state."""
+    lines = contents.splitlines(True)
+    chunks = _chunks_for_region(lines,
+                                1,
+                                len(lines),
+                                state.linter_functions,
+                                state.options)
+
+    return state._replace(contents=contents,
+                          lines=lines,
+                          chunks=chunks,
+                          errors=_errors(lines,
+                                         chunks,
+                                         state.linter_functions))
+
+
+def lint(contents, whitelist=None, blacklist=None, **kwargs):
+    """Lint contents and return a LintState for it.
+
+    Arguments are as for linter.lint, and the errors in the returned
+    LintState are the same as the errors linter.lint returns.
+    """
+    linter_functions = linter.enabled_linter_functions(whitelist, blacklist)
+    return _lint_all(LintState("", [], [], [], linter_functions, kwargs),
+                     contents)
+
+
+def _chunk_index(chunks, line):
+    """Return the index of the chunk in chunks covering line.
+
+    Lines past the end of the last chunk are covered by the last chunk.
+    """
+    return max(bisect.bisect_right([c.first for c in chunks], line) - 1, 0)
+
+
+def relint(state, contents, first_line, last_line):
+    """Lint contents, an edit of state.contents, and return a new LintState.
+
+    Lines first_line to last_line of contents replace the lines of
+    state.contents from first_line up to the line which ended the edit.
+    If lines were only deleted, last_line is first_line - 1.
+
+    Only the toplevel statements on those lines are parsed and checked
+    again. If they do not parse on their own, for instance because the
+    edit removed the end of a block, the following statements are
+    included as well until they do. The errors in the returned LintState
+    are the same as the errors linter.lint returns for contents.
+    """
+    lines = contents.splitlines(True)
+    chunks = state.chunks
+
+    if not chunks:
+        return _lint_all(state, contents)
+
+    delta = len(lines) - len(state.lines)
+
+    start = _chunk_index(chunks, first_line)
+    end = max(_chunk_index(chunks, last_line - delta), start)
+
+    # An open quote might now be closed by the edited lines, which changes
+    # how everything after it parses
+    if any([c.unterminated for c in chunks[:start] + chunks[end + 1:]]):
+        return _lint_all(state, contents)
+
+    while True:
+        try:
+            region = _chunks_for_region(lines,
+                                        chunks[start].first,
+                                        chunks[end].last + delta,
+                                        state.linter_functions,
+                                        state.options)
+            break
+        except (AssertionError, IndexError, _RegionNotClosed):
+            if end == len(chunks) - 1:
+                raise
+
+            end = min(end + (end - start + 1), len(chunks) - 1)
+
+    suffix = chunks[end + 1:]
+    if delta:
+        suffix = [_Chunk(c.first + delta, c.last + delta, {
+            code: shift_summary(summary, delta)
+            for (code, summary) in c.summaries.items()
+        }, c.unterminated) for c in suffix]
+
+    chunks = chunks[:start] + region + suffix
+
+    return state._replace(contents=contents,
+                          lines=lines,
+                          chunks=chunks,
+                          errors=_errors(lines,
+                                         chunks,
+                                         state.linter_functions))
@@ -0,0 +1,547 @@
+# /polysquarecmakelinter/ir.py
+#
+# Compact representation of a parsed CMake file, which all checks work
+# on. It is built once from the cmakeast tree for a file.
+#
+# Nodes have the same attributes as the cmakeast nodes they are built
+# from, so code written against cmakeast still reads them. Each node also
+# has:
+#
+# kind:     An integer from Kind, which is cheaper to dispatch on than the
+#           name of the class of a cmakeast node.
+# parent:   The node this one is inside, or None for the toplevel.
+# depth:    How many blocks the node is nested in, with the clauses of if
+#           blocks flattened into the block, so that it is the level a
+#           statement should be indented to. The header and footer of a
+#           block are at the same depth as the block.
+# end_line: The last line the node covers, including its footer and
+#           any arguments spanning lines.
+#
+# Nodes use __slots__, so they are smaller than cmakeast's namedtuples
+# and are compared by identity.
+#
+# Built trees can be serialized to a compact binary format, which is
+# much faster to load than parsing the file again and much smaller than
+# a pickle of either tree. It is made of flat arrays with an entry for
+# each node, in the order the nodes appear in the file:
+#
+# kinds:      The kind of each node, one byte each.
+# roles:      Which attribute of its parent the node is, one byte each.
+# word types: The type of each Word, or zero, one byte each.
+# parents:    The index of the parent of each node, or -1.
+# positions:  The line, col, end_line and depth of each node.
+# strings:    The index in the string table of the name of each call and
+#             the contents of each word, or -1.
+#
+# followed by the string table, which is the offset of each string and
+# then the strings themselves, encoded as UTF-8. Each distinct string is
+# only stored once. Arrays are read straight out of the buffer holding
+# the data, which may be an mmap, so only the strings are copied.
+#
+# See /LICENCE.md for Copyright information
+"""Compact representation of a parsed CMake file."""
+
+import struct
+
+from polysquarecmakelinter import util
+
+
+# We use a class with constant variables here so that we can get int->int
+# comparison. Comparing enums is slow because of the type lookup.
+class Kind(object):  # suppress(too-few-public-methods)
+    """The kind of a node."""
+
+    ToplevelBody = 0
+    FunctionCall = 1
+    Word = 2
+    IfBlock = 3
+    IfStatement = 4
+    ElseIfStatement = 5
+    ElseStatement = 6
+    ForeachStatement = 7
+    WhileStatement = 8
+    FunctionDefinition = 9
+    MacroDefinition = 10
+
+
+# Name of the cmakeast class for each kind, indexed by kind
+KIND_NAMES = ("ToplevelBody",
+              "FunctionCall",
+              "Word",
+              "IfBlock",
+              "IfStatement",
+              "ElseIfStatement",
+              "ElseStatement",
+              "ForeachStatement",
+              "WhileStatement",
+              "FunctionDefinition",
+              "MacroDefinition")
+
+# Kind of each cmakeast class name
+KINDS = {name: kind for (kind, name) in enumerate(KIND_NAMES)}
+
+# Kinds of block with a header, a body and a footer
+BLOCK_KINDS = frozenset([Kind.ForeachStatement,
+                         Kind.WhileStatement,
+                         Kind.FunctionDefinition,
+                         Kind.MacroDefinition])
+
+# Kinds of the clauses of an if block
+CLAUSE_KINDS = frozenset([Kind.IfStatement,
+                          Kind.ElseIfStatement,
+                          Kind.ElseStatement])
+
+
+class Node(object):  # suppress(too-few-public-methods)
+    """Attributes which every node has."""
+
+    __slots__ = ("kind", "parent", "depth", "line", "col", "end_line")
+
+    def __init__(self, kind, parent, depth, line, col, end_line):
+        """Initialize common attributes."""
+        super(Node, self).__init__()
+        self.kind = kind
+        self.parent = parent
+        self.depth = depth
+        self.line = line
+        self.col = col
+        self.end_line = end_line
+
+
+class Word(Node):  # suppress(too-few-public-methods)
+    """An argument to a function call."""
+
+    __slots__ = ("type", "contents")
+
+
+class FunctionCall(Node):  # suppress(too-few-public-methods)
+    """A call, which may be the header or footer of a block."""
+
+    __slots__ = ("name", "arguments")
+
+
+class Block(Node):  # suppress(too-few-public-methods)
+    """A foreach, while, function or macro block."""
+
+    __slots__ = ("header", "body", "footer")
+
+
+class Clause(Node):  # suppress(too-few-public-methods)
+    """The if, an elseif or the else clause of an if block."""
+
+    __slots__ = ("header", "body")
+
+
+class IfBlock(Node):  # suppress(too-few-public-methods)
+    """An if block, made of clauses."""
+
+    __slots__ = ("if_statement", "elseif_statements", "else_statement",
+                 "footer")
+
+
+class ToplevelBody(Node):  # suppress(too-few-public-methods)
+    """All the statements in a file."""
+
+    __slots__ = ("statements", )
+
+
+def _end_line(node):
+    """Return the last line covered by node, a cmakeast statement."""
+    if KINDS[node.__class__.__name__] in CLAUSE_KINDS:
+        if node.body:
+            return _end_line(node.body[-1])
+
+        return util.statement_lines(node.header)[1]
+
+    return util.statement_lines(node)[1]
+
+
+def _call(source, parent, depth):
+    """Return a FunctionCall built from source, with its arguments."""
+    node = FunctionCall(Kind.FunctionCall,
+                        parent,
+                        depth,
+                        source.line,
+                        source.col,
+                        source.line)
+    node.name = source.name
+    node.arguments = []
+
+    for argument in source.arguments:
+        word = Word(Kind.Word,
+                    node,
+                    depth,
+                    argument.line,
+                    argument.col,
+                    argument.line + argument.contents.count("\n"))
+        word.type = argument.type
+        word.contents = argument.contents
+        node.arguments.append(word)
+
+        if word.end_line > node.end_line:
+            node.end_line = word.end_line
+
+    return node
+
+
+def _clause(source, parent, depth):
+    """Return a Clause built from source, with its header but no body."""
+    node = Clause(KINDS[source.__class__.__name__],
+                  parent,
+                  depth,
+                  source.line,
+                  source.col,
+                  _end_line(source))
+    node.header = _call(source.header, node, depth)
+    node.body = []
+    return node
+
+
+def _footer_line(source):
+    """Return the line of the footer of source, or its line if it has none."""
+    if source.footer is not None:
+        return source.footer.line
+
+    return source.line
+
+
+def build(abstract_syntax_tree):
+    """Return the representation of abstract_syntax_tree, a cmakeast tree.
+
+    If abstract_syntax_tree is already built, it is returned as it is.
+    The tree is built with an explicit stack rather than by recursion,
+    so that deeply nested blocks cannot exhaust the stack. Calls are
+    built along with their arguments, and headers, footers and clauses
+    along with the statements they belong to, so only statements in
+    bodies go on the stack.
+    """
+    if isinstance(abstract_syntax_tree, Node):
+        return abstract_syntax_tree
+
+    statements = abstract_syntax_tree.statements
+    toplevel = ToplevelBody(Kind.ToplevelBody,
+                            None,
+                            0,
+                            1,
+                            1,
+                            _end_line(statements[-1]) if statements else 1)
+    toplevel.statements = []
+
+    # Each entry is a cmakeast statement to build, its parent, its depth
+    # and the list to append it to. Statements are pushed in reverse, so
+    # that they are appended in order.
+    stack = [(s, toplevel, 0, toplevel.statements)
+             for s in reversed(statements)]
+    while stack:
+        source, parent, depth, target = stack.pop()
+        kind = KINDS[source.__class__.__name__]
+
+        if kind == Kind.FunctionCall:
+            node = _call(source, parent, depth)
+        elif kind in BLOCK_KINDS:
+            node = Block(kind,
+                         parent,
+                         depth,
+                         source.line,
+                         source.col,
+                         _footer_line(source))
+            node.header = _call(source.header, node, depth)
+            node.body = []
+            node.footer = None
+            if source.footer is not None:
+                node.footer = _call(source.footer, node, depth)
+
+            stack.extend([(s, node, depth + 1, node.body)
+                          for s in reversed(source.body)])
+        else:
+            assert kind == Kind.IfBlock
+            node = IfBlock(kind,
+                           parent,
+                           depth,
+                           source.line,
+                           source.col,
+                           _footer_line(source))
+            node.if_statement = _clause(source.if_statement, node, depth)
+            node.elseif_statements = [_clause(c, node, depth)
+                                      for c in source.elseif_statements]
+            node.else_statement = None
+            node.footer = None
+            if source.else_statement is not None:
+                node.else_statement = _clause(source.else_statement,
+                                              node,
+                                              depth)
+
+            if source.footer is not None:
+                node.footer = _call(source.footer, node, depth)
+
+            # The bodies of all clauses are built in order
+            clauses = ([(node.if_statement, source.if_statement)] +
+                       list(zip(node.elseif_statements,
+                                source.elseif_statements)))
+            if source.else_statement is not None:
+                clauses.append((node.else_statement, source.else_statement))
+
+            for clause, clause_source in reversed(clauses):
+                stack.extend([(s, clause, depth + 1, clause.body)
+                              for s in reversed(clause_source.body)])
+
+        target.append(node)
+
+    return toplevel
+
+
+# Which attribute of its parent a node is. Items are appended to the list
+# the parent keeps nodes of their kind in.
+class Role(object):  # suppress(too-few-public-methods)
+    """Which attribute of its parent a node is."""
+
+    Item = 0
+    Header = 1
+    Footer = 2
+    If = 3
+    Else = 4
+
+
+_MAGIC = b"PCMI"
+_FORMAT_VERSION = 1
+
+# Magic, format version, number of nodes, number of strings and length
+# of the encoded strings
+_Header = struct.Struct("<4sBIII")
+
+# Arrays of one byte and four byte entries for each node, in order
+_BYTE_ARRAYS = 3
+_INT_ARRAYS = 6
+
+
+def _children(node):
+    """Return a list of (role, child) for node, in document order."""
+    kind = node.kind
+    if kind == Kind.FunctionCall:
+        return [(Role.Item, a) for a in node.arguments]
+    elif kind == Kind.ToplevelBody:
+        return [(Role.Item, s) for s in node.statements]
+    elif kind in CLAUSE_KINDS:
+        return [(Role.Header, node.header)] + [(Role.Item, s)
+                                               for s in node.body]
+    elif kind == Kind.IfBlock:
+        children = ([(Role.If, node.if_statement)] +
+                    [(Role.Item, c) for c in node.elseif_statements])
+        if node.else_statement is not None:
+            children.append((Role.Else, node.else_statement))
+    elif kind in BLOCK_KINDS:
+        children = ([(Role.Header, node.header)] +
+                    [(Role.Item, s) for s in node.body])
+    else:
+        return []
+
+    if node.footer is not None:
+        children.append((Role.Footer, node.footer))
+
+    return children
+
+
+def serialize(tree):
+    """Serialize tree, a built tree or a cmakeast tree, to bytes."""
+    kinds = []
+    roles = []
+    word_types = []
+    parents = []
+    lines = []
+    cols = []
+    end_lines = []
+    depths = []
+    strings = []
+    string_indices = dict()
+
+    stack = [(build(tree), Role.Item, -1)]
+    while stack:
+        node, role, parent = stack.pop()
+        kind = node.kind
+        index = len(kinds)
+
+        kinds.append(kind)
+        roles.append(role)
+        parents.append(parent)
+        lines.append(node.line)
+        cols.append(node.col)
+        end_lines.append(node.end_line)
+        depths.append(node.depth)
+
+        if kind == Kind.Word:
+            word_types.append(node.type)
+            text = node.contents
+        else:
+            word_types.append(0)
+            text = node.name if kind == Kind.FunctionCall else None
+
+        if text is None:
+            strings.append(-1)
+        else:
+            strings.append(string_indices.setdefault(text,
+                                                     len(string_indices)))
+
+        stack.extend([(c, r, index) for (r, c) in reversed(_children(node))])
+
+    encoded = [None] * len(string_indices)
+    for text, string_index in string_indices.items():
+        encoded[string_index] = text.encode("utf-8")
+
+    offsets = [0]
+    for text in encoded:
+        offsets.append(offsets[-1] + len(text))
+
+    count = len(kinds)
+    return b"".join([
+        _Header.pack(_MAGIC,
+                     _FORMAT_VERSION,
+                     count,
+                     len(encoded),
+                     offsets[-1]),
+        struct.pack("<{0}B".format(count * _BYTE_ARRAYS),
+                    *(kinds + roles + word_types)),
+        struct.pack("<{0}i".format(count * _INT_ARRAYS),
+                    *(parents + lines + cols + end_lines + depths + strings)),
+        struct.pack("<{0}I".format(len(offsets)), *offsets)
+    ] + encoded)
+
+
+def _new_node(kind, parent, depth, line, col, end_line):
+    """Return a node of kind with its attributes empty."""
+    if kind == Kind.Word:
+        return Word(kind, parent, depth, line, col, end_line)
+    elif kind == Kind.FunctionCall:
+        node = FunctionCall(kind, parent, depth, line, col, end_line)
+        node.arguments = []
+    elif kind in CLAUSE_KINDS:
+        node = Clause(kind, parent, depth, line, col, end_line)
+        node.header = None
+        node.body = []
+    elif kind in BLOCK_KINDS:
+        node = Block(kind, parent, depth, line, col, end_line)
+        node.header = None
+        node.body = []
+        node.footer = None
+    elif kind == Kind.IfBlock:
+        node = IfBlock(kind, parent, depth, line, col, end_line)
+        node.if_statement = None
+        node.elseif_statements = []
+        node.else_statement = None
+        node.footer = None
+    elif kind == Kind.ToplevelBody:
+        node = ToplevelBody(kind, parent, depth, line, col, end_line)
+        node.statements = []
+    else:
+        raise ValueError("Serialized tree has unknown kind {0}".format(kind))
+
+    return node
+
+
+def _attach(node, role, parent):
+    """Set node as the attribute of parent that role says it is.
+
+    Raises ValueError if role is unknown and AttributeError if parent
+    has no such attribute.
+    """
+    if role == Role.Header:
+        parent.header = node
+    elif role == Role.Footer:
+        parent.footer = node
+    elif role == Role.If:
+        parent.if_statement = node
+    elif role == Role.Else:
+        parent.else_statement = node
+    elif role != Role.Item:
+        raise ValueError("Serialized tree has unknown role {0}".format(role))
+    elif parent.kind == Kind.FunctionCall:
+        parent.arguments.append(node)
+    elif parent.kind == Kind.ToplevelBody:
+        parent.statements.append(node)
+    elif parent.kind == Kind.IfBlock:
+        parent.elseif_statements.append(node)
+    else:
+        parent.body.append(node)
+
+
+def deserialize(data):
+    """Return the tree serialized in data, which is bytes or a buffer.
+
+    Raises ValueError if data was not written by serialize, or was
+    written by a different version of it.
+    """
+    try:
+        magic, version, count, string_count, string_length = (
+            _Header.unpack_from(data, 0)
+        )
+    except struct.error:
+        raise ValueError("Serialized tree is truncated")
+
+    if magic != _MAGIC or version != _FORMAT_VERSION:
+        raise ValueError("Data is not a serialized tree of this version")
+
+    offset = _Header.size
+    try:
+        byte_arrays = struct.unpack_from("<{0}B".format(count * _BYTE_ARRAYS),
+                                         data,
+                                         offset)
+        offset += count * _BYTE_ARRAYS
+        int_arrays = struct.unpack_from("<{0}i".format(count * _INT_ARRAYS),
+                                        data,
+                                        offset)
+        offset += count * _INT_ARRAYS * 4
+        offsets = struct.unpack_from("<{0}I".format(string_count + 1),
+                                     data,
+                                     offset)
+        offset += (string_count + 1) * 4
+    except struct.error:
+        raise ValueError("Serialized tree is truncated")
+
+    encoded = data[offset:offset + string_length]
+    if len(encoded) != string_length:
+        raise ValueError("Serialized tree is truncated")
+
+    if isinstance(encoded, memoryview):
+        encoded = encoded.tobytes()
+
+    strings = [encoded[offsets[i]:offsets[i + 1]].decode("utf-8")
+               for i in range(0, string_count)]
+
+    nodes = []
+    for index in range(0, count):
+        kind = byte_arrays[index]
+        parent_index = int_arrays[index]
+        if parent_index >= index or (parent_index < 0 and index > 0):
+            raise ValueError("Serialized tree has a node before its parent")
+
+        parent = nodes[parent_index] if parent_index >= 0 else None
+        node = _new_node(kind,
+                         parent,
+                         int_arrays[4 * count + index],
+                         int_arrays[count + index],
+                         int_arrays[2 * count + index],
+                         int_arrays[3 * count + index])
+
+        string_index = int_arrays[5 * count + index]
+        if (kind in (Kind.Word, Kind.FunctionCall) and
+                not 0 <= string_index < string_count):
+            raise ValueError("Serialized tree has a bad string index")
+
+        if kind == Kind.Word:
+            node.type = byte_arrays[2 * count + index]
+            node.contents = strings[string_index]
+        elif kind == Kind.FunctionCall:
+            node.name = strings[string_index]
+
+        if parent is not None:
+            try:
+                _attach(node, byte_arrays[count + index], parent)
+            except AttributeError:
+                raise ValueError("Serialized tree has a node in the wrong "
+                                 "place")
+
+        nodes.append(node)
+
+    if not nodes or nodes[0].kind != Kind.ToplevelBody:
+        raise ValueError("Serialized tree has no toplevel body")
+
+    return nodes[0]
@@ -7,105 +7,351 @@
 
 import argparse
 
+import multiprocessing
+
 import os
 
-import re
+import struct
 
 import sys
 
-from collections import OrderedDict
-
-from cmakeast import ast
+import traceback
 
-from jobstamps import jobstamp
+from collections import OrderedDict
+from collections import namedtuple
 
+from polysquarecmakelinter import analysis
+from polysquarecmakelinter import cache
 from polysquarecmakelinter import check_access as access
 from polysquarecmakelinter import check_correctness as correct
 from polysquarecmakelinter import check_structure as structure
 from polysquarecmakelinter import check_style as style
 from polysquarecmakelinter import check_unused as unused
-from polysquarecmakelinter import ignore
+from polysquarecmakelinter import daemon
+from polysquarecmakelinter import discover
+from polysquarecmakelinter import fix
+from polysquarecmakelinter import ir
+from polysquarecmakelinter import nolint
+from polysquarecmakelinter import project
+from polysquarecmakelinter import report
+from polysquarecmakelinter import timing
+from polysquarecmakelinter import util
+from polysquarecmakelinter import vcs
+from polysquarecmakelinter.types import Check
+from polysquarecmakelinter.types import export_summary
 
-_RE_NOLINT = re.compile(r"^.*#\s+NOLINT:")
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
 
 
 def should_ignore(line, warning):
     """Specify whether or not to ignore warnings on this line."""
-    match = _RE_NOLINT.search(line)
-    if match:
-        try:
-            # Special case, "*" means "all errors"
-            if line[match.end():][0] == "*":
-                return True
-            elif line[match.end():match.end() + len(warning)] == warning:
-                return True
-        except IndexError:  # suppress(pointless-except)
-            pass
+    kind, codes = nolint.line_codes(line)
+    return kind == "" and ("*" in codes or warning in codes)
 
-    return False
 
+_SCOPES = ("set_scopes", "used_scopes")
+_PRIVATES = ("private_calls_and_definitions", )
+_USES = ("variable_uses", )
+_CALLS = ("function_call", )
+_DEFINITIONS = ("function_def", "macro_def")
 
 LINTER_FUNCTIONS = {
-    "structure/namespace": structure.definitions_namespaced,
-    "style/space_before_func": ignore.check_kwargs(style.space_before_call),
-    "style/set_var_case": ignore.check_kwargs(style.set_variables_capitalized),
-    "style/uppercase_args": ignore.check_kwargs(style.uppercase_arguments),
-    "style/lowercase_func": ignore.check_kwargs(style.lowercase_functions),
-    "style/argument_align": ignore.check_kwargs(style.func_args_aligned),
-    "style/doublequotes": ignore.check_kwargs(style.double_outer_quotes),
-    "style/indent": style.calls_indented_correctly,
-    "correctness/quotes": ignore.check_kwargs(correct.path_variables_quoted),
-    "unused/private": ignore.all_but_ast(unused.private_definitions_used),
-    "unused/var_in_func": ignore.all_but_ast(unused.vars_in_func_used),
-    "unused/private_var": ignore.all_but_ast(unused.private_vars_at_toplevel),
-    "access/other_private": ignore.all_but_ast(access.only_use_own_privates),
-    "access/private_var": ignore.all_but_ast(access.only_use_own_priv_vars)
+    "structure/namespace": Check(structure.definitions_namespaced,
+                                 visits=_DEFINITIONS,
+                                 options=("namespace", )),
+    "style/space_before_func": Check(style.space_before_call,
+                                     visits=_CALLS),
+    "style/set_var_case": Check(style.set_variables_capitalized,
+                                visits=_CALLS,
+                                reduce=style.first_violation),
+    "style/uppercase_args": Check(style.uppercase_arguments,
+                                  visits=_DEFINITIONS),
+    "style/lowercase_func": Check(style.lowercase_functions,
+                                  visits=_CALLS + _DEFINITIONS),
+    "style/argument_align": Check(style.func_args_aligned,
+                                  visits=_CALLS),
+    "style/doublequotes": Check(style.double_outer_quotes,
+                                visits=("word", )),
+    "style/indent": Check(style.calls_indented_correctly,
+                          options=("indent", )),
+    "correctness/quotes": Check(correct.path_variables_quoted,
+                                visits=("word", )),
+    "unused/private": Check(unused.summarize_private_definitions,
+                            requires=_PRIVATES + _USES,
+                            reduce=unused.private_definitions_used,
+                            exports=True),
+    "unused/var_in_func": Check(unused.vars_in_func_used,
+                                requires=_SCOPES + _USES),
+    "unused/private_var": Check(unused.summarize_private_vars_at_toplevel,
+                                requires=("toplevel_set_private_vars", ) +
+                                _USES,
+                                reduce=unused.private_vars_at_toplevel,
+                                exports=True),
+    "access/other_private": Check(access.summarize_private_calls,
+                                  requires=_PRIVATES,
+                                  reduce=access.only_use_own_privates,
+                                  exports=True),
+    "access/private_var": Check(access.summarize_private_variable_uses,
+                                requires=_SCOPES + _PRIVATES,
+                                reduce=access.only_use_own_priv_vars,
+                                exports=True)
 }
 
 
+def enabled_linter_functions(whitelist=None, blacklist=None):
+    """Return the LINTER_FUNCTIONS to run for whitelist and blacklist.
+
+    whitelist is a list of checks to only perform, blacklist is list of
+    checks to never perform.
+    """
+    return {
+        k: v for (k, v) in LINTER_FUNCTIONS.items()
+        if ((whitelist is None or k in whitelist) and
+            (blacklist is None or k not in blacklist))
+    }
+
+
+# The checks to run, each with the options it accepts, and everything
+# they need from the analysis context
+_Plan = namedtuple("_Plan", "checks requirements visits")
+
+
+def _plan(linter_functions, options):
+    """Return a _Plan for running linter_functions with options."""
+    checks = linter_functions.values()
+    return _Plan([(code,
+                   check,
+                   {k: v for (k, v) in options.items() if k in check.options})
+                  for (code, check) in linter_functions.items()],
+                 analysis.requirements_of(checks),
+                 analysis.visits_of(checks))
+
+
+def _run_plan(plan, contents_lines, tree, skip, profile):
+    """Run the checks in plan over tree and return their summaries."""
+    profile = profile or timing.NULL_PROFILE
+
+    with profile.timer("phase", "build"):
+        tree = ir.build(tree)
+
+    context = analysis.AnalysisContext(contents_lines,
+                                       tree,
+                                       skip,
+                                       plan.requirements,
+                                       plan.visits,
+                                       profile)
+
+    # Summaries from subscribed checks are filled in once the traversal runs
+    summaries = []
+    for (code, check, options) in plan.checks:
+        context.owner = code
+        with profile.timer("check", code):
+            summaries.append((code, check.function(context, **options)))
+
+    context.owner = None
+
+    if context.visits:
+        with profile.timer("phase", "traverse"):
+            context.traversal.run()
+
+    return summaries
+
+
+def run_checks(contents_lines,
+               tree,
+               linter_functions,
+               options,
+               skip=None,
+               profile=None):
+    """Run linter_functions over tree and return their summaries.
+
+    linter_functions is a dict of codes to Check and tree is a ToplevelBody
+    parsed from contents_lines. Returns a list of (code, summary) in the
+    same order as linter_functions, where each summary is what the Check's
+    function returned.
+
+    The tree is built with ir.build once, and checks only see the built
+    tree. Checks are handed a shared analysis context for it. Checks which
+    visit nodes subscribe to its traversal, so the tree is only walked once
+    no matter how many of them are enabled, and scope trees and other
+    analysis products are only built once no matter how many checks use
+    them. Only the products that enabled checks declare in their Check
+    are built, and each check is only passed the options it declares.
+    """
+    return _run_plan(_plan(linter_functions, options),
+                     contents_lines,
+                     tree,
+                     skip,
+                     profile)
+
+
+class Linter(object):
+    """Lints file contents with checks and options chosen up front.
+
+    Which checks run, the options each of them is passed and the analysis
+    products and handlers they need are worked out when the linter is
+    constructed, so linting many files with the same configuration only
+    does the work which depends on each file.
+    """
+
+    def __init__(self,
+                 whitelist=None,
+                 blacklist=None,
+                 namespace=None,
+                 indent=None):
+        """Initialize with the checks and options to lint with.
+
+        whitelist is a list of checks to only perform, blacklist is list
+        of checks to never perform. namespace and indent are passed to
+        the checks which accept them, if they are given.
+        """
+        super(Linter, self).__init__()
+        self.options = dict()
+        if namespace is not None:
+            self.options["namespace"] = namespace
+
+        if indent is not None:
+            self.options["indent"] = indent
+
+        self.linter_functions = enabled_linter_functions(whitelist,
+                                                         blacklist)
+
+        # Plans keyed by the checks suppressed for a whole file, which is
+        # usually none of them
+        self._plans = {
+            frozenset(): _plan(self.linter_functions, self.options)
+        }
+
+    def _plan_for(self, suppressions):
+        """Return the plan for checks not suppressed in a whole file."""
+        suppressed = frozenset([c for c in self.linter_functions.keys()
+                                if suppressions.suppressed_in_file(c)])
+        try:
+            return self._plans[suppressed]
+        except KeyError:
+            plan = _plan({k: v for (k, v) in self.linter_functions.items()
+                          if k not in suppressed},
+                         self.options)
+            self._plans[suppressed] = plan
+            return plan
+
+    def lint(self,
+             contents,
+             profile=None,
+             module_exports=None,
+             abstract_syntax_tree=None):
+        r"""Lint contents and return a list of (code, LinterFailure).
+
+        Contents should be a raw string with \n. Errors suppressed by
+        NOLINT comments are not returned. Checks which are suppressed for
+        the whole file are not run, and statements inside NOLINT-BEGIN
+        blocks suppressing all enabled checks are not visited.
+
+        Checks are run over the whole file and the summary from each is
+        reduced to its errors.
+
+        If profile, a timing.Profile, is given, the time spent in each
+        phase of linting and in each check is added to it.
+
+        module_exports is a dict of codes to lists of summaries exported
+        by the other files in the same module, as returned by
+        file_exports, which are reduced along with the summary for
+        contents.
+
+        abstract_syntax_tree is the tree parsed from contents, either by
+        cmakeast or built with ir, if it is already known. Otherwise
+        contents are parsed.
+        """
+        profile = profile or timing.NULL_PROFILE
+        module_exports = module_exports or dict()
+
+        with profile.timer("phase", "split"):
+            contents_lines = contents.splitlines(True)
+
+        with profile.timer("phase", "nolint"):
+            suppressions = nolint.SuppressionMap(contents_lines)
+
+        plan = self._plan_for(suppressions)
+        if not plan.checks:
+            return []
+
+        codes = [c[0] for c in plan.checks]
+
+        def _all_suppressed(statement):
+            """Return true if all checks are suppressed for statement."""
+            return suppressions.suppresses_all(codes,
+                                               statement.line,
+                                               statement.end_line)
+
+        if abstract_syntax_tree is None:
+            with profile.timer("phase", "parse"):
+                abstract_syntax_tree = util.parse(contents)
+
+        skip = _all_suppressed if suppressions.has_blocks else None
+        summaries = _run_plan(plan,
+                              contents_lines,
+                              abstract_syntax_tree,
+                              skip,
+                              profile)
+
+        linter_errors = []
+        for (code, check, _), (_, summary) in zip(plan.checks, summaries):
+            summary = suppressions.unsuppressed(code, summary)
+            others = module_exports.get(code, [])
+            for error in check.reduce([summary] + others):
+                linter_errors.append((code, error))
+
+        with profile.timer("phase", "nolint"):
+            return suppressions.filter(linter_errors)
+
+
 def lint(contents,
          whitelist=None,
          blacklist=None,
+         profile=None,
+         module_exports=None,
+         abstract_syntax_tree=None,
          **kwargs):
     r"""Actually lints some file contents.
 
     Contents should be a raw string with \n. whitelist is a list of checks
-    to only perform, blacklist is list of checks to never perform.
+    to only perform, blacklist is list of checks to never perform, and
+    kwargs are the options for a Linter, eg, namespace and indent.
+
+    This constructs a Linter each time it is called. To lint many files
+    with the same checks and options, construct one Linter and call its
+    lint method for each of them instead. See Linter.lint for the other
+    arguments.
     """
-    abstract_syntax_tree = ast.parse(contents)
-    contents_lines = contents.splitlines(True)
-    linter_functions = LINTER_FUNCTIONS
+    return Linter(whitelist, blacklist, **kwargs).lint(contents,
+                                                       profile,
+                                                       module_exports,
+                                                       abstract_syntax_tree)
 
-    def _keyvalue_pair_if(dictionary, condition):
-        """Return a key-value pair in dictionary if condition matched."""
-        return {
-            k: v for (k, v) in dictionary.items() if condition(k)
-        }
 
-    def _check_list(check_list, cond):
-        """Return filter function for cond."""
-        def _check_against_list(key):
-            """Return true if list exists and condition passes."""
-            return cond(check_list, key) if check_list is not None else True
-
-        return _check_against_list
-
-    linter_functions = _keyvalue_pair_if(linter_functions,
-                                         _check_list(whitelist,
-                                                     lambda l, k: k in l))
-    linter_functions = _keyvalue_pair_if(linter_functions,
-                                         _check_list(blacklist,
-                                                     lambda l, k: k not in l))
-
-    linter_errors = []
-    for (code, function) in linter_functions.items():
-        errors = function(contents_lines,
-                          abstract_syntax_tree,
-                          **kwargs)
-        for error in errors:
-            linter_errors.append((code, error))
+def file_exports(contents):
+    """Return a dict of codes to summaries contents exports to its module.
+
+    Only checks which export summaries are run. If contents do not parse,
+    including when they are nested too deeply for the parser, they export
+    nothing, so that the other files in their module can still be linted.
+    """
+    exporting = {k: v for (k, v) in LINTER_FUNCTIONS.items() if v.exports}
+
+    # RuntimeError covers RecursionError from deeply nested contents
+    try:
+        abstract_syntax_tree = util.parse(contents)
+    except (AssertionError, IndexError, RuntimeError):
+        return dict()
 
-    return linter_errors
+    summaries = run_checks(contents.splitlines(True),
+                           abstract_syntax_tree,
+                           exporting,
+                           dict())
+    return {code: export_summary(s) for (code, s) in summaries}
 
 
 # suppress(too-few-public-methods)
@@ -128,7 +374,8 @@ class ShowAvailableChecksAction(argparse.Action):
 
 def _parse_arguments(arguments=None):
     """Return a parser context result."""
-    parser = argparse.ArgumentParser(description="Lint for Polysquare "
+    parser = argparse.ArgumentParser(prog="polysquare-cmake-linter",
+                                     description="Lint for Polysquare "
                                      "style guide")
     parser.add_argument("--checks",
                         nargs=0,
@@ -137,8 +384,18 @@ def _parse_arguments(arguments=None):
     parser.add_argument("files",
                         nargs="*",
                         metavar=("FILE"),
-                        help="read FILE",
+                        help="""read FILE, or every CMakeLists.txt and """
+                             """*.cmake file in FILE if it is a """
+                             """directory""",
                         type=str)
+    parser.add_argument("--exclude",
+                        action="append",
+                        default=[],
+                        metavar="GLOB",
+                        help="""skip files and directories matching GLOB """
+                             """when searching directories, eg build or """
+                             """third_party/*. May be given more than """
+                             """once""")
     parser.add_argument("--whitelist",
                         nargs="*",
                         help="""list of checks that should only be run""",
@@ -160,42 +417,138 @@ def _parse_arguments(arguments=None):
     parser.add_argument("--fix-what-you-can",
                         action="store_true",
                         help="""automatically fix errors""")
+    parser.add_argument("--format",
+                        choices=sorted(report.REPORTERS.keys()),
+                        default="human",
+                        help="""format to report errors in (default: """
+                             """human)""")
+    parser.add_argument("--output",
+                        type=str,
+                        default=None,
+                        metavar="FILE",
+                        help="""write errors to FILE instead of stderr, """
+                             """or stdout for formats other than human""")
+    parser.add_argument("--module-boundary",
+                        choices=project.BOUNDARIES,
+                        default="file",
+                        help="""files which private definitions and """
+                             """variables are shared between. With """
+                             """directory, all CMake files in the same """
+                             """directory can use each other's privates """
+                             """(default: file)""")
+    parser.add_argument("--changed-since",
+                        type=str,
+                        default=None,
+                        metavar="REF",
+                        help="""only lint files which differ from the """
+                             """git revision REF, or are untracked. If """
+                             """no FILE is given, lint all such CMake """
+                             """files""")
+    parser.add_argument("--only-changed-lines",
+                        action="store_true",
+                        help="""only report errors on lines changed """
+                             """since --changed-since""")
     parser.add_argument("--stamp-directory",
                         type=str,
-                        help="""directory to store cached results""")
+                        help="""directory to store cached results and """
+                             """parsed files, which can be shared """
+                             """between checkouts""")
+    parser.add_argument("--cache-max-size",
+                        type=cache.parse_size,
+                        default=None,
+                        metavar="SIZE",
+                        help="""maximum size of cached results, eg 512M. """
+                             """Least recently used results are evicted """
+                             """first""")
+    parser.add_argument("--compact-cache",
+                        action="store_true",
+                        help="""compact the cache in --stamp-directory """
+                             """and exit""")
+    parser.add_argument("--jobs",
+                        "-j",
+                        type=int,
+                        default=None,
+                        help="""number of files to lint in parallel """
+                             """(default: number of CPUs)""")
+    parser.add_argument("--profile",
+                        action="store_true",
+                        help="""report wall and CPU time spent in each """
+                             """phase and check, summed over all files""")
+    parser.add_argument("--profile-output",
+                        type=str,
+                        default=None,
+                        metavar="FILE",
+                        help="""also write --profile times as JSON to """
+                             """FILE""")
+    parser.add_argument("--profile-slowest",
+                        type=int,
+                        default=10,
+                        metavar="N",
+                        help="""number of slowest files to list with """
+                             """--profile""")
+    parser.add_argument("--daemon",
+                        type=str,
+                        default=None,
+                        metavar="SOCKET",
+                        help="""serve lint requests on the Unix domain """
+                             """socket SOCKET until stopped""")
+    parser.add_argument("--connect",
+                        type=str,
+                        default=None,
+                        metavar="SOCKET",
+                        help="""send this command line to the daemon """
+                             """listening on SOCKET, or lint here if """
+                             """it is not running""")
+    parser.add_argument("--stop-daemon",
+                        action="store_true",
+                        help="""stop the daemon given by --connect""")
 
     return parser.parse_args(arguments)
 
 
-def _report_lint_error(error, file_path):
-    """Report a linter error."""
-    line = error[1].line
-    code = error[0]
-    description = error[1].description
-    sys.stderr.write("{0}:{1} [{2}] {3}".format(file_path,
-                                                line,
-                                                code,
-                                                description))
+def _in_lines(errors, lines):
+    """Return errors on lines, a vcs.LineIntervals, or all if it is None."""
+    if lines is None:
+        return errors
+
+    return [e for e in errors if e[1].line in lines]
+
 
+def _report_errors(reporter, results, result, profile, changes):
+    """Report errors in each of results and return how many were unfixed.
 
-def _apply_replacement(error, found_file, file_lines):
-    """Apply a single replacement."""
-    fixed_lines = file_lines
-    fixed_lines[error[1].line - 1] = error[1].replacement
-    concatenated_fixed_lines = "".join(fixed_lines)
+    Only errors on changed lines are reported with --only-changed-lines.
+    """
+    num_errors = 0
+    for linted in results:
+        with (profile or timing.NULL_PROFILE).timer("phase", "report"):
+            lines = None
+            if result.only_changed_lines:
+                lines = changes[os.path.realpath(linted.file_path)]
 
-    # Only fix one error at a time
-    found_file.seek(0)
-    found_file.write(concatenated_fixed_lines)
-    found_file.truncate()
+            for error in _in_lines(linted.fixed, lines):
+                reporter.error(linted.file_path,
+                               error[0],
+                               error[1],
+                               fixed=True)
 
+            for error in _in_lines(linted.errors, lines):
+                reporter.error(linted.file_path, error[0], error[1])
+                num_errors += 1
+
+    return num_errors
 
-def _jobstamps_kwargs(file_path, cache_output_directory):
-    """Create keyword arguments to pass to jobstamps."""
-    return {
-        "jobstamps_dependencies": [file_path],
-        "jobstamps_cache_output_directory": cache_output_directory
-    }
+
+def _open_output(result):
+    """Return the stream that errors should be reported to for result.
+
+    Errors are written to --output if it was given. Otherwise errors
+    in the human format go to stderr and other formats go to stdout.
+    """
+    if result.output is not None:
+        return open(result.output, "w")
+
+    return sys.stderr if result.format == "human" else sys.stdout
 
 
 def _sorted_if_exists(list_object):
@@ -203,52 +556,615 @@ def _sorted_if_exists(list_object):
     return sorted(list_object) if list_object else None
 
 
-def main(arguments=None):
-    """Entry point for the linter."""
-    result = _parse_arguments(arguments)
+def _default_jobs():
+    """Return the default number of jobs, which is the number of CPUs."""
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
 
-    num_errors = 0
-    for found_file_name in result.files:
-        with open(found_file_name, "r+") as found_file:
-            file_path = os.path.abspath(found_file_name)
-            file_contents = found_file.read()
-            file_lines = file_contents.splitlines(True)
+
+_LintJob = namedtuple("_LintJob",
+                      "file_path contents whitelist blacklist kwargs "
+                      "fix lines keys cached profile module_exports "
+                      "tree_key tree")
+_LintResult = namedtuple("_LintResult",
+                         "file_path fixed errors keys new_result profile "
+                         "tree_key new_tree")
+
+
+def _lint_file_job(job):
+    """Lint a single file and return a _LintResult for it.
+
+    job.cached is a dict of codes to the cached errors for some of the
+    enabled checks, which are not run again. The other enabled checks are
+    run and a dict of their codes to the errors they found is returned in
+    new_result, so that they can be cached.
+
+    If job.fix is set, then all errors that can be fixed are fixed and
+    the file is written once with all the fixes applied.
+
+    If job.profile is set, the time spent linting is returned in a
+    timing.Profile as profile.
+
+    If job.tree_key is set, trees are being cached. If job.tree is also
+    set, it is the serialized tree for the file, which is loaded instead
+    of parsing the file. Otherwise the file is parsed and the serialized
+    tree is returned in new_tree so that it can be cached.
+
+    This is run inside the process pool, so it must be a module level
+    function and job must be picklable.
+    """
+    profile = timing.Profile() if job.profile else None
+
+    with (profile or timing.NULL_PROFILE).file_timer(job.file_path):
+        fixed, errors, new_result, new_tree = _lint_and_fix(job, profile)
+
+    return _LintResult(job.file_path,
+                       fixed,
+                       errors,
+                       job.keys,
+                       new_result,
+                       profile,
+                       job.tree_key,
+                       new_tree)
+
+
+def _job_tree(job, profile):
+    """Return a tuple of the tree for job and its serialization if new.
+
+    The tree is None if trees are not being cached, so that lint parses
+    the file itself. Serialized trees which cannot be loaded, because
+    they were written by a different version or were corrupted, are
+    parsed again.
+    """
+    if job.tree_key is None:
+        return (None, None)
+
+    profile = profile or timing.NULL_PROFILE
+    if job.tree is not None:
+        with profile.timer("phase", "load"):
             try:
-                kwargs = OrderedDict()
-                if result.namespace is not None:
-                    kwargs["namespace"] = result.namespace[0]
-
-                if result.indent is not None:
-                    kwargs["indent"] = result.indent[0]
-
-                kwargs.update(_jobstamps_kwargs(file_path,
-                                                result.stamp_directory))
-
-                errors = jobstamp.run(lint,
-                                      file_contents,  # suppress(star-args)
-                                      _sorted_if_exists(result.whitelist),
-                                      _sorted_if_exists(result.blacklist),
-                                      **kwargs)
-            except RuntimeError as err:
-                msg = "RuntimeError in processing {0} - {1}".format(file_path,
-                                                                    str(err))
-                raise RuntimeError(msg)
-
-            for error in errors:
-                if not should_ignore(file_lines[error[1].line - 1], error[0]):
-                    _report_lint_error(error, file_path)
-                    if (result.fix_what_you_can and
-                            error[1].replacement is not None):
-                        _apply_replacement(error, found_file, file_lines)
-                        sys.stderr.write(" ... FIXED\n")
-                        break
-
-                    sys.stderr.write("\n")
-
-                    num_errors += 1
+                return (ir.deserialize(job.tree), None)
+            except (ValueError, IndexError, struct.error):
+                pass
+
+    with profile.timer("phase", "parse"):
+        tree = util.parse(job.contents)
+
+    with profile.timer("phase", "build"):
+        tree = ir.build(tree)
+
+    with profile.timer("phase", "cache"):
+        return (tree, ir.serialize(tree))
+
+
+def _lint_missing(job, profile):
+    """Return a tuple of errors, new_result and new_tree for job.
+
+    Only checks without errors in job.cached are run. Errors are in the
+    same order as if all enabled checks had been run at once, which is
+    grouped by check.
+    """
+    enabled = enabled_linter_functions(job.whitelist, job.blacklist).keys()
+    missing = [c for c in enabled if c not in job.cached]
+    new_result = OrderedDict([(c, []) for c in missing])
+    new_tree = None
+
+    if missing:
+        try:
+            tree, new_tree = _job_tree(job, profile)
+            errors = lint(job.contents,
+                          missing,
+                          None,
+                          profile,
+                          job.module_exports,
+                          tree,
+                          **job.kwargs)
+        except RuntimeError as err:
+            msg = "RuntimeError in processing {0} - {1}".format(job.file_path,
+                                                                str(err))
+            raise RuntimeError(msg)
+
+        for error in errors:
+            new_result[error[0]].append(error)
+
+    errors = [e for c in enabled for e in job.cached.get(c, new_result.get(c))]
+    return (errors, new_result, new_tree)
+
+
+def _lint_and_fix(job, profile):
+    """Return a tuple of errors fixed, errors, new_result and new_tree.
+
+    If job has lines, only errors on those lines are fixed and returned.
+    """
+    errors, new_result, new_tree = _lint_missing(job, profile)
+
+    if not job.fix:
+        return ([], errors, new_result, new_tree)
+
+    def _relint(contents):
+        """Lint contents which have been fixed in memory."""
+        return _in_lines(lint(contents,
+                              job.whitelist,
+                              job.blacklist,
+                              profile,
+                              job.module_exports,
+                              **job.kwargs),
+                         job.lines)
+
+    with (profile or timing.NULL_PROFILE).timer("phase", "fix"):
+        fixed_contents, fixed, errors = fix.to_fixed_point(
+            job.contents,
+            _in_lines(errors, job.lines),
+            _relint
+        )
+        if fixed:
+            with open(job.file_path, "w") as found_file:
+                found_file.write(fixed_contents)
+
+    return (fixed, errors, new_result, new_tree)
+
+
+def _lint_options(result):
+    """Return keyword arguments for lint() from result."""
+    kwargs = OrderedDict()
+    if result.namespace is not None:
+        kwargs["namespace"] = result.namespace[0]
+
+    if result.indent is not None:
+        kwargs["indent"] = result.indent[0]
+
+    return kwargs
+
+
+def _check_keys(linter_functions, kwargs, contents, module_keys=None):
+    """Return a dict of codes to keys for results of linter_functions.
+
+    Each key only depends on contents and the options in kwargs that the
+    check accepts, so options for other checks do not change it.
+    module_keys are the keys of the other files in the same module,
+    from project.ProjectIndex.module_exports, which only change the keys
+    of checks which export summaries.
+    """
+    digest = cache.contents_digest(contents)
+    keys = dict()
+
+    for code, check in linter_functions.items():
+        options = {k: v for (k, v) in kwargs.items() if k in check.options}
+        if check.exports and module_keys:
+            options["module"] = module_keys
+
+        keys[code] = cache.check_key(digest, code, options)
+
+    return keys
+
+
+def _lint_jobs(result, file_paths, stores, profile, index=None,
+               changes=None):
+    """Generate a _LintJob for each of file_paths.
+
+    stores is a tuple of the store for results and the store for trees,
+    either of which may be None. Files are read here and the cached
+    result of each enabled check is looked up in the store for results.
+    If any are missing, cached trees for them are looked up in the store
+    for trees. If index, a project.ProjectIndex, is given, the exports
+    of the other files in the same module are passed to each job. This
+    may run on a different thread to the one that stores new results, so
+    profile must not be used by any other thread. With
+    --only-changed-lines, each job only fixes errors on the lines in
+    changes for its file.
+    """
+    store, tree_store = stores
+    whitelist = _sorted_if_exists(result.whitelist)
+    blacklist = _sorted_if_exists(result.blacklist)
+    linter_functions = enabled_linter_functions(whitelist, blacklist)
+    kwargs = _lint_options(result)
+
+    for file_path in file_paths:
+        with profile.timer("phase", "read"):
+            with open(file_path, "r") as found_file:
+                contents = found_file.read()
+
+        lines = None
+        if result.only_changed_lines:
+            lines = changes[os.path.realpath(file_path)]
+
+        module_keys = None
+        module_exports = None
+        if index is not None:
+            module_keys, module_exports = index.module_exports(file_path)
+
+        keys = None
+        cached = dict()
+        if store is not None:
+            with profile.timer("phase", "cache"):
+                keys = _check_keys(linter_functions,
+                                   kwargs,
+                                   contents,
+                                   module_keys)
+                for code, key in keys.items():
+                    value = store.get(key)
+                    if value is None:
+                        continue
+
+                    # A value which cannot be decoded is a cache miss,
+                    # the check runs again and replaces it.
+                    try:
+                        cached[code] = cache.deserialize_errors(value)
+                    except ValueError:
+                        continue
+
+        tree_key = None
+        tree = None
+        if tree_store is not None and len(cached) < len(linter_functions):
+            with profile.timer("phase", "cache"):
+                tree_key = cache.tree_key(contents)
+                tree = tree_store.get(tree_key)
+
+        yield _LintJob(file_path,
+                       contents,
+                       whitelist,
+                       blacklist,
+                       kwargs,
+                       result.fix_what_you_can,
+                       lines,
+                       keys,
+                       cached,
+                       result.profile,
+                       module_exports,
+                       tree_key,
+                       tree)
+
+
+def _open_store(result, default_store=None):
+    """Return the result CacheStore for result or default_store."""
+    if result.stamp_directory is None:
+        return default_store
+
+    return cache.CacheStore(result.stamp_directory,
+                            "results",
+                            result.cache_max_size)
+
+
+def _open_tree_store(result):
+    """Return the store for parsed trees for result, or None."""
+    if result.stamp_directory is None:
+        return None
+
+    return cache.CacheStore(result.stamp_directory,
+                            "trees",
+                            result.cache_max_size)
+
+
+def _open_index_store(result):
+    """Return the store for the project index for result."""
+    if result.stamp_directory is None:
+        return cache.MemoryStore()
+
+    return cache.CacheStore(result.stamp_directory,
+                            "index",
+                            result.cache_max_size)
+
+
+def _file_paths(result, changes=None):
+    """Generate the absolute path of each file to lint for result.
+
+    If changes, a dict of real paths to vcs.LineIntervals, is given, only
+    files in it are linted. If no files were given to lint, every CMake
+    file in changes is linted.
+    """
+    if changes is not None and not result.files:
+        for path in sorted(changes.keys()):
+            relative = os.path.relpath(path).replace(os.sep, "/")
+            if (discover.is_cmake_file(os.path.basename(path)) and
+                    not discover.excluded(relative, result.exclude)):
+                yield path
+
+        return
+
+    for found_file_name in discover.files(result.files, result.exclude):
+        file_path = os.path.abspath(found_file_name)
+        if changes is None or os.path.realpath(file_path) in changes:
+            yield file_path
+
+
+def _lint_files_in_modules(result, stores, profile, jobs, changes):
+    """Generate a _LintResult for each file in result, in order.
+
+    The project index is refreshed for the modules of all files before
+    any are linted, so files are found before linting starts.
+    """
+    file_paths = list(_file_paths(result, changes))
+    exporting = [k for (k, v) in LINTER_FUNCTIONS.items() if v.exports]
+
+    with _open_index_store(result) as index_store:
+        index = project.ProjectIndex(index_store,
+                                     file_exports,
+                                     exporting,
+                                     result.module_boundary)
+
+        with profile.timer("phase", "index"):
+            if jobs <= 1:
+                index.refresh(file_paths)
+            else:
+                pool = multiprocessing.Pool(jobs)
+                try:
+                    index.refresh(file_paths, pool.map)
+                finally:
+                    pool.terminate()
+                    pool.join()
+
+    lint_jobs = _lint_jobs(result,
+                           file_paths,
+                           stores,
+                           profile,
+                           index,
+                           changes)
+    for linted in _map_lint_jobs(lint_jobs, min(jobs, len(file_paths))):
+        yield linted
+
+
+def _map_lint_jobs(lint_jobs, jobs):
+    """Generate a _LintResult for each of lint_jobs, in order.
+
+    Jobs are run in a process pool if jobs is more than one.
+    """
+    if jobs <= 1:
+        for job in lint_jobs:
+            yield _lint_file_job(job)
+
+        return
+
+    pool = multiprocessing.Pool(jobs)
+    try:
+        # imap returns results in the order that the jobs were submitted,
+        # so errors are reported in the same order as a serial run.
+        for linted in pool.imap(_lint_file_job, lint_jobs):
+            yield linted
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _lint_files_with_stores(result, stores, profile, changes):
+    """Generate a _LintResult for each file in result, in order.
+
+    stores is a tuple of the store for results and the store for trees,
+    either of which may be None.
+
+    Files are linted in a process pool if more than one job was
+    requested and there is more than one file to lint. Directories are
+    walked while files already found are being linted, unless files are
+    in modules bigger than themselves. Time spent reading files and
+    looking up cached results is added to profile.
+    """
+    jobs = result.jobs if result.jobs is not None else _default_jobs()
+    jobs = max(1, jobs)
+
+    if result.module_boundary != "file":
+        for linted in _lint_files_in_modules(result,
+                                             stores,
+                                             profile,
+                                             jobs,
+                                             changes):
+            yield linted
+
+        return
+
+    file_paths = _file_paths(result, changes)
+
+    # The number of files is only known up front if none are directories
+    if changes is not None:
+        file_paths = list(file_paths)
+        jobs = min(jobs, len(file_paths))
+    elif not any([os.path.isdir(f) for f in result.files]):
+        jobs = min(jobs, len(result.files))
+
+    lint_jobs = _lint_jobs(result, file_paths, stores, profile, None, changes)
+    for linted in _map_lint_jobs(lint_jobs, jobs):
+        yield linted
+
+
+def _lint_files(result, profile=None, default_store=None, changes=None):
+    """Generate a _LintResult for each file in result, caching results.
+
+    If profile, a timing.Profile, is given, the time spent on each file
+    is added to it. Results are cached in default_store if there is
+    no --stamp-directory. Parsed trees are only cached if there is a
+    --stamp-directory. If changes, a dict of real paths to
+    vcs.LineIntervals, is given, only files in it are linted.
+    """
+    store = _open_store(result, default_store)
+    tree_store = _open_tree_store(result)
+    jobs_profile = timing.Profile() if profile else timing.NULL_PROFILE
+    profile = profile or timing.NULL_PROFILE
+
+    try:
+        for linted in _lint_files_with_stores(result,
+                                              (store, tree_store),
+                                              jobs_profile,
+                                              changes):
+            if linted.profile is not None:
+                profile.merge(linted.profile)
+
+            if store is not None:
+                with profile.timer("phase", "cache"):
+                    for code, errors in linted.new_result.items():
+                        store.put(linted.keys[code],
+                                  cache.serialize_errors(errors))
+
+            if tree_store is not None and linted.new_tree is not None:
+                with profile.timer("phase", "cache"):
+                    tree_store.put(linted.tree_key, linted.new_tree)
+
+            yield linted
+    finally:
+        with profile.timer("phase", "cache"):
+            for opened in (store, tree_store):
+                if opened is not None:
+                    opened.close()
+
+        if jobs_profile is not timing.NULL_PROFILE:
+            profile.merge(jobs_profile)
+
+
+def _report_profile(result, profile):
+    """Report the times in profile, and write them to a file if asked."""
+    sys.stderr.write(timing.format_table(profile, result.profile_slowest))
+
+    if result.profile_output is not None:
+        with open(result.profile_output, "w") as profile_file:
+            profile_file.write(timing.to_json(profile,
+                                              result.profile_slowest))
+
+
+def _exit_status(code):
+    """Return the exit status for the code of a SystemExit."""
+    if code is None:
+        return 0
+
+    if isinstance(code, int):
+        return code
+
+    sys.stderr.write("{0}\n".format(code))
+    return 1
+
+
+def _run_captured(arguments, cwd, store):
+    """Run main with arguments in cwd, as the daemon.
+
+    Returns a tuple of exit status and what was written to stdout and
+    stderr, which are the same as if the linter had been run directly.
+    """
+    saved = (os.getcwd(), sys.stdout, sys.stderr)
+    sys.stdout = StringIO()
+    sys.stderr = StringIO()
+
+    try:
+        os.chdir(cwd)
+        try:
+            status = main(arguments, store)
+        except SystemExit as exit_request:
+            status = _exit_status(exit_request.code)
+        except Exception:  # suppress(broad-except)
+            sys.stderr.write(traceback.format_exc())
+            status = 1
+
+        return (status, sys.stdout.getvalue(), sys.stderr.getvalue())
+    finally:
+        os.chdir(saved[0])
+        sys.stdout = saved[1]
+        sys.stderr = saved[2]
+
+
+def _serve(socket_path):
+    """Serve lint requests on socket_path, keeping results in memory."""
+    if not daemon.supported():
+        sys.stderr.write("--daemon is not supported on this platform\n")
+        return 1
+
+    # Results are kept for each check, so keep as many files as before
+    store = cache.MemoryStore(4096 * len(LINTER_FUNCTIONS))
+    return daemon.serve(socket_path,
+                        lambda a, cwd: _run_captured(a, cwd, store))
+
+
+def _forward(result, arguments):
+    """Forward arguments to the daemon for result, if it is running.
+
+    Returns the exit status, or None if the daemon could not be reached.
+    """
+    _, arguments = daemon.strip_option(arguments, "--connect")
+    arguments = [a for a in arguments if a != "--stop-daemon"]
+
+    if not daemon.supported():
+        return None
+
+    return daemon.forward(result.connect, arguments, result.stop_daemon)
+
+
+def main(arguments=None, default_store=None):
+    """Entry point for the linter.
+
+    default_store is used to cache results if there is no
+    --stamp-directory, which the daemon uses to keep results in memory.
+    """
+    if arguments is None:
+        arguments = sys.argv[1:]
+
+    result = _parse_arguments(arguments)
+
+    if default_store is not None and (result.daemon or result.connect):
+        sys.stderr.write("--daemon and --connect cannot be sent to "
+                         "a daemon\n")
+        return 1
+
+    if result.daemon is not None:
+        return _serve(result.daemon)
+
+    if result.connect is not None:
+        status = _forward(result, arguments)
+        if status is not None:
+            return status
+
+    if result.stop_daemon:
+        sys.stderr.write("No daemon to stop\n")
+        return 1
+
+    if result.compact_cache:
+        if result.stamp_directory is None:
+            sys.stderr.write("--compact-cache requires --stamp-directory\n")
+            return 1
+
+        with _open_store(result) as store:
+            store.compact()
+
+        with _open_tree_store(result) as tree_store:
+            tree_store.compact()
+
+        return 0
+
+    if result.only_changed_lines and result.changed_since is None:
+        sys.stderr.write("--only-changed-lines requires --changed-since\n")
+        return 1
+
+    changes = None
+    if result.changed_since is not None:
+        try:
+            changes = vcs.changed_lines(result.changed_since)
+        except RuntimeError as error:
+            sys.stderr.write("{0}\n".format(error))
+            return 1
+
+    profile = timing.Profile() if result.profile else None
+    output = _open_output(result)
+    try:
+        reporter = report.reporter(result.format, output)
+        reporter.start(LINTER_FUNCTIONS.keys())
+
+        # Finish even if linting fails part way through, so that errors
+        # already reported are not lost in the buffer
+        try:
+            num_errors = _report_errors(reporter,
+                                        _lint_files(result,
+                                                    profile,
+                                                    default_store,
+                                                    changes),
+                                        result,
+                                        profile,
+                                        changes)
+        finally:
+            reporter.finish()
+    finally:
+        if result.output is not None:
+            output.close()
+
+    if profile is not None:
+        _report_profile(result, profile)
 
     return num_errors
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
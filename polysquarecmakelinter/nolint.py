@@ -0,0 +1,126 @@
+# /polysquarecmakelinter/nolint.py
+#
+# Map of which checks are suppressed on which lines of a file, built by
+# scanning the file once for NOLINT comments.
+#
+# A NOLINT comment takes a comma separated list of checks, or "*" to
+# mean all checks, after the colon:
+#
+# call (ARGUMENT) # NOLINT:style/space_before_func
+#     Suppresses the check on this line only.
+#
+# # NOLINT-BEGIN:unused/private,access/other_private
+# ...
+# # NOLINT-END
+#     Suppresses the checks on all lines between the two comments.
+#     Blocks may be nested, each NOLINT-END ends the innermost block.
+#     A block without a NOLINT-END carries on until the end of the file.
+#
+# # NOLINT-FILE:*
+#     Suppresses the checks for the whole file.
+#
+# See /LICENCE.md for Copyright information
+"""Map of which checks are suppressed on which lines of a file."""
+
+import re
+
+_RE_NOLINT = re.compile(r"^.*#\s+NOLINT(-BEGIN|-END|-FILE)?(:|\s|$)")
+_RE_CODES_END = re.compile(r"\s")
+
+
+def _codes_after(line, start):
+    """Return the set of codes in line from start."""
+    end = _RE_CODES_END.search(line, start)
+    codes = line[start:end.start() if end else len(line)]
+    return set([c for c in codes.split(",") if c])
+
+
+def line_codes(line):
+    """Return the kind of NOLINT comment on line and the codes it names.
+
+    The kind is one of "", "-BEGIN", "-END" and "-FILE", or None if
+    there is no NOLINT comment on the line.
+    """
+    match = _RE_NOLINT.search(line)
+    if not match:
+        return (None, set())
+
+    kind = match.group(1) or ""
+    if match.group(2) != ":":
+        return (kind, set())
+
+    return (kind, _codes_after(line, match.end()))
+
+
+def _covers(codes, code):
+    """Return true if the set of codes covers code."""
+    return "*" in codes or code in codes
+
+
+class SuppressionMap(object):
+    """Which checks are suppressed on which lines of a file."""
+
+    def __init__(self, contents):
+        """Scan contents, a list of lines, for NOLINT comments once."""
+        super(SuppressionMap, self).__init__()
+        self.file_codes = set()
+        self.has_blocks = False
+        self._lines = dict()
+
+        blocks = []
+        active = set()
+
+        for index, line in enumerate(contents):
+            kind, codes = line_codes(line)
+            if kind == "-FILE":
+                self.file_codes |= codes
+            elif kind == "-BEGIN":
+                blocks.append(codes)
+                active = set().union(*blocks)
+                self.has_blocks = True
+            elif kind == "-END" and blocks:
+                blocks.pop()
+                active = set().union(*blocks)
+
+            # The line with NOLINT-BEGIN is covered by the block, but the
+            # line with NOLINT-END is not.
+            suppressed = (codes if kind == "" else set()) | active
+            if suppressed:
+                self._lines[index + 1] = suppressed
+
+    def suppressed(self, code, line):
+        """Return true if code is suppressed on line."""
+        return (_covers(self.file_codes, code) or
+                _covers(self._lines.get(line, ()), code))
+
+    def suppressed_in_file(self, code):
+        """Return true if code is suppressed for the whole file."""
+        return _covers(self.file_codes, code)
+
+    def suppresses_all(self, codes, first, last):
+        """Return true if all codes are suppressed from first to last."""
+        for line in range(first, last + 1):
+            line_codes_set = self._lines.get(line, ())
+            for code in codes:
+                if not (_covers(self.file_codes, code) or
+                        _covers(line_codes_set, code)):
+                    return False
+
+        return True
+
+    def unsuppressed(self, code, summary):
+        """Return summary from the check for code without suppressed errors.
+
+        Summaries which are not lists of errors are returned as they are.
+        Errors are removed before summaries are reduced, so that checks
+        which only report some of their errors report ones which are not
+        suppressed.
+        """
+        if not isinstance(summary, list):
+            return summary
+
+        return [e for e in summary if not self.suppressed(code, e.line)]
+
+    def filter(self, errors):
+        """Return errors, a list of (code, LinterFailure), not suppressed."""
+        return [e for e in errors if not self.suppressed(e[0], e[1].line)]
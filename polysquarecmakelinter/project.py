@@ -0,0 +1,164 @@
+# /polysquarecmakelinter/project.py
+#
+# An index of the names each file in a project exports to the other files
+# in its module, so that checks for private definitions and variables can
+# look across files.
+#
+# Which files make up a module is set by the module boundary. With the
+# "file" boundary each file is a module of its own. With the "directory"
+# boundary, every CMake file in a directory is in the same module.
+#
+# Exports for each file are kept in a store, keyed by the contents of the
+# file, so that only files which changed since the index was last
+# refreshed are parsed again. They are stored as JSON, since the store
+# may be in a directory shared with other users.
+#
+# See /LICENCE.md for Copyright information
+"""An index of the names each file exports to its module."""
+
+import json
+
+import os
+
+from polysquarecmakelinter import cache
+from polysquarecmakelinter import discover
+
+from polysquarecmakelinter.types import decode_export
+from polysquarecmakelinter.types import encode_export
+
+BOUNDARIES = ("file", "directory")
+
+
+def module_members(file_path, boundary):
+    """Return a sorted list of the files in the same module as file_path.
+
+    file_path must be absolute and is always in the list.
+    """
+    if boundary == "file":
+        return [file_path]
+
+    directory = os.path.dirname(file_path)
+    members = set([file_path])
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if discover.is_cmake_file(name) and os.path.isfile(path):
+            members.add(path)
+
+    return sorted(members)
+
+
+def _serialize_exports(exports):
+    """Serialize a dict of codes to exported summaries to bytes."""
+    return json.dumps({code: encode_export(summary)
+                       for (code, summary) in exports.items()},
+                      sort_keys=True).encode("utf-8")
+
+
+def _deserialize_exports(data):
+    """Deserialize bytes from _serialize_exports, or None if invalid.
+
+    The store may be shared with other users, so anything which cannot
+    be decoded is treated as if it was not stored.
+    """
+    try:
+        encoded = json.loads(data.decode("utf-8"))
+        return {code: decode_export(v) for (code, v) in encoded.items()}
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def _read(file_path):
+    """Return the contents of file_path."""
+    with open(file_path, "r") as source:
+        return source.read()
+
+
+class ProjectIndex(object):
+    """Exports of each file, refreshed from a store.
+
+    exports_of is a function taking the contents of a file and returning
+    a dict of codes to summaries from types.export_summary, and codes are
+    the codes of all the checks that export summaries.
+    """
+
+    def __init__(self, store, exports_of, codes, boundary):
+        """Initialize with no files indexed."""
+        super(ProjectIndex, self).__init__()
+        self._store = store
+        self._exports_of = exports_of
+        self._codes = sorted(codes)
+        self._boundary = boundary
+        self._files = dict()
+        self._directories = dict()
+
+    def _members(self, file_path):
+        """Return module_members for file_path, listing directories once."""
+        if self._boundary == "file":
+            return [file_path]
+
+        directory = os.path.dirname(file_path)
+        try:
+            members = self._directories[directory]
+        except KeyError:
+            members = module_members(file_path, self._boundary)
+            self._directories[directory] = members
+
+        if file_path not in members:
+            return sorted(members + [file_path])
+
+        return members
+
+    def refresh(self, file_paths, map_function=map):
+        """Index every file in the same module as each of file_paths.
+
+        Files already indexed are not read again. Files whose contents
+        are in the store are not parsed again. The rest are parsed with
+        map_function, which may run them in parallel.
+        """
+        pending = []
+        for file_path in file_paths:
+            for member in self._members(file_path):
+                if member in self._files:
+                    continue
+
+                contents = _read(member)
+                key = cache.exports_key(contents, self._codes)
+                value = self._store.get(key)
+                exports = None
+                if value is not None:
+                    exports = _deserialize_exports(value)
+
+                if exports is not None:
+                    self._files[member] = (key, exports)
+                else:
+                    # Stop the file being read again if it is in the
+                    # module of more than one of file_paths
+                    self._files[member] = (key, None)
+                    pending.append((member, key, contents))
+
+        computed = map_function(self._exports_of, [p[2] for p in pending])
+        for (member, key, _), exports in zip(pending, computed):
+            self._store.put(key, _serialize_exports(exports))
+            self._files[member] = (key, exports)
+
+    def module_exports(self, file_path):
+        """Return exports of the other files in the module of file_path.
+
+        Returns a tuple of a list of the keys of those files, which
+        changes if any of them change, and a dict of codes to lists
+        of exported summaries, for linter.lint. file_path must have
+        been refreshed.
+        """
+        keys = []
+        exports = dict()
+
+        for member in self._members(file_path):
+            if member == file_path:
+                continue
+
+            key, member_exports = self._files[member]
+            keys.append(key)
+            for code, summary in member_exports.items():
+                exports.setdefault(code, []).append(summary)
+
+        return (keys, exports)
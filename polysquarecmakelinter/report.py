@@ -0,0 +1,221 @@
+# /polysquarecmakelinter/report.py
+#
+# Reporters writing linter errors in human and machine readable formats.
+#
+# Reporters write each error as it is reported, so that errors are never
+# all held in memory at once. Machine readable formats are written
+# through a buffer, so that large runs do not make a system call for
+# each error. Human readable errors are written straight away, so that
+# they stay in order with anything else written to the same stream.
+#
+# See /LICENCE.md for Copyright information
+"""Reporters writing linter errors in different formats."""
+
+import json
+
+from xml.sax.saxutils import quoteattr
+
+from polysquarecmakelinter import __version__
+
+try:
+    from urllib import pathname2url  # suppress(no-name-in-module)
+    from urlparse import urljoin  # suppress(import-error)
+except ImportError:
+    from urllib.request import pathname2url  # suppress(import-error)
+    from urllib.parse import urljoin  # suppress(import-error)
+
+_SARIF_SCHEMA = ("https://raw.githubusercontent.com/oasis-tcs/sarif-spec/"
+                 "master/Schemata/sarif-schema-2.1.0.json")
+
+
+class BufferedWriter(object):
+    """Collects strings and writes them to stream in large pieces."""
+
+    def __init__(self, stream, size=65536):
+        """Initialize to write to stream once size characters are held.
+
+        With a size of zero, text is written as soon as it is given.
+        """
+        super(BufferedWriter, self).__init__()
+        self._stream = stream
+        self._size = size
+        self._pending = []
+        self._pending_size = 0
+
+    def write(self, text):
+        """Write text, which may be held until the buffer is full."""
+        self._pending.append(text)
+        self._pending_size += len(text)
+
+        if self._pending_size >= self._size:
+            self.flush()
+
+    def flush(self):
+        """Write everything held to the stream."""
+        if self._pending:
+            self._stream.write("".join(self._pending))
+            self._pending = []
+            self._pending_size = 0
+
+        self._stream.flush()
+
+
+class _Reporter(object):
+    """Base class for reporters, which write nothing around errors."""
+
+    def __init__(self, writer):
+        """Initialize to write to writer, a BufferedWriter."""
+        super(_Reporter, self).__init__()
+        self._writer = writer
+
+    def start(self, codes):
+        """Start reporting errors for checks with codes."""
+        del codes
+
+    def finish(self):
+        """Finish reporting errors."""
+        self._writer.flush()
+
+
+class HumanReporter(_Reporter):
+    """Writes one line for each error, for people to read."""
+
+    def error(self, file_path, code, failure, fixed=False):
+        """Report failure for check code in file_path."""
+        self._writer.write("{0}:{1} [{2}] {3}{4}\n".format(
+            file_path,
+            failure.line,
+            code,
+            failure.description,
+            " ... FIXED" if fixed else ""
+        ))
+
+
+class JSONLinesReporter(_Reporter):
+    """Writes a JSON object on a line of its own for each error."""
+
+    def error(self, file_path, code, failure, fixed=False):
+        """Report failure for check code in file_path."""
+        self._writer.write(json.dumps({
+            "file": file_path,
+            "line": failure.line,
+            "code": code,
+            "description": failure.description,
+            "fixed": fixed
+        }, sort_keys=True) + "\n")
+
+
+def _file_uri(file_path):
+    """Return a URI for file_path, which is absolute."""
+    return urljoin("file:", pathname2url(file_path))
+
+
+class SARIFReporter(_Reporter):
+    """Writes a SARIF 2.1.0 log with a result for each error."""
+
+    def __init__(self, writer):
+        """Initialize to write to writer, a BufferedWriter."""
+        super(SARIFReporter, self).__init__(writer)
+        self._separator = ""
+
+    def start(self, codes):
+        """Start reporting errors for checks with codes."""
+        driver = {
+            "name": "polysquare-cmake-linter",
+            "version": __version__,
+            "rules": [{"id": code} for code in sorted(codes)]
+        }
+
+        # Results are written as they are reported, inside this header
+        self._writer.write("{{\"$schema\": {0}, \"version\": \"2.1.0\", "
+                           "\"runs\": [{{\"tool\": {{\"driver\": {1}}}, "
+                           "\"results\": [\n".format(
+                               json.dumps(_SARIF_SCHEMA),
+                               json.dumps(driver, sort_keys=True)
+                           ))
+
+    def error(self, file_path, code, failure, fixed=False):
+        """Report failure for check code in file_path."""
+        location = {
+            "physicalLocation": {
+                "artifactLocation": {"uri": _file_uri(file_path)},
+                "region": {"startLine": failure.line}
+            }
+        }
+        result = {
+            "ruleId": code,
+            "level": "note" if fixed else "warning",
+            "message": {"text": failure.description},
+            "locations": [location],
+            "properties": {"fixed": fixed}
+        }
+
+        self._writer.write(self._separator +
+                           json.dumps(result, sort_keys=True))
+        self._separator = ",\n"
+
+    def finish(self):
+        """Finish reporting errors."""
+        self._writer.write("\n]}]}\n")
+        self._writer.flush()
+
+
+class CheckstyleReporter(_Reporter):
+    """Writes checkstyle XML, with errors grouped by file.
+
+    Errors for each file must be reported together.
+    """
+
+    def __init__(self, writer):
+        """Initialize to write to writer, a BufferedWriter."""
+        super(CheckstyleReporter, self).__init__(writer)
+        self._file_path = None
+
+    def start(self, codes):
+        """Start reporting errors for checks with codes."""
+        del codes
+        self._writer.write("<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n"
+                           "<checkstyle version=\"4.3\">\n")
+
+    def error(self, file_path, code, failure, fixed=False):
+        """Report failure for check code in file_path."""
+        if file_path != self._file_path:
+            if self._file_path is not None:
+                self._writer.write("</file>\n")
+
+            self._writer.write("<file name={0}>\n".format(
+                quoteattr(file_path)
+            ))
+            self._file_path = file_path
+
+        severity = "info" if fixed else "warning"
+        self._writer.write("<error line=\"{0}\" severity={1} message={2} "
+                           "source={3}/>\n".format(failure.line,
+                                                   quoteattr(severity),
+                                                   quoteattr(failure
+                                                             .description),
+                                                   quoteattr(code)))
+
+    def finish(self):
+        """Finish reporting errors."""
+        if self._file_path is not None:
+            self._writer.write("</file>\n")
+
+        self._writer.write("</checkstyle>\n")
+        self._writer.flush()
+
+
+REPORTERS = {
+    "human": HumanReporter,
+    "jsonl": JSONLinesReporter,
+    "sarif": SARIFReporter,
+    "checkstyle": CheckstyleReporter
+}
+
+
+def reporter(report_format, stream):
+    """Return a reporter for report_format writing to stream."""
+    if report_format == "human":
+        return HumanReporter(BufferedWriter(stream, size=0))
+
+    return REPORTERS[report_format](BufferedWriter(stream))
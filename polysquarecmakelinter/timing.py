@@ -0,0 +1,196 @@
+# /polysquarecmakelinter/timing.py
+#
+# Wall and CPU time spent in each phase of linting and in each check,
+# summed over all files, for the --profile option.
+#
+# Timers nest. The time recorded for a timer excludes the time spent in
+# any timers started inside it, so that, for example, a scope tree built
+# on first use by a check is counted against the scope tree and not the
+# check, and handlers run during the traversal are counted against their
+# check and not the traversal.
+#
+# See /LICENCE.md for Copyright information
+"""Wall and CPU time spent in each phase of linting and in each check."""
+
+import json
+
+import time
+
+import timeit
+
+from contextlib import contextmanager
+
+try:
+    _cpu_time = time.process_time  # suppress(invalid-name)
+except AttributeError:
+    _cpu_time = time.clock  # suppress(invalid-name,no-member)
+
+_wall_time = timeit.default_timer  # suppress(invalid-name)
+
+
+class Profile(object):
+    """Time spent in named timers, grouped by kind, and on each file.
+
+    Each timer is identified by a kind, such as "phase", "analysis" or
+    "check", and a name within that kind. Profiles are picklable so that
+    they can be returned from worker processes and merged.
+    """
+
+    def __init__(self):
+        """Initialize with nothing timed."""
+        super(Profile, self).__init__()
+        self.totals = dict()
+        self.files = dict()
+        self._stack = []
+
+    def add(self, kind, name, wall, cpu, calls=1):
+        """Add wall and CPU seconds to the timer for kind and name."""
+        try:
+            total = self.totals[(kind, name)]
+        except KeyError:
+            total = [0.0, 0.0, 0]
+            self.totals[(kind, name)] = total
+
+        total[0] += wall
+        total[1] += cpu
+        total[2] += calls
+
+    def start(self, kind, name):
+        """Start the timer for kind and name."""
+        self._stack.append([kind, name, _wall_time(), _cpu_time(), 0.0, 0.0])
+
+    def stop(self):
+        """Stop the most recently started timer and record its time."""
+        kind, name, wall, cpu, child_wall, child_cpu = self._stack.pop()
+        wall = _wall_time() - wall
+        cpu = _cpu_time() - cpu
+        self.add(kind, name, wall - child_wall, cpu - child_cpu)
+
+        if self._stack:
+            self._stack[-1][4] += wall
+            self._stack[-1][5] += cpu
+
+    @contextmanager
+    def timer(self, kind, name):
+        """Context manager timing its body with the timer kind and name."""
+        self.start(kind, name)
+        try:
+            yield
+        finally:
+            self.stop()
+
+    def timed(self, kind, name, function):
+        """Return function wrapped to be timed with the timer kind and name."""
+        def _timed(*args, **kwargs):
+            """Call function with timer started."""
+            self.start(kind, name)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.stop()
+
+        return _timed
+
+    @contextmanager
+    def file_timer(self, file_path):
+        """Context manager adding the wall time of its body to file_path."""
+        start = _wall_time()
+        try:
+            yield
+        finally:
+            self.add_file(file_path, _wall_time() - start)
+
+    def add_file(self, file_path, wall):
+        """Add wall seconds spent on file_path."""
+        self.files[file_path] = self.files.get(file_path, 0.0) + wall
+
+    def merge(self, other):
+        """Add all the times in profile other to this one."""
+        for (kind, name), (wall, cpu, calls) in other.totals.items():
+            self.add(kind, name, wall, cpu, calls)
+
+        for file_path, wall in other.files.items():
+            self.add_file(file_path, wall)
+
+    def rows(self):
+        """Return a list of (kind, name, wall, cpu, calls), slowest first."""
+        rows = [(kind, name, wall, cpu, calls)
+                for (kind, name), (wall, cpu, calls) in self.totals.items()]
+        return sorted(rows, key=lambda r: (-r[2], r[0], r[1]))
+
+    def slowest_files(self, count):
+        """Return a list of the count slowest (file_path, wall)."""
+        return sorted(self.files.items(), key=lambda f: (-f[1], f[0]))[:count]
+
+    def __getstate__(self):
+        """Pickle without the stack of running timers."""
+        return (self.totals, self.files)
+
+    def __setstate__(self, state):
+        """Unpickle with no running timers."""
+        self.totals, self.files = state
+        self._stack = []
+
+
+class _NullProfile(object):
+    """A profile which does not time anything."""
+
+    @contextmanager
+    def timer(self, kind, name):  # suppress(no-self-use)
+        """Do nothing for the body."""
+        del kind
+        del name
+
+        yield
+
+    def timed(self, kind, name, function):  # suppress(no-self-use)
+        """Return function unwrapped."""
+        del kind
+        del name
+
+        return function
+
+    @contextmanager
+    def file_timer(self, file_path):  # suppress(no-self-use)
+        """Do nothing for the body."""
+        del file_path
+
+        yield
+
+
+NULL_PROFILE = _NullProfile()
+
+
+def format_table(profile, slowest=10):
+    """Return a table of the times in profile and its slowest files."""
+    lines = ["{0:<10} {1:<32} {2:>10} {3:>10} {4:>8}\n".format("kind",
+                                                               "name",
+                                                               "wall (s)",
+                                                               "cpu (s)",
+                                                               "calls")]
+    for row in profile.rows():
+        lines.append("{0:<10} {1:<32} {2:>10.4f} {3:>10.4f} {4:>8}\n"
+                     .format(*row))
+
+    files = profile.slowest_files(slowest)
+    if files:
+        lines.append("\nslowest files:\n")
+        for file_path, wall in files:
+            lines.append("{0:>10.4f} {1}\n".format(wall, file_path))
+
+    return "".join(lines)
+
+
+def to_json(profile, slowest=10):
+    """Return the times in profile and its slowest files as JSON."""
+    return json.dumps({
+        "timers": [
+            {"kind": kind, "name": name, "wall": wall, "cpu": cpu,
+             "calls": calls}
+            for kind, name, wall, cpu, calls in profile.rows()
+        ],
+        "slowest_files": [
+            {"file": file_path, "wall": wall}
+            for file_path, wall in profile.slowest_files(slowest)
+        ]
+    }, indent=2, sort_keys=True)
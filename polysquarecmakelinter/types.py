@@ -22,3 +22,118 @@ class LinterFailure(namedtuple("LinterFailure",
                                                  description,
                                                  line,
                                                  replacement)
+
+
+def all_errors(summaries):
+    """Return all the errors in summaries, which are lists of errors."""
+    return [error for summary in summaries for error in summary]
+
+
+# suppress(too-few-public-methods)
+class Check(namedtuple("Check",
+                       "function requires visits options reduce exports")):
+    """An immutable type describing a check and what it needs to run.
+
+    function is called with the AnalysisContext for a file, or for some of
+    the toplevel statements in a file, and the options it accepts as
+    keyword arguments, and returns a summary. reduce is called with the
+    summaries for consecutive statements, in order, and returns a list
+    of LinterFailure for all of those statements.
+
+    By default, summaries are lists of LinterFailure and reduce joins
+    them, which suits checks where the errors for each toplevel statement
+    only depend on that statement. Other summaries are namedtuples where
+    each field which is a list holds (name, line) tuples.
+
+    requires is the set of AnalysisContext products that function uses,
+    visits is the set of engine.Traversal handlers it subscribes to and
+    options is the set of keyword arguments it accepts.
+
+    exports is true if the summaries from other files in the same module
+    are reduced along with the summary for a file, with their lines
+    removed by export_summary, so that names defined or used in one file
+    of a module count for all of its files.
+    """
+
+    def __new__(cls,
+                function,
+                requires=None,
+                visits=None,
+                options=None,
+                reduce=None,
+                exports=False):
+        """Create a Check which by default requires and visits nothing."""
+        return super(Check, cls).__new__(cls,
+                                         function,
+                                         frozenset(requires or ()),
+                                         frozenset(visits or ()),
+                                         frozenset(options or ()),
+                                         reduce or all_errors,
+                                         exports)
+
+
+def shift_summary(summary, delta):
+    """Return summary from a Check with all lines moved by delta."""
+    if isinstance(summary, list):
+        return [e._replace(line=e.line + delta) for e in summary]
+
+    shifted = {
+        field: [(name, line + delta) for (name, line) in value]
+        for (field, value) in zip(summary._fields, summary)
+        if isinstance(value, list) and value
+    }
+
+    return summary._replace(**shifted) if shifted else summary
+
+
+def export_summary(summary):
+    """Return summary without anything relating to lines in its file.
+
+    What is left can be reduced along with the summaries for another
+    file without causing errors on lines in this one.
+    """
+    if isinstance(summary, list):
+        return []
+
+    return summary._replace(**{
+        field: [] for (field, value) in zip(summary._fields, summary)
+        if isinstance(value, list)
+    })
+
+
+# Types of summaries decoded by decode_export, by name and fields
+_EXPORTED_TYPES = dict()
+
+
+def encode_export(summary):
+    """Return summary from export_summary as a value json can serialize.
+
+    Fields which are lists are always empty once exported, so they are
+    stored as None. The other fields are sets of names.
+    """
+    if isinstance(summary, list):
+        return None
+
+    return [type(summary).__name__,
+            list(summary._fields),
+            [None if isinstance(value, list) else sorted(value)
+             for value in summary]]
+
+
+def decode_export(value):
+    """Return the exported summary value was encoded from.
+
+    The summary is a namedtuple with the same name and fields as the one
+    it was encoded from. Raises ValueError or TypeError if value was not
+    returned by encode_export.
+    """
+    if value is None:
+        return []
+
+    name, fields, values = value
+    key = (str(name), tuple([str(f) for f in fields]))
+    if key not in _EXPORTED_TYPES:
+        _EXPORTED_TYPES[key] = namedtuple(*key)
+
+    return _EXPORTED_TYPES[key](*[[] if names is None else set(names)
+                                  for names in values])
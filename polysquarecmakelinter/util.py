@@ -5,8 +5,38 @@
 # See /LICENCE.md for Copyright information
 """Utility functions shared amongst checks."""
 
+import sys
+
+import threading
+
+from collections import OrderedDict
+
+from cmakeast import ast
 from cmakeast.ast import WordType
 
+_BLOCK_STARTS = frozenset(["if", "foreach", "while", "function", "macro"])
+_BLOCK_ENDS = frozenset(["endif",
+                         "endforeach",
+                         "endwhile",
+                         "endfunction",
+                         "endmacro"])
+
+# cmakeast parses nested blocks recursively, using no more than this many
+# stack frames for each level of nesting, on top of the frames everything
+# else needs.
+_FRAMES_PER_BLOCK = 4
+_BASE_RECURSION_LIMIT = sys.getrecursionlimit()
+
+# The recursion limit is never raised above this, so that files nested
+# too deeply for the stack raise RecursionError instead of crashing.
+_MAX_RECURSION_LIMIT = 50000
+
+# Recursion limits needed by each parse in progress, and the limit from
+# before any of them started, which is restored when they are all done.
+_RECURSION_LOCK = threading.Lock()
+_NEEDED_LIMITS = []
+_RESTORED_LIMIT = [None]
+
 
 def replace_word(line, start, word, replacement):
     """Helper function to replace a word starting at start with replacement."""
@@ -18,7 +48,90 @@ def is_word_sink_variable(word_type):
     return word_type in [WordType.Variable, WordType.String]
 
 
+def group_lines(pairs):
+    """Return an OrderedDict of each name in (name, line) pairs to its lines.
+
+    Names are in the order they first appear in pairs.
+    """
+    grouped = OrderedDict()
+    for name, line in pairs:
+        grouped.setdefault(name, []).append(line)
+
+    return grouped
+
+
+def statement_lines(node):
+    """Return the first and last lines of a statement node."""
+    footer = getattr(node, "footer", None)
+    if footer is not None:
+        return (node.line, footer.line)
+
+    last = node.line
+    for argument in getattr(node, "arguments", ()):
+        last = max(last, argument.line + argument.contents.count("\n"))
+
+    return (node.line, last)
+
+
 def is_word_maybe_path(word_type):
     """Return true if this word might be an unquoted path."""
     return word_type in [WordType.VariableDereference,
                          WordType.CompoundLiteral]
+
+
+def _block_depth(tokens):
+    """Return how deeply blocks are nested in tokens."""
+    depth = 0
+    deepest = 0
+    for index in range(0, len(tokens) - 1):
+        token = tokens[index]
+        if (token.type != ast.TokenType.Word or
+                tokens[index + 1].type != ast.TokenType.LeftParen):
+            continue
+
+        name = token.content.lower()
+        if name in _BLOCK_STARTS:
+            depth += 1
+            deepest = max(deepest, depth)
+        elif name in _BLOCK_ENDS:
+            depth -= 1
+
+    return deepest
+
+
+def _raise_recursion_limit(needed):
+    """Raise the recursion limit to needed for a parse in progress."""
+    with _RECURSION_LOCK:
+        if not _NEEDED_LIMITS:
+            _RESTORED_LIMIT[0] = sys.getrecursionlimit()
+
+        _NEEDED_LIMITS.append(needed)
+        sys.setrecursionlimit(max(_NEEDED_LIMITS + [_RESTORED_LIMIT[0]]))
+
+
+def _restore_recursion_limit(needed):
+    """Lower the recursion limit once a parse which needed it is done."""
+    with _RECURSION_LOCK:
+        _NEEDED_LIMITS.remove(needed)
+        sys.setrecursionlimit(max(_NEEDED_LIMITS + [_RESTORED_LIMIT[0]]))
+
+
+def parse(contents, tokens=None):
+    """Return the abstract syntax tree for contents, however deeply nested.
+
+    The recursion limit is raised so that cmakeast, which parses nested
+    blocks recursively, has enough stack frames for the nesting in
+    contents, up to _MAX_RECURSION_LIMIT. It is restored once no other
+    thread is parsing.
+    """
+    if tokens is None:
+        tokens = ast.tokenize(contents)
+
+    needed = min(_BASE_RECURSION_LIMIT +
+                 _block_depth(tokens) * _FRAMES_PER_BLOCK,
+                 _MAX_RECURSION_LIMIT)
+    _raise_recursion_limit(needed)
+    try:
+        return ast.parse(contents, tokens)
+    finally:
+        _restore_recursion_limit(needed)
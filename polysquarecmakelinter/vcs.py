@@ -0,0 +1,173 @@
+# /polysquarecmakelinter/vcs.py
+#
+# Find which files and lines changed since a git revision, using the git
+# command line tool, so that only those need to be linted.
+#
+# See /LICENCE.md for Copyright information
+"""Find which files and lines changed since a git revision."""
+
+import bisect
+
+import os
+
+import re
+
+import subprocess
+
+_HUNK_HEADER = re.compile(r"^@@ -\d+(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+# Escapes git uses in quoted paths, other than octal escapes
+_PATH_ESCAPES = {
+    "a": b"\a",
+    "b": b"\b",
+    "t": b"\t",
+    "n": b"\n",
+    "v": b"\v",
+    "f": b"\f",
+    "r": b"\r",
+    "\"": b"\"",
+    "\\": b"\\"
+}
+
+
+class LineIntervals(object):
+    """A set of lines made of closed intervals, for fast lookups."""
+
+    def __init__(self, intervals):
+        """Initialize from an iterable of (first, last) line intervals."""
+        super(LineIntervals, self).__init__()
+        self._firsts = []
+        self._lasts = []
+
+        for first, last in sorted(intervals):
+            if self._lasts and first <= self._lasts[-1] + 1:
+                self._lasts[-1] = max(self._lasts[-1], last)
+            else:
+                self._firsts.append(first)
+                self._lasts.append(last)
+
+    def __contains__(self, line):
+        """Return true if line is in one of the intervals."""
+        index = bisect.bisect_right(self._firsts, line) - 1
+        return index >= 0 and line <= self._lasts[index]
+
+    def intervals(self):
+        """Return a list of the merged (first, last) intervals, in order."""
+        return list(zip(self._firsts, self._lasts))
+
+
+# Every line of a file which is new since the revision
+ALL_LINES = LineIntervals([(1, float("inf"))])
+
+
+def _git(arguments, cwd):
+    """Return the output of running git with arguments in cwd."""
+    try:
+        output = subprocess.check_output(["git"] + arguments,
+                                         cwd=cwd,
+                                         stderr=subprocess.PIPE)
+    except (OSError, subprocess.CalledProcessError) as error:
+        command = " ".join(arguments)
+        raise RuntimeError("git {0} failed: {1}".format(command, str(error)))
+
+    return output.decode("utf-8")
+
+
+def _unquote(path):
+    """Return path from a diff header with git's quoting removed.
+
+    Paths with unusual characters are quoted like C strings, with bytes
+    which are not printable written as octal escapes. Paths with spaces
+    in them are followed by a tab.
+    """
+    if path.endswith("\t"):
+        path = path[:-1]
+
+    if not (len(path) > 1 and path.startswith("\"") and
+            path.endswith("\"")):
+        return path
+
+    unquoted = []
+    index = 1
+    while index < len(path) - 1:
+        character = path[index]
+        if character != "\\":
+            unquoted.append(character.encode("utf-8"))
+            index += 1
+        elif path[index + 1] in _PATH_ESCAPES:
+            unquoted.append(_PATH_ESCAPES[path[index + 1]])
+            index += 2
+        else:
+            unquoted.append(bytearray([int(path[index + 1:index + 4], 8)]))
+            index += 4
+
+    return b"".join([bytes(b) for b in unquoted]).decode("utf-8")
+
+
+def parse_diff(diff, toplevel):
+    """Return a dict of paths to LineIntervals of lines added in diff.
+
+    diff is the output of git diff with no context lines, and toplevel
+    is the directory that paths in it are relative to. Deleted files
+    are not included and files where lines were only removed have no
+    lines.
+    """
+    changed = dict()
+    intervals = None
+
+    # Lines left in the current hunk, which might look like headers
+    in_hunk = 0
+
+    for line in diff.splitlines():
+        if in_hunk:
+            if not line.startswith("\\"):
+                in_hunk -= 1
+        elif line.startswith("+++ "):
+            intervals = None
+            path = _unquote(line[4:])
+            if path != "/dev/null":
+                intervals = []
+                # Paths are prefixed with b/ for the new side of the diff,
+                # which changed_lines asks for explicitly
+                changed[os.path.join(toplevel, path[2:])] = intervals
+        elif intervals is not None:
+            match = _HUNK_HEADER.match(line)
+            if match is not None:
+                first = int(match.group(2))
+                count = int(match.group(3) or 1)
+                if count:
+                    intervals.append((first, first + count - 1))
+
+                in_hunk = int(match.group(1) or 1) + count
+
+    return {p: LineIntervals(i) for (p, i) in changed.items()}
+
+
+def changed_lines(revision, cwd=None):
+    """Return a dict of files changed since revision to the lines changed.
+
+    Paths are real paths, with symbolic links resolved. Files that are
+    not tracked by git, but not ignored by it either, are new since
+    revision, so all of their lines are changed.
+    """
+    cwd = cwd or os.getcwd()
+    toplevel = _git(["rev-parse", "--show-toplevel"], cwd).strip()
+
+    changed = parse_diff(_git(["-c", "core.quotePath=false",
+                               "diff",
+                               "--unified=0",
+                               "--no-color",
+                               "--no-ext-diff",
+                               "--src-prefix=a/",
+                               "--dst-prefix=b/",
+                               revision,
+                               "--"], cwd), toplevel)
+
+    for path in _git(["ls-files",
+                      "--others",
+                      "--exclude-standard",
+                      "-z"], toplevel).split("\0"):
+        if path:
+            changed[os.path.join(toplevel, path)] = ALL_LINES
+
+    return {os.path.realpath(p): i for (p, i) in changed.items()}
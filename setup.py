@@ -28,15 +28,16 @@ setup(name="polysquare-cmake-linter",
                    "License :: OSI Approved :: MIT License"],
       license="MIT",
       keywords="development linters",
-      packages=find_packages(exclude=["tests"]),
-      install_requires=["cmakeast>=0.0.7",
-                        "jobstamps>=0.0.16"],
+      packages=find_packages(exclude=["tests", "benchmarks"]),
+      install_requires=["cmakeast>=0.0.7"],
       extras_require={
           "upload": ["setuptools-markdown"]
       },
       entry_points={
           "console_scripts": [
-              "polysquare-cmake-linter=polysquarecmakelinter.linter:main"
+              "polysquare-cmake-linter=polysquarecmakelinter.linter:main",
+              ("polysquare-cmake-linter-client="
+               "polysquarecmakelinter.daemon:client_main")
           ]
       },
       test_suite="nose.collector",
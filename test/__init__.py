@@ -2,7 +2,3 @@
 #
 # See /LICENCE.md for Copyright information
 """Entry point for tests."""
-
-import os
-
-os.environ["JOBSTAMPS_DISABLED"] = "1"
@@ -6,14 +6,30 @@
 # See /LICENCE.md for Copyright information
 """Test cases for usage of polysquarecmakelinter.main()."""
 
+import json
+
 import os
 
+import shutil
+
+import subprocess
+
+import sys
+
 import tempfile
 
+from polysquarecmakelinter import cache
+from polysquarecmakelinter import ir
 from polysquarecmakelinter import linter
+from polysquarecmakelinter import util
 
 from testtools import TestCase
 
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
 
 def run_linter_main(filename, *args, **kwargs):
     """Run linter.main() (as an integration test)."""
@@ -149,6 +165,76 @@ class TestLinterAcceptance(TestCase):
 
         self.assertEqual(result, 1)
 
+    def test_toplevel_conditionals_and_loops(self):
+        """Check that top level if and while blocks lint with all checks."""
+        contents = ("if (CONDITION)\n"
+                    "    message (\"if\")\n"
+                    "elseif (OTHER)\n"
+                    "    message (\"elseif\")\n"
+                    "else ()\n"
+                    "    message (\"else\")\n"
+                    "endif ()\n"
+                    "while (CONDITION)\n"
+                    "endwhile ()\n")
+
+        with os.fdopen(self._temporary_file[0], "a+") as process_file:
+            process_file.write(contents)
+
+        self.patch(sys, "stderr", StringIO())
+        self.assertEqual(run_linter_main(self._temporary_file[1]), 0)
+
+    def test_output_format(self):
+        """Check that errors are written to --output in --format."""
+        handle, output = tempfile.mkstemp()
+        os.close(handle)
+        self.addCleanup(os.remove, output)
+
+        with os.fdopen(self._temporary_file[0], "a+") as process_file:
+            process_file.write("function_call()\n")
+
+        result = run_linter_main(self._temporary_file[1],
+                                 whitelist=["style/space_before_func"],
+                                 format="jsonl",
+                                 output=output)
+
+        with open(output) as output_file:
+            errors = [json.loads(line) for line in output_file]
+
+        self.assertEqual([(e["code"], e["line"]) for e in errors],
+                         [("style/space_before_func", 1)])
+        self.assertEqual(result, 1)
+
+    def test_output_kept_when_linting_fails(self):
+        """Check that errors already reported are written on failure."""
+        handle, output = tempfile.mkstemp()
+        os.close(handle)
+        self.addCleanup(os.remove, output)
+
+        with os.fdopen(self._temporary_file[0], "a+") as process_file:
+            process_file.write("function_call()\n")
+
+        lint_files = linter._lint_files  # suppress(W0212)
+
+        def _lint_files(*args, **kwargs):
+            """Yield the first result, then fail."""
+            for linted in lint_files(*args, **kwargs):
+                yield linted
+                raise RuntimeError("Linting failed")
+
+        self.patch(linter, "_lint_files", _lint_files)
+        self.assertRaises(RuntimeError,
+                          run_linter_main,
+                          self._temporary_file[1],
+                          whitelist=["style/space_before_func"],
+                          format="jsonl",
+                          output=output)
+
+        with open(output) as output_file:
+            errors = [json.loads(line) for line in output_file]
+
+        self.assertEqual([e["code"] for e in errors],
+                         ["style/space_before_func"])
+
     def test_fix_what_you_can(self):
         """Check that --fix-what-you-can modifies file correctly."""
         contents = "function_call()\n"
@@ -162,3 +248,510 @@ class TestLinterAcceptance(TestCase):
 
         with open(self._temporary_file[1], "r") as processed_file:
             self.assertEqual("function_call ()\n", processed_file.read())
+
+    def test_fix_all_in_one_run(self):
+        """Check that --fix-what-you-can fixes everything in one run."""
+        contents = ("FUNCTION_CALL(ARGUMENT)\n"
+                    "other_call(ONE  TWO)\n")
+
+        with os.fdopen(self._temporary_file[0], "a+") as process_file:
+            process_file.write(contents)
+
+        result = run_linter_main(self._temporary_file[1],
+                                 whitelist=["style/space_before_func",
+                                            "style/lowercase_func",
+                                            "style/argument_align"],
+                                 fix_what_you_can=True)
+
+        with open(self._temporary_file[1], "r") as processed_file:
+            self.assertEqual(("function_call (ARGUMENT)\n"
+                              "other_call (ONE TWO)\n"),
+                             processed_file.read())
+
+        self.assertEqual(result, 0)
+
+
+class TestLinterParallelAcceptance(TestCase):
+    """Acceptance tests for linter.main() with --jobs."""
+
+    def __init__(self, *args, **kwargs):
+        """Initialize class variables."""
+        cls = TestLinterParallelAcceptance
+        super(cls, self).__init__(*args,  # suppress(R903)
+                                  **kwargs)
+        self._temporary_files = []
+
+    def setUp(self):  # NOQA
+        """Create some temporary files, each with one more error."""
+        super(TestLinterParallelAcceptance, self).setUp()
+        for index in range(0, 4):
+            handle, name = tempfile.mkstemp()
+            with os.fdopen(handle, "w") as process_file:
+                process_file.write("function_call()\n" * (index + 1))
+
+            self._temporary_files.append(name)
+
+    def tearDown(self):  # NOQA
+        """Remove temporary files."""
+        for name in self._temporary_files:
+            os.remove(name)
+
+        super(TestLinterParallelAcceptance, self).tearDown()
+
+    def _run_with_jobs(self, jobs):
+        """Run linter.main() on all files with jobs, returning output."""
+        stderr = StringIO()
+        self.patch(sys, "stderr", stderr)
+        result = linter.main(self._temporary_files +
+                             ["--whitelist", "style/space_before_func",
+                              "--jobs", str(jobs)])
+        return (result, stderr.getvalue())
+
+    def test_same_count_as_serial(self):
+        """Check that linting in parallel reports as many errors."""
+        self.assertEqual(self._run_with_jobs(1)[0],
+                         self._run_with_jobs(4)[0])
+
+    def test_errors_in_input_order(self):
+        """Check that linting in parallel reports errors in input order."""
+        self.assertEqual(self._run_with_jobs(1)[1],
+                         self._run_with_jobs(4)[1])
+
+    def test_profile_summed_over_files(self):
+        """Check that --profile sums times from all worker processes."""
+        handle, profile_output = tempfile.mkstemp()
+        os.close(handle)
+        self.addCleanup(os.remove, profile_output)
+
+        self.patch(sys, "stderr", StringIO())
+        result = linter.main(self._temporary_files +
+                             ["--whitelist", "style/space_before_func",
+                              "--jobs", "2",
+                              "--profile",
+                              "--profile-output", profile_output])
+        self.assertEqual(result, self._run_with_jobs(1)[0])
+
+        with open(profile_output) as profile_file:
+            profile = json.load(profile_file)
+
+        timers = {(t["kind"], t["name"]): t for t in profile["timers"]}
+        self.assertEqual(timers[("phase", "parse")]["calls"], 4)
+        self.assertIn(("check", "style/space_before_func"), timers)
+        self.assertEqual(sorted([f["file"] for f in profile["slowest_files"]]),
+                         sorted(self._temporary_files))
+
+
+class TestLinterDirectoryAcceptance(TestCase):
+    """Acceptance tests for linter.main() with directories."""
+
+    def __init__(self, *args, **kwargs):
+        """Initialize class variables."""
+        cls = TestLinterDirectoryAcceptance
+        super(cls, self).__init__(*args,  # suppress(R903)
+                                  **kwargs)
+        self._directory = None
+
+    def setUp(self):  # NOQA
+        """Create a directory with CMake files in it, one excluded."""
+        super(TestLinterDirectoryAcceptance, self).setUp()
+        self._directory = tempfile.mkdtemp()
+        for relative in ("CMakeLists.txt",
+                         os.path.join("cmake", "Module.cmake"),
+                         os.path.join("build", "CMakeLists.txt"),
+                         "notes.txt"):
+            path = os.path.join(self._directory, relative)
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+
+            with open(path, "w") as cmake_file:
+                cmake_file.write("function_call()\n")
+
+    def tearDown(self):  # NOQA
+        """Remove the directory."""
+        shutil.rmtree(self._directory)
+        super(TestLinterDirectoryAcceptance, self).tearDown()
+
+    def _run(self, *args):
+        """Run linter.main() on the directory, returning output."""
+        stderr = StringIO()
+        self.patch(sys, "stderr", stderr)
+        result = linter.main([self._directory,
+                              "--whitelist",
+                              "style/space_before_func"] + list(args))
+        return (result, stderr.getvalue())
+
+    def test_lint_cmake_files_in_directory(self):
+        """Check that CMake files in a directory are linted."""
+        result, output = self._run("--jobs", "1")
+        self.assertEqual(result, 3)
+        self.assertNotIn("notes.txt", output)
+
+    def test_exclude_directory(self):
+        """Check that excluded directories are not linted."""
+        result, output = self._run("--exclude", "build")
+        self.assertEqual(result, 2)
+        self.assertNotIn("build", output)
+
+    def test_parallel_same_as_serial(self):
+        """Check that directories linted in parallel report the same."""
+        self.assertEqual(self._run("--jobs", "1"),
+                         self._run("--jobs", "3"))
+
+
+class TestLinterModuleAcceptance(TestCase):
+    """Acceptance tests for linter.main() with --module-boundary."""
+
+    def __init__(self, *args, **kwargs):
+        """Initialize class variables."""
+        cls = TestLinterModuleAcceptance
+        super(cls, self).__init__(*args,  # suppress(R903)
+                                  **kwargs)
+        self._directory = None
+
+    def setUp(self):  # NOQA
+        """Create a module where one file uses privates of another."""
+        super(TestLinterModuleAcceptance, self).setUp()
+        self._directory = tempfile.mkdtemp()
+        with open(os.path.join(self._directory, "ns.cmake"), "w") as defs:
+            defs.write("macro (_ns_private)\n"
+                       "endmacro ()\n")
+
+        with open(os.path.join(self._directory,
+                               "ns_internal.cmake"), "w") as uses:
+            uses.write("_ns_private ()\n")
+
+    def tearDown(self):  # NOQA
+        """Remove the directory."""
+        shutil.rmtree(self._directory)
+        super(TestLinterModuleAcceptance, self).tearDown()
+
+    def _run(self, *args):
+        """Run linter.main() on one file of the module."""
+        self.patch(sys, "stderr", StringIO())
+        return linter.main([os.path.join(self._directory,
+                                         "ns_internal.cmake"),
+                            "--whitelist",
+                            "access/other_private",
+                            "unused/private"] + list(args))
+
+    def test_file_boundary(self):
+        """Check that privates of other files are flagged by default."""
+        self.assertEqual(self._run(), 1)
+
+    def test_directory_boundary(self):
+        """Check that privates of files in the same directory are used."""
+        self.assertEqual(self._run("--module-boundary", "directory"), 0)
+
+    def test_directory_boundary_parallel(self):
+        """Check that the index can be built in parallel."""
+        self.assertEqual(self._run("--module-boundary", "directory",
+                                   "--jobs", "2"), 0)
+
+    def test_index_persisted(self):
+        """Check that the index is reused from --stamp-directory."""
+        stamp_directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, stamp_directory)
+        arguments = ("--module-boundary", "directory",
+                     "--stamp-directory", stamp_directory)
+        self.assertEqual(self._run(*arguments), 0)
+
+        def _file_exports(contents):
+            """Fail if called."""
+            raise AssertionError("Parsed {0}".format(contents))
+
+        self.patch(linter, "file_exports", _file_exports)
+        with open(os.path.join(self._directory, "ns.cmake"), "w") as defs:
+            defs.write("macro (_ns_private)\n"
+                       "endmacro ()\n")
+
+        self.assertEqual(self._run(*arguments), 0)
+
+
+class TestLinterChangedAcceptance(TestCase):
+    """Acceptance tests for linter.main() with --changed-since."""
+
+    def __init__(self, *args, **kwargs):
+        """Initialize class variables."""
+        cls = TestLinterChangedAcceptance
+        super(cls, self).__init__(*args,  # suppress(R903)
+                                  **kwargs)
+        self._directory = None
+
+    def setUp(self):  # NOQA
+        """Create a git repository with two files, then change one."""
+        super(TestLinterChangedAcceptance, self).setUp()
+        self._directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._directory)
+
+        try:
+            self._git("init")
+        except (OSError, subprocess.CalledProcessError):
+            self.skipTest("git is not available")
+
+        self._write("CMakeLists.txt", "call()\ncall()\n")
+        self._write("other.cmake", "call()\n")
+        self._git("add", ".")
+        self._git("commit", "-m", "Initial")
+        self._write("CMakeLists.txt", "call()\ncall()\ncall()\n")
+
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self._directory)
+
+    def _git(self, *arguments):
+        """Run git with arguments in the repository."""
+        with open(os.devnull, "w") as devnull:
+            subprocess.check_call(["git",
+                                   "-c", "user.name=test",
+                                   "-c", "user.email=test@example.com"] +
+                                  list(arguments),
+                                  cwd=self._directory,
+                                  stdout=devnull,
+                                  stderr=devnull)
+
+    def _write(self, name, contents):
+        """Write contents to name in the repository."""
+        with open(os.path.join(self._directory, name), "w") as written:
+            written.write(contents)
+
+    def _run(self, *args):
+        """Run linter.main(), returning errors reported."""
+        self.patch(sys, "stderr", StringIO())
+        return linter.main(["--whitelist", "style/space_before_func"] +
+                           list(args))
+
+    def test_changed_files(self):
+        """Check that only changed files are linted."""
+        self.assertEqual(self._run("--changed-since", "HEAD"), 3)
+
+    def test_changed_files_in_directory(self):
+        """Check that only changed files are linted in directories."""
+        self.assertEqual(self._run(".", "--changed-since", "HEAD"), 3)
+
+    def test_only_changed_lines(self):
+        """Check that only errors on changed lines are reported."""
+        self.assertEqual(self._run("--changed-since", "HEAD",
+                                   "--only-changed-lines"), 1)
+
+    def test_only_changed_lines_fixed(self):
+        """Check that only errors on changed lines are fixed."""
+        self.assertEqual(self._run("--changed-since", "HEAD",
+                                   "--only-changed-lines",
+                                   "--fix-what-you-can"), 0)
+        with open(os.path.join(self._directory,
+                               "CMakeLists.txt")) as fixed_file:
+            self.assertEqual(fixed_file.read(), "call()\ncall()\ncall ()\n")
+
+    def test_only_changed_lines_requires_changed_since(self):
+        """Check that --only-changed-lines needs --changed-since."""
+        self.assertEqual(self._run(".", "--only-changed-lines"), 1)
+
+
+class TestLinterCacheAcceptance(TestCase):
+    """Acceptance tests for linter.main() with --stamp-directory."""
+
+    def __init__(self, *args, **kwargs):
+        """Initialize class variables."""
+        cls = TestLinterCacheAcceptance
+        super(cls, self).__init__(*args,  # suppress(R903)
+                                  **kwargs)
+        self._stamp_directory = None
+        self._temporary_files = []
+
+    def setUp(self):  # NOQA
+        """Create a stamp directory and two files with the same contents."""
+        super(TestLinterCacheAcceptance, self).setUp()
+        self._stamp_directory = tempfile.mkdtemp()
+        for _ in range(0, 2):
+            handle, name = tempfile.mkstemp()
+            with os.fdopen(handle, "w") as process_file:
+                process_file.write("function_call()\n")
+
+            self._temporary_files.append(name)
+
+    def tearDown(self):  # NOQA
+        """Remove temporary files and stamp directory."""
+        for name in self._temporary_files:
+            os.remove(name)
+
+        shutil.rmtree(self._stamp_directory)
+        super(TestLinterCacheAcceptance, self).tearDown()
+
+    def _run(self, file_name, *args):
+        """Run linter.main() on file_name using the stamp directory."""
+        return linter.main([file_name,
+                            "--stamp-directory",
+                            self._stamp_directory] + list(args))
+
+    def _patch_lint_to_fail(self):
+        """Make linter.lint fail, so that only cached results are used."""
+        def _lint(*args, **kwargs):
+            """Fail, since results should have been cached."""
+            raise AssertionError("lint called with {0} {1}".format(args,
+                                                                   kwargs))
+
+        self.patch(linter, "lint", _lint)
+
+    def test_cached_result_reused(self):
+        """Check that a cached result is reused for the same contents."""
+        first = self._run(self._temporary_files[0])
+        self._patch_lint_to_fail()
+        self.assertEqual(first, self._run(self._temporary_files[0]))
+
+    def test_cached_result_reused_for_other_path(self):
+        """Check that a cached result is reused for another path."""
+        first = self._run(self._temporary_files[0])
+        self._patch_lint_to_fail()
+        self.assertEqual(first, self._run(self._temporary_files[1]))
+
+    def test_options_change_key(self):
+        """Check that changing options does not reuse cached results."""
+        self._run(self._temporary_files[0])
+        self._patch_lint_to_fail()
+        self.assertRaises(AssertionError,
+                          self._run,
+                          self._temporary_files[0],
+                          "--namespace",
+                          "our")
+
+    def test_compact_cache(self):
+        """Check that --compact-cache keeps cached results."""
+        first = self._run(self._temporary_files[0])
+        self.assertEqual(linter.main(["--stamp-directory",
+                                      self._stamp_directory,
+                                      "--compact-cache"]), 0)
+        self._patch_lint_to_fail()
+        self.assertEqual(first, self._run(self._temporary_files[0]))
+
+    def test_cached_tree_reused_when_options_change(self):
+        """Check that files are not parsed again if only options change."""
+        self._run(self._temporary_files[0])
+
+        def _parse(*args, **kwargs):
+            """Fail, since the tree should have been cached."""
+            raise AssertionError("parse called with {0} {1}".format(args,
+                                                                    kwargs))
+
+        self.patch(util, "parse", _parse)
+        self.assertEqual(self._run(self._temporary_files[0],
+                                   "--namespace",
+                                   "our"), 1)
+
+    def test_unreadable_tree_parsed_again(self):
+        """Check that files are parsed again if a cached tree is bad."""
+        contents = "function_call()\n"
+        with cache.CacheStore(self._stamp_directory, "trees") as store:
+            store.put(cache.tree_key(contents), b"not a tree")
+
+        self.assertEqual(self._run(self._temporary_files[0],
+                                   "--namespace",
+                                   "our"), 1)
+
+    def test_corrupted_tree_parsed_again(self):
+        """Check that files are parsed again if a cached tree is corrupt."""
+        contents = "function_call()\n"
+        with cache.CacheStore(self._stamp_directory, "trees") as store:
+            data = bytearray(ir.serialize(util.parse(contents)))
+
+            # The kind of the first statement, after the header and the
+            # kind of the toplevel body.
+            data[18] = 255
+            store.put(cache.tree_key(contents), bytes(data))
+
+        self.assertEqual(self._run(self._temporary_files[0],
+                                   "--namespace",
+                                   "our"), 1)
+
+    def test_unreadable_result_linted_again(self):
+        """Check that files are linted again if cached errors are bad."""
+        self._run(self._temporary_files[0],
+                  "--whitelist",
+                  "style/space_before_func")
+
+        def _deserialize_errors(data):
+            """Fail to decode data."""
+            raise ValueError("Bad cached errors: {0}".format(data))
+
+        self.patch(cache, "deserialize_errors", _deserialize_errors)
+        calls = self._patch_lint_to_record()
+        self.assertEqual(self._run(self._temporary_files[0],
+                                   "--whitelist",
+                                   "style/space_before_func"), 1)
+        self.assertEqual(calls, [["style/space_before_func"]])
+
+    def _patch_lint_to_record(self):
+        """Record the whitelist linter.lint is called with."""
+        calls = []
+        lint = linter.lint
+
+        def _lint(contents, whitelist, *args, **kwargs):
+            """Record whitelist and lint contents."""
+            calls.append(sorted(whitelist))
+            return lint(contents, whitelist, *args, **kwargs)
+
+        self.patch(linter, "lint", _lint)
+        return calls
+
+    def test_new_check_only_runs_new_check(self):
+        """Check that only checks without cached results are run."""
+        self._run(self._temporary_files[0],
+                  "--whitelist",
+                  "style/space_before_func")
+        calls = self._patch_lint_to_record()
+        self._run(self._temporary_files[0],
+                  "--whitelist",
+                  "style/space_before_func",
+                  "style/lowercase_func")
+        self.assertEqual(calls, [["style/lowercase_func"]])
+
+    def test_options_for_other_checks_keep_key(self):
+        """Check that results are reused if only other options change."""
+        first = self._run(self._temporary_files[0],
+                          "--whitelist",
+                          "style/space_before_func")
+        self._patch_lint_to_fail()
+        self.assertEqual(first, self._run(self._temporary_files[0],
+                                          "--whitelist",
+                                          "style/space_before_func",
+                                          "--namespace",
+                                          "our"))
+
+    def test_partly_cached_errors_in_same_order(self):
+        """Check that errors are in the same order when partly cached."""
+        with open(self._temporary_files[0], "w") as process_file:
+            process_file.write("function (Foo_call)\n"
+                               "endfunction ()\n"
+                               "Foo_call()\n")
+
+        def _output(*args):
+            """Return the errors found by linting with args."""
+            self.patch(sys, "stderr", StringIO())
+            linter.main([self._temporary_files[0]] + list(args))
+            return sys.stderr.getvalue()
+
+        expected = _output()
+        self._run(self._temporary_files[0],
+                  "--whitelist",
+                  "style/lowercase_func")
+        self.assertEqual(expected, _output("--stamp-directory",
+                                           self._stamp_directory))
+
+    def test_first_violation_same_when_partly_cached(self):
+        """Check that reduced results do not depend on the checks run."""
+        with open(self._temporary_files[0], "w") as process_file:
+            process_file.write("# NOLINT-BEGIN:style/set_var_case\n"
+                               "set (lower VALUE)\n"
+                               "# NOLINT-END\n"
+                               "set (other VALUE)\n")
+
+        def _output(*args):
+            """Return the errors found by linting with args."""
+            self.patch(sys, "stderr", StringIO())
+            linter.main([self._temporary_files[0]] + list(args))
+            return sys.stderr.getvalue()
+
+        expected = _output()
+        self._run(self._temporary_files[0],
+                  "--whitelist",
+                  "style/set_var_case")
+        self.assertEqual(expected, _output("--stamp-directory",
+                                           self._stamp_directory))
@@ -0,0 +1,86 @@
+# /test/test_analysis.py
+#
+# Test cases for the per-file analysis context.
+#
+# See /LICENCE.md for Copyright information
+"""Test cases for the per-file analysis context."""
+
+from cmakeast import ast
+
+from polysquarecmakelinter import analysis
+from polysquarecmakelinter import find_all
+from polysquarecmakelinter import find_variables_in_scopes
+from polysquarecmakelinter import linter
+
+from testtools import ExpectedException
+from testtools import TestCase
+
+_SCRIPT = ("function (_private ARGUMENT)\n"
+           "    set (_VARIABLE ${ARGUMENT})\n"
+           "endfunction ()\n"
+           "_private (VALUE)\n")
+
+
+class TestAnalysisContext(TestCase):
+    """Test that analysis products are computed once and shared."""
+
+    def _context(self):  # suppress(no-self-use)
+        """Return an AnalysisContext for _SCRIPT."""
+        return analysis.AnalysisContext(_SCRIPT.splitlines(True),
+                                        ast.parse(_SCRIPT))
+
+    def test_scopes_memoized(self):
+        """Scope trees are only built once per context."""
+        context = self._context()
+        self.assertIs(context.set_scopes, context.set_scopes)
+        self.assertIs(context.used_scopes, context.used_scopes)
+
+    def test_private_calls_and_definitions_memoized(self):
+        """Private calls and definitions are only found once per context."""
+        context = self._context()
+        calls, definitions = context.private_calls_and_definitions
+        self.assertEqual(list(calls.keys()), ["_private"])
+        self.assertEqual(list(definitions.keys()), ["_private"])
+        self.assertIs(context.private_calls_and_definitions[0], calls)
+
+
+def _never_called(*args):
+    """Fail if called."""
+    raise AssertionError("Called with {0}".format(args))
+
+
+class TestAnalysisRequirements(TestCase):
+    """Test that only declared analysis products are built."""
+
+    def test_undeclared_product_not_available(self):
+        """Using a product which was not declared is an error."""
+        context = analysis.AnalysisContext(_SCRIPT.splitlines(True),
+                                           ast.parse(_SCRIPT),
+                                           requirements=frozenset())
+        with ExpectedException(AssertionError):
+            context.set_scopes  # suppress(pointless-statement)
+
+    def test_set_and_used_scopes_built_together(self):
+        """Set and used scopes are built in one pass when both required."""
+        self.patch(find_variables_in_scopes, "set_in_tree", _never_called)
+        self.patch(find_variables_in_scopes, "used_in_tree", _never_called)
+        context = analysis.AnalysisContext(
+            _SCRIPT.splitlines(True),
+            ast.parse(_SCRIPT),
+            requirements=frozenset(["set_scopes", "used_scopes"])
+        )
+        self.assertIs(context.set_scopes, context.used_scopes)
+
+    def test_style_checks_build_no_products(self):
+        """Whitelisting a style check never builds scope trees."""
+        for name in ("set_in_tree", "used_in_tree", "set_and_used_in_tree"):
+            self.patch(find_variables_in_scopes, name, _never_called)
+
+        for name in ("private_calls_and_definitions",
+                     "toplevel_set_private_vars"):
+            self.patch(find_all, name, _never_called)
+
+        errors = linter.lint(_SCRIPT + "call(ARGUMENT)\n",
+                             whitelist=["style/space_before_func"])
+        self.assertEqual([e[0] for e in errors],
+                         ["style/space_before_func"])
@@ -0,0 +1,83 @@
+# /test/test_benchmarks.py
+#
+# Test cases for the benchmark corpus generator and baseline comparison.
+#
+# See /LICENCE.md for Copyright information
+"""Test cases for the benchmark corpus generator and baseline comparison."""
+
+from benchmarks import corpus
+from benchmarks import run
+
+from cmakeast import ast
+
+from polysquarecmakelinter import linter
+from polysquarecmakelinter import util
+
+from testtools import TestCase
+
+
+class TestCorpus(TestCase):
+    """Test that generated corpora are deterministic and parse."""
+
+    def test_deterministic(self):
+        """The same spec always generates the same source."""
+        corpus_spec = corpus.spec(statements=50, seed=3)
+        self.assertEqual(corpus.generate(corpus_spec),
+                         corpus.generate(corpus_spec))
+
+    def test_scales_statements(self):
+        """Generated source has at least the number of statements asked."""
+        source = corpus.generate(corpus.spec(statements=100))
+        self.assertGreaterEqual(len(source.splitlines()), 100)
+        ast.parse(source)
+
+    def test_toplevel_blocks(self):
+        """Generated source has if, while and foreach blocks at toplevel."""
+        source = corpus.generate(corpus.spec())
+        names = set([s.__class__.__name__
+                     for s in ast.parse(source).statements])
+        self.assertTrue(set(["IfBlock",
+                             "WhileStatement",
+                             "ForeachStatement"]) <= names)
+
+    def test_lints_with_all_checks(self):
+        """Generated source is linted by all default checks."""
+        source = corpus.generate(corpus.spec())
+        self.assertNotEqual(linter.lint(source,
+                                        namespace=corpus.NAMESPACE),
+                            [])
+
+    def test_scales_depth(self):
+        """Deeper corpora have more deeply indented statements."""
+        source = corpus.generate(corpus.spec(statements=10, depth=6))
+        indents = [len(line) - len(line.lstrip())
+                   for line in source.splitlines()]
+        self.assertEqual(max(indents), (1 + 6) * corpus.INDENT)
+
+    def test_nested_depth(self):
+        """Nested sources have blocks nested as deeply as asked."""
+        source = corpus.nested(2000)
+        statements = util.parse(source).statements
+        self.assertEqual(len(statements), 2)
+
+        depth = 0
+        node = statements[0]
+        while node.body[-1].__class__.__name__ != "FunctionCall":
+            node = node.body[-1]
+            if node.__class__.__name__ == "IfBlock":
+                node = node.if_statement
+
+            depth += 1
+
+        self.assertEqual(depth, 2000)
+
+
+class TestCompare(TestCase):
+    """Test comparing results against a baseline."""
+
+    def test_regression_over_threshold(self):
+        """Timings slower than the threshold are regressions."""
+        baseline = {"results": {"a:lint": 1.0, "b:lint": 1.0}}
+        current = {"results": {"a:lint": 1.05, "b:lint": 1.5, "c:lint": 9.0}}
+        self.assertEqual([r.name for r in run.compare(current, baseline)],
+                         ["b:lint"])
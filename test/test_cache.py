@@ -0,0 +1,181 @@
+# /test/test_cache.py
+#
+# Test cases for the single-file cache store.
+#
+# See /LICENCE.md for Copyright information
+"""Test cases for the single-file cache store."""
+
+import binascii
+
+import os
+
+import shutil
+
+import tempfile
+
+from polysquarecmakelinter import cache
+
+from testtools import TestCase
+
+
+def _key(number):
+    """Return a valid key for number."""
+    return cache.check_key(str(number), "code", {})
+
+
+class TestCacheStore(TestCase):
+    """Test cases for cache.CacheStore."""
+
+    def __init__(self, *args, **kwargs):
+        """Initialize class variables."""
+        super(TestCacheStore, self).__init__(*args,  # suppress(R903)
+                                             **kwargs)
+        self._directory = None
+
+    def setUp(self):  # NOQA
+        """Create a directory for the store."""
+        super(TestCacheStore, self).setUp()
+        self._directory = tempfile.mkdtemp()
+
+    def tearDown(self):  # NOQA
+        """Remove the store directory."""
+        shutil.rmtree(self._directory)
+        super(TestCacheStore, self).tearDown()
+
+    def _store(self, max_size=None):
+        """Open the store in the temporary directory."""
+        return cache.CacheStore(self._directory, "results", max_size)
+
+    def test_values_persist(self):
+        """Values put in a store can be read after reopening it."""
+        with self._store() as store:
+            store.put(_key(0), b"zero")
+            store.put(_key(1), b"one")
+
+        with self._store() as store:
+            self.assertEqual(store.get(_key(0)), b"zero")
+            self.assertEqual(store.get(_key(1)), b"one")
+            self.assertEqual(store.get(_key(2)), None)
+
+    def test_single_data_file_and_index(self):
+        """Only a data file, an index and a lock file are created."""
+        with self._store() as store:
+            for number in range(0, 10):
+                store.put(_key(number), b"value")
+
+        self.assertEqual(sorted(os.listdir(self._directory)),
+                         ["results.data", "results.index", "results.lock"])
+
+    def test_least_recently_used_evicted(self):
+        """Least recently used values are evicted first."""
+        with self._store() as store:
+            store.put(_key(0), b"0" * 10)
+            store.put(_key(1), b"1" * 10)
+
+        with self._store() as store:
+            store.get(_key(0))
+
+        with self._store(max_size=25) as store:
+            store.put(_key(2), b"2" * 10)
+
+        with self._store() as store:
+            self.assertEqual(store.get(_key(0)), b"0" * 10)
+            self.assertEqual(store.get(_key(1)), None)
+            self.assertEqual(store.get(_key(2)), b"2" * 10)
+
+    def test_compact_drops_replaced_values(self):
+        """Compaction drops values which were replaced."""
+        with self._store() as store:
+            store.put(_key(0), b"0" * 10)
+            store.put(_key(0), b"1" * 10)
+            store.compact()
+
+        data_path = os.path.join(self._directory, "results.data")
+        self.assertEqual(os.path.getsize(data_path),
+                         cache._ValueHeader.size + 10)  # suppress(W0212)
+
+        with self._store() as store:
+            self.assertEqual(store.get(_key(0)), b"1" * 10)
+
+    def test_corrupted_value_is_miss(self):
+        """Values which no longer match their checksum are not returned."""
+        with self._store() as store:
+            store.put(_key(0), b"0" * 10)
+
+        data_path = os.path.join(self._directory, "results.data")
+        with open(data_path, "r+b") as data_file:
+            data_file.seek(-1, os.SEEK_END)
+            data_file.write(b"1")
+
+        with self._store() as store:
+            self.assertEqual(store.get(_key(0)), None)
+
+    def test_value_for_other_key_is_miss(self):
+        """Index entries pointing at the value of another key are misses."""
+        with self._store() as store:
+            store.put(_key(0), b"0" * 10)
+
+        with self._store() as store:
+            store.put(_key(1), b"1" * 10)
+            store._load_index()  # suppress(W0212)
+            entries = store._entries  # suppress(W0212)
+            entries[binascii.unhexlify(_key(1))] = (
+                entries[binascii.unhexlify(_key(0))]
+            )
+            self.assertEqual(store.get(_key(1)), None)
+
+    def test_stores_share_directory(self):
+        """Values put by one open store are seen by another."""
+        with self._store() as first:
+            first.put(_key(0), b"zero")
+            with self._store() as second:
+                second.put(_key(1), b"one")
+                second.compact()
+
+            first.put(_key(2), b"two")
+
+        with self._store() as store:
+            self.assertEqual([store.get(_key(n)) for n in range(0, 3)],
+                             [b"zero", b"one", b"two"])
+
+
+class TestDeserializeErrors(TestCase):
+    """Test cases for cache.deserialize_errors."""
+
+    def test_round_trip(self):
+        """Serialized errors are deserialized."""
+        errors = [("file.cmake", cache.LinterFailure("message", 1))]
+        self.assertEqual(cache.deserialize_errors(
+            cache.serialize_errors(errors)), errors)
+
+    def test_bad_data(self):
+        """Data which is not serialized errors raises ValueError."""
+        for data in (b"\xff\xfe", b"1", b"[[1]]"):
+            self.assertRaises(ValueError, cache.deserialize_errors, data)
+
+
+class TestParseSize(TestCase):
+    """Test cases for cache.parse_size."""
+
+    def test_plain_bytes(self):
+        """Sizes without suffixes are in bytes."""
+        self.assertEqual(cache.parse_size("100"), 100)
+
+    def test_suffixes(self):
+        """Sizes can have K, M and G suffixes."""
+        self.assertEqual(cache.parse_size("2K"), 2048)
+        self.assertEqual(cache.parse_size("1m"), 1024 ** 2)
+        self.assertEqual(cache.parse_size("1G"), 1024 ** 3)
+
+
+class TestTreeKey(TestCase):
+    """Test cases for cache.tree_key."""
+
+    def test_changes_with_contents(self):
+        """Keys differ for different contents."""
+        self.assertNotEqual(cache.tree_key("a()\n"), cache.tree_key("b()\n"))
+
+    def test_differs_from_exports_key(self):
+        """Trees and exports for the same contents have different keys."""
+        self.assertNotEqual(cache.tree_key("a()\n"),
+                            cache.exports_key("a()\n", []))
@@ -0,0 +1,117 @@
+# /test/test_daemon.py
+#
+# Test cases for linting through a daemon over a Unix domain socket.
+#
+# See /LICENCE.md for Copyright information
+"""Test cases for linting through a daemon over a Unix domain socket."""
+
+import os
+
+import shutil
+
+import sys
+
+import tempfile
+
+import threading
+
+from polysquarecmakelinter import cache
+from polysquarecmakelinter import daemon
+from polysquarecmakelinter import linter
+
+from testtools import TestCase
+from testtools import skipUnless
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+@skipUnless(daemon.supported(), "Unix domain sockets not available")
+class TestDaemon(TestCase):
+    """Test that the daemon behaves the same as the linter."""
+
+    def setUp(self):  # NOQA
+        """Start a daemon in a thread and create a file to lint."""
+        super(TestDaemon, self).setUp()
+        self._directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._directory)
+
+        self._file = os.path.join(self._directory, "CMakeLists.txt")
+        with open(self._file, "w") as cmake_file:
+            cmake_file.write("function_call()\nother_call()\n")
+
+        self._socket = os.path.join(self._directory, "linter.sock")
+        self._store = cache.MemoryStore()
+        ready = threading.Event()
+
+        def _run(arguments, cwd):
+            """Run the linter with results kept in self._store."""
+            return linter._run_captured(arguments,  # suppress(W0212)
+                                        cwd,
+                                        self._store)
+
+        self._thread = threading.Thread(target=daemon.serve,
+                                        args=(self._socket, _run, ready.set))
+        self._thread.start()
+        self.addCleanup(self._stop)
+        ready.wait()
+
+    def _stop(self):
+        """Stop the daemon and wait for it to exit."""
+        daemon.request(self._socket, [], stop=True)
+        self._thread.join()
+
+    def _main(self, arguments):
+        """Run linter.main, returning status, stdout and stderr."""
+        stdout = StringIO()
+        stderr = StringIO()
+        self.patch(sys, "stdout", stdout)
+        self.patch(sys, "stderr", stderr)
+        status = linter.main(arguments)
+        return (status, stdout.getvalue(), stderr.getvalue())
+
+    def test_same_as_standalone(self):
+        """Linting through the daemon has the same output and status."""
+        arguments = [self._file, "--jobs", "1"]
+        self.assertEqual(daemon.request(self._socket, arguments),
+                         self._main(arguments))
+
+    def test_results_kept_in_memory(self):
+        """The daemon reuses results for files it has already linted."""
+        arguments = [self._file, "--jobs", "1"]
+        daemon.request(self._socket, arguments)
+        self.assertGreater(self._store.size(), 0)
+
+    def test_connect_forwards_to_daemon(self):
+        """linter.main with --connect runs on the daemon."""
+        status = self._main([self._file, "--connect", self._socket])[0]
+        self.assertEqual(status, 2)
+        self.assertGreater(self._store.size(), 0)
+
+    def test_argument_errors_reported(self):
+        """Argument errors from the daemon have the same output."""
+        arguments = ["--no-such-option"]
+        with self.assertRaises(SystemExit):
+            self._main(arguments)
+
+        status, _, stderr = daemon.request(self._socket, arguments)
+        self.assertEqual(status, 2)
+        self.assertIn("--no-such-option", stderr)
+
+
+class TestStripOption(TestCase):
+    """Test removing the --connect option from a command line."""
+
+    def test_separate_value(self):
+        """Options followed by a separate value are removed."""
+        self.assertEqual(daemon.strip_option(["a", "--connect", "s", "b"],
+                                             "--connect"),
+                         ("s", ["a", "b"]))
+
+    def test_equals_value(self):
+        """Options with a value after an equals sign are removed."""
+        self.assertEqual(daemon.strip_option(["--connect=s", "a"],
+                                             "--connect"),
+                         ("s", ["a"]))
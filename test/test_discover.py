@@ -0,0 +1,100 @@
+# /test/test_discover.py
+#
+# Test cases for finding CMake files in directories.
+#
+# See /LICENCE.md for Copyright information
+"""Test cases for finding CMake files in directories."""
+
+import os
+
+import shutil
+
+import tempfile
+
+from polysquarecmakelinter import discover
+
+from testtools import TestCase
+
+# Files created for each test, relative to the temporary directory
+_TREE = (
+    "CMakeLists.txt",
+    "README.md",
+    "cmake/Module.cmake",
+    "cmake/helpers/Helper.cmake",
+    "src/CMakeLists.txt",
+    "src/main.cpp",
+    "build/CMakeLists.txt",
+    "third_party/lib/CMakeLists.txt"
+)
+
+
+class TestWalk(TestCase):
+    """Test cases for discover.walk and discover.files."""
+
+    def __init__(self, *args, **kwargs):
+        """Initialize class variables."""
+        super(TestWalk, self).__init__(*args,  # suppress(R903)
+                                       **kwargs)
+        self._directory = None
+
+    def setUp(self):  # NOQA
+        """Create a tree of files in a temporary directory."""
+        super(TestWalk, self).setUp()
+        self._directory = tempfile.mkdtemp()
+        for relative in _TREE:
+            path = os.path.join(self._directory, *relative.split("/"))
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+
+            with open(path, "w") as created:
+                created.write("\n")
+
+    def tearDown(self):  # NOQA
+        """Remove the temporary directory."""
+        shutil.rmtree(self._directory)
+        super(TestWalk, self).tearDown()
+
+    def _walk(self, excludes=()):
+        """Return paths found in the temporary directory, relative to it."""
+        return [os.path.relpath(p, self._directory).replace(os.sep, "/")
+                for p in discover.walk(self._directory, excludes)]
+
+    def test_finds_cmake_files_in_order(self):
+        """Find only CMake files, files before subdirectories."""
+        self.assertEqual(self._walk(),
+                         ["CMakeLists.txt",
+                          "build/CMakeLists.txt",
+                          "cmake/Module.cmake",
+                          "cmake/helpers/Helper.cmake",
+                          "src/CMakeLists.txt",
+                          "third_party/lib/CMakeLists.txt"])
+
+    def test_exclude_by_name(self):
+        """Exclude directories by their name anywhere in the tree."""
+        self.assertEqual(self._walk(["build", "helpers"]),
+                         ["CMakeLists.txt",
+                          "cmake/Module.cmake",
+                          "src/CMakeLists.txt",
+                          "third_party/lib/CMakeLists.txt"])
+
+    def test_exclude_by_relative_path(self):
+        """Exclude everything matching a glob of the relative path."""
+        self.assertEqual(self._walk(["third_party/*", "*.cmake"]),
+                         ["CMakeLists.txt",
+                          "build/CMakeLists.txt",
+                          "src/CMakeLists.txt"])
+
+    def test_named_files_always_returned(self):
+        """Files named explicitly are returned whatever they are called."""
+        readme = os.path.join(self._directory, "README.md")
+        found = list(discover.files([readme, self._directory], ["*"]))
+        self.assertEqual(found, [readme])
+
+    def test_files_generated_lazily(self):
+        """Files are generated before the whole tree has been walked."""
+        found = discover.files([self._directory])
+        self.assertEqual(os.path.basename(next(found)), "CMakeLists.txt")
+        with open(os.path.join(self._directory, "src", "New.cmake"), "w"):
+            pass
+
+        self.assertEqual(len(list(found)), 6)
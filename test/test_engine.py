@@ -0,0 +1,107 @@
+# /test/test_engine.py
+#
+# Test cases for the fused single-traversal check engine.
+#
+# See /LICENCE.md for Copyright information
+"""Test cases for the fused single-traversal check engine."""
+
+from cmakeast import ast
+from cmakeast import ast_visitor
+
+from polysquarecmakelinter import engine
+from polysquarecmakelinter import ir
+
+from testtools import TestCase
+
+_SCRIPT = ("function (my_function ARGUMENT)\n"
+           "    if (ARGUMENT)\n"
+           "        call (${ARGUMENT})\n"
+           "    endif (ARGUMENT)\n"
+           "endfunction ()\n"
+           "my_function (VALUE)\n")
+
+
+class TestTraversal(TestCase):
+    """Test that engine.Traversal behaves like ast_visitor.recurse."""
+
+    def test_same_order_as_ast_visitor(self):
+        """Subscribers see the same nodes, depths and order as recurse.
+
+        The traversal hands out ir nodes rather than the cmakeast nodes
+        they were built from, so nodes are compared by their position.
+        """
+        tree = ast.parse(_SCRIPT)
+        expected = []
+        visited = []
+
+        def _recorder(record):
+            """Return a handler which appends to record."""
+            def _handler(name, node, depth):
+                """Record this node."""
+                if name == "ToplevelBody":
+                    record.append((name, depth))
+                else:
+                    record.append((name, node.line, node.col, depth))
+
+            return _handler
+
+        handlers = {h: _recorder(expected) for h in engine.HANDLER_NAMES}
+        ast_visitor.recurse(tree, **handlers)
+
+        traversal = engine.Traversal(tree)
+        traversal.subscribe(**{h: _recorder(visited)
+                               for h in engine.HANDLER_NAMES})
+        traversal.run()
+
+        self.assertEqual(expected, visited)
+
+    def test_dispatch_to_all_subscribers(self):
+        """Each subscriber to a node kind is handed each node of it."""
+        traversal = engine.Traversal(ast.parse(_SCRIPT))
+        first = []
+        second = []
+
+        traversal.subscribe(function_call=lambda n, c, d: first.append(c))
+        traversal.subscribe(function_call=lambda n, c, d: second.append(c))
+        traversal.run()
+
+        self.assertEqual([c.name for c in first],
+                         [c.name for c in second])
+
+    def test_calls_visited_without_word_subscribers(self):
+        """All calls are visited even when arguments are not."""
+        traversal = engine.Traversal(ast.parse(_SCRIPT))
+        calls = []
+
+        traversal.subscribe(function_call=lambda n, c, d: calls.append(c))
+        traversal.run()
+
+        self.assertEqual(len(calls), 6)
+
+    def test_nodes_have_kinds(self):
+        """Handlers are handed ir nodes, with their kinds."""
+        traversal = engine.Traversal(ast.parse(_SCRIPT))
+        kinds = []
+
+        traversal.subscribe(if_block=lambda n, c, d: kinds.append(c.kind),
+                            word=lambda n, c, d: kinds.append(c.kind))
+        traversal.run()
+
+        self.assertEqual(kinds, [ir.Kind.Word,
+                                 ir.Kind.Word,
+                                 ir.Kind.IfBlock,
+                                 ir.Kind.Word,
+                                 ir.Kind.Word,
+                                 ir.Kind.Word,
+                                 ir.Kind.Word])
+
+    def test_skip_statements(self):
+        """Statements for which skip returns true are not visited."""
+        traversal = engine.Traversal(ast.parse(_SCRIPT),
+                                     lambda n: n.line < 5)
+        calls = []
+
+        traversal.subscribe(function_call=lambda n, c, d: calls.append(c))
+        traversal.run()
+
+        self.assertEqual([c.name for c in calls], ["my_function"])
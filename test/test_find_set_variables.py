@@ -0,0 +1,47 @@
+# /test/test_find_set_variables.py
+#
+# Test cases for finding variables set by function calls.
+#
+# See /LICENCE.md for Copyright information
+"""Test cases for finding variables set by function calls."""
+
+from cmakeast import ast
+
+from polysquarecmakelinter import find_set_variables
+
+from testtools import TestCase
+
+
+def _call(source):
+    """Return the first statement in source."""
+    return ast.parse(source).statements[0]
+
+
+class TestAllByFunctionCall(TestCase):
+    """Test fixture for find_set_variables.all_by_function_call."""
+
+    def test_all_outputs_found(self):
+        """Test that every output variable of a call is found."""
+        call = _call("execute_process (COMMAND cmd\n"
+                     "                 RESULT_VARIABLE RESULT\n"
+                     "                 OUTPUT_VARIABLE OUTPUT)\n")
+        found = find_set_variables.all_by_function_call(call)
+        self.assertEqual([v.contents for v in found], ["RESULT", "OUTPUT"])
+
+    def test_missing_keyword_not_found(self):
+        """Test that nothing is found after a keyword which is absent."""
+        call = _call("execute_process (COMMAND cmd OUTPUT_VARIABLE OUTPUT)\n")
+        found = find_set_variables.all_by_function_call(call)
+        self.assertEqual([v.contents for v in found], ["OUTPUT"])
+
+    def test_subcommand_must_match(self):
+        """Test that finders for other subcommands are not used."""
+        call = _call("list (APPEND LIST VALUE)\n")
+        found = find_set_variables.all_by_function_call(call)
+        self.assertEqual([v.contents for v in found], ["LIST"])
+
+    def test_nothing_set(self):
+        """Test that calls which set nothing return an empty list."""
+        self.assertEqual(find_set_variables.all_by_function_call(
+            _call("message (STATUS VALUE)\n")
+        ), [])
@@ -305,3 +305,66 @@ class TestUsedInTree(TestCase):
         global_scope = find_variables_in_scopes.used_in_tree(ast.parse(script))
         self.assertThat(global_scope.used_vars[0].node,
                         MatchesStructure(contents=Not(Equals(keyword))))
+
+
+class TestFindSetAndUsedVariablesInScopes(TestCase):
+    """Test fixture for the set_and_used_in_tree function."""
+
+    def test_same_as_separate_trees(self):
+        """Test that set_and_used_in_tree matches separate traversals."""
+        script = ("set (GLOBAL_VAR VALUE)\n"
+                  "function (my_function ARGUMENT)\n"
+                  "    set (FUNC_VAR ${ARGUMENT})\n"
+                  "    foreach (LOOP_VAR ${FUNC_VAR})\n"
+                  "        set (PARENT_VAR ${LOOP_VAR} PARENT_SCOPE)\n"
+                  "    endforeach ()\n"
+                  "endfunction ()\n"
+                  "macro (my_macro MACRO_ARG)\n"
+                  "    message (${MACRO_ARG} ${GLOBAL_VAR})\n"
+                  "endmacro ()\n")
+        tree = ast.parse(script)
+
+        def _flatten(scope, attribute):
+            """Return (name, source) for all variables in scope."""
+            result = [(v.node.contents, v.source)
+                      for v in getattr(scope, attribute)]
+            for subscope in scope.scopes:
+                result.append(_flatten(subscope, attribute))
+
+            return result
+
+        both = find_variables_in_scopes.set_and_used_in_tree(tree)
+        set_scopes = find_variables_in_scopes.set_in_tree(tree)
+        used_scopes = find_variables_in_scopes.used_in_tree(tree)
+
+        self.assertEqual(_flatten(both, "set_vars"),
+                         _flatten(set_scopes, "set_vars"))
+        self.assertEqual(_flatten(both, "used_vars"),
+                         _flatten(used_scopes, "used_vars"))
+
+
+class TestUsesByName(TestCase):
+    """Test fixture for the uses_by_name index."""
+
+    def test_scope_index_includes_subscopes(self):
+        """Test that each scope's index covers its subscopes."""
+        script = ("function (my_function ARGUMENT)\n"
+                  "    foreach (LOOP_VAR ${ARGUMENT})\n"
+                  "        message (${LOOP_VAR}${ARGUMENT})\n"
+                  "    endforeach ()\n"
+                  "endfunction ()\n")
+        global_scope = find_variables_in_scopes.used_in_tree(
+            ast.parse(script)
+        )
+        index = find_variables_in_scopes.uses_by_name(global_scope)
+        function_scope = global_scope.scopes[0]
+        foreach_scope = function_scope.scopes[0]
+
+        def _lines(scope, name):
+            """Return lines on which name is used in scope."""
+            return sorted([n.line for n in index[id(scope)].get(name, [])])
+
+        self.assertEqual(_lines(foreach_scope, "ARGUMENT"), [3])
+        self.assertEqual(_lines(function_scope, "ARGUMENT"), [2, 3])
+        self.assertEqual(_lines(global_scope, "LOOP_VAR"), [3])
+        self.assertEqual(_lines(foreach_scope, "my_function"), [])
@@ -0,0 +1,74 @@
+# /test/test_fix.py
+#
+# Test cases for applying replacements in batches.
+#
+# See /LICENCE.md for Copyright information
+"""Test cases for applying replacements in batches."""
+
+from polysquarecmakelinter import fix
+
+from polysquarecmakelinter.types import LinterFailure
+
+from testtools import TestCase
+
+
+def _error(line, replacement):
+    """Return a (code, LinterFailure) tuple with replacement on line."""
+    return ("some/check", LinterFailure("description", line, replacement))
+
+
+class TestApplyErrors(TestCase):
+    """Test cases for fix.apply_errors."""
+
+    def test_merge_edits_on_same_line(self):
+        """Non-overlapping replacements on the same line are merged."""
+        lines = ["CALL(ONE  TWO)\n"]
+        errors = [_error(1, "call(ONE  TWO)\n"),
+                  _error(1, "CALL (ONE  TWO)\n"),
+                  _error(1, "CALL(ONE TWO)\n")]
+
+        fixed_lines, applied = fix.apply_errors(lines, errors)
+
+        self.assertEqual(fixed_lines, ["call (ONE TWO)\n"])
+        self.assertEqual(len(applied), 3)
+
+    def test_conflicting_edits_left_alone(self):
+        """Overlapping replacements on the same line are not applied."""
+        lines = ["call(ONE)\n"]
+        errors = [_error(1, "call (ONE)\n"),
+                  _error(1, "call  (ONE)\n")]
+
+        fixed_lines, applied = fix.apply_errors(lines, errors)
+
+        self.assertEqual(len(fixed_lines), 1)
+        self.assertEqual(len(applied), 1)
+
+    def test_errors_without_replacement_ignored(self):
+        """Errors without a replacement are never applied."""
+        fixed_lines, applied = fix.apply_errors(["call ()\n"],
+                                                [_error(1, None)])
+
+        self.assertEqual(fixed_lines, ["call ()\n"])
+        self.assertEqual(applied, [])
+
+
+class TestFixedPoint(TestCase):
+    """Test cases for fix.to_fixed_point."""
+
+    def test_relint_until_nothing_to_fix(self):
+        """Conflicting replacements are applied on later passes."""
+        def _relint(contents):
+            """Ask for one more space until there are three."""
+            if contents.startswith("call   "):
+                return []
+
+            return [_error(1, contents.replace("call", "call ", 1)),
+                    _error(1, contents.replace("call", "call ", 1))]
+
+        contents, fixed, errors = fix.to_fixed_point("call()\n",
+                                                     _relint("call()\n"),
+                                                     _relint)
+
+        self.assertEqual(contents, "call   ()\n")
+        self.assertEqual(len(fixed), 3)
+        self.assertEqual(errors, [])
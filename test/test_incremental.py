@@ -0,0 +1,142 @@
+# /test/test_incremental.py
+#
+# Test cases for incremental linting of edited contents.
+#
+# See /LICENCE.md for Copyright information
+"""Test cases for incremental linting of edited contents."""
+
+import random
+
+from benchmarks import corpus
+
+from polysquarecmakelinter import incremental
+from polysquarecmakelinter import linter
+
+from testtools import ExpectedException
+from testtools import TestCase
+
+_OPTIONS = {
+    "namespace": corpus.NAMESPACE,
+    "indent": corpus.INDENT
+}
+
+_SCRIPT = ("function (_bench_private ARGUMENT)\n"
+           "    set (_VARIABLE ${ARGUMENT})\n"
+           "    message (${_VARIABLE})\n"
+           "endfunction ()\n"
+           "\n"
+           "set (_TOPLEVEL VALUE)\n"
+           "message (STATUS \"${_TOPLEVEL}\")\n"
+           "_bench_private (VALUE)\n")
+
+# Lines inserted at random by TestRelintEquivalence
+_FRAGMENTS = (
+    "set (_PRIVATE_1 VALUE)\n",
+    "message (STATUS \"${_PRIVATE_5}\")\n",
+    "function (_bench_private_0 ARGUMENT)\n",
+    "endfunction ()\n",
+    "if (CONDITION)\n",
+    "endif (CONDITION)\n",
+    "_bench_private_1 (VALUE)\n",
+    "set (lowercase VALUE)\n",
+    "  message(\"a\" \"b\")  \n",
+    "call (A) call (B)\n",
+    "# NOLINT:unused/private\n",
+    "# NOLINT-FILE:style/indent\n",
+    "\"\n",
+    "\n"
+)
+
+
+def _edit(contents, first, last, replacement):
+    """Return contents with lines first to last replaced."""
+    lines = contents.splitlines(True)
+    return "".join(lines[:first - 1] + replacement + lines[last:])
+
+
+class TestRelint(TestCase):
+    """Test that relint gives the same errors as linting from scratch."""
+
+    def _relint(self, contents, first, last, replacement):
+        """Relint contents after an edit and check the errors."""
+        state = incremental.lint(contents, **_OPTIONS)
+        self.assertEqual(state.errors, linter.lint(contents, **_OPTIONS))
+
+        edited = _edit(contents, first, last, replacement)
+        state = incremental.relint(state,
+                                   edited,
+                                   first,
+                                   first + len(replacement) - 1)
+        self.assertEqual(state.errors, linter.lint(edited, **_OPTIONS))
+        return state
+
+    def test_insert_line(self):
+        """Relint after inserting a line."""
+        self._relint(_SCRIPT, 6, 5, ["set (_UNUSED VALUE)\n"])
+
+    def test_delete_line(self):
+        """Relint after deleting a line."""
+        state = self._relint(_SCRIPT, 7, 7, [])
+        self.assertIn("_TOPLEVEL",
+                      [e[1].description for e in state.errors][0])
+
+    def test_change_line(self):
+        """Relint after changing a line."""
+        self._relint(_SCRIPT, 3, 3, ["    message(${_OTHER})\n"])
+
+    def test_unused_definition_after_removing_call(self):
+        """Private definitions become unused when their only call goes."""
+        state = self._relint(_SCRIPT, 8, 8, ["message (VALUE)\n"])
+        self.assertEqual([(e[0], e[1].line) for e in state.errors],
+                         [("unused/private", 1)])
+
+    def test_remove_end_of_block(self):
+        """Relint after removing the end of a block followed by its end."""
+        contents = _SCRIPT + "endfunction ()\n"
+        self._relint(contents, 4, 4, [])
+
+    def test_unbalanced_edit_raises(self):
+        """Relint raises like linter.lint if the edit does not parse."""
+        state = incremental.lint(_SCRIPT, **_OPTIONS)
+        edited = _edit(_SCRIPT, 4, 4, [])
+        with ExpectedException(IndexError):
+            incremental.relint(state, edited, 4, 3)
+
+    def test_open_quote_closed_later(self):
+        """Relint parses everything after a quote closed by the edit."""
+        contents = _edit(_SCRIPT, 5, 5, ["\"\n"])
+        state = incremental.lint(contents, **_OPTIONS)
+
+        # The quoted string now covers statements, which does not parse
+        edited = _edit(contents, 7, 7, ["\"\n"])
+        with ExpectedException(AssertionError):
+            incremental.relint(state, edited, 7, 7)
+
+
+class TestRelintEquivalence(TestCase):
+    """Test relint over many random edits of a generated file."""
+
+    def test_random_edits(self):
+        """Errors after each random edit are the same as linter.lint."""
+        rng = random.Random(0)
+        contents = corpus.generate(corpus.spec(statements=100))
+        state = incremental.lint(contents, **_OPTIONS)
+
+        for _ in range(0, 100):
+            line_count = len(state.lines)
+            first = rng.randint(1, line_count + 1)
+            last = min(first + rng.randint(0, 3) - 1, line_count)
+            replacement = [rng.choice(_FRAGMENTS)
+                           for _ in range(0, rng.randint(0, 3))]
+            edited = _edit(state.contents, first, last, replacement)
+
+            try:
+                expected = linter.lint(edited, **_OPTIONS)
+            except (AssertionError, IndexError):
+                continue
+
+            state = incremental.relint(state,
+                                       edited,
+                                       first,
+                                       first + len(replacement) - 1)
+            self.assertEqual(state.errors, expected)
@@ -0,0 +1,244 @@
+# /test/test_ir.py
+#
+# Test cases for building the compact representation of parsed files.
+#
+# See /LICENCE.md for Copyright information
+"""Test cases for building the compact representation of parsed files."""
+
+import struct
+
+from cmakeast import ast
+
+from polysquarecmakelinter import ir
+from polysquarecmakelinter import util
+
+from polysquarecmakelinter.ir import Kind
+
+from testtools import TestCase
+
+_SCRIPT = ("function (my_function ARGUMENT)\n"
+           "    if (ARGUMENT)\n"
+           "        call (\"${ARGUMENT}\n"
+           "              \")\n"
+           "    elseif (OTHER)\n"
+           "    else ()\n"
+           "        foreach (VAR ${ARGUMENT})\n"
+           "        endforeach ()\n"
+           "    endif (ARGUMENT)\n"
+           "endfunction ()\n"
+           "my_function (VALUE)\n")
+
+
+class TestBuild(TestCase):
+    """Test building the representation from a cmakeast tree."""
+
+    def setUp(self):  # NOQA
+        """Build the representation of _SCRIPT."""
+        super(TestBuild, self).setUp()
+        self.tree = ir.build(ast.parse(_SCRIPT))
+
+    def test_kinds(self):
+        """Each node has the kind of the cmakeast node it was built from."""
+        definition, call = self.tree.statements
+        if_block = definition.body[0]
+        self.assertEqual([self.tree.kind,
+                          definition.kind,
+                          definition.header.kind,
+                          definition.header.arguments[0].kind,
+                          if_block.kind,
+                          if_block.if_statement.kind,
+                          if_block.elseif_statements[0].kind,
+                          if_block.else_statement.kind,
+                          if_block.else_statement.body[0].kind,
+                          call.kind],
+                         [Kind.ToplevelBody,
+                          Kind.FunctionDefinition,
+                          Kind.FunctionCall,
+                          Kind.Word,
+                          Kind.IfBlock,
+                          Kind.IfStatement,
+                          Kind.ElseIfStatement,
+                          Kind.ElseStatement,
+                          Kind.ForeachStatement,
+                          Kind.FunctionCall])
+
+    def test_parents(self):
+        """Each node links to the node it is inside."""
+        definition = self.tree.statements[0]
+        if_block = definition.body[0]
+        call = if_block.if_statement.body[0]
+        self.assertIs(definition.parent, self.tree)
+        self.assertIs(definition.header.parent, definition)
+        self.assertIs(if_block.parent, definition)
+        self.assertIs(call.parent, if_block.if_statement)
+        self.assertIs(call.arguments[0].parent, call)
+
+    def test_depth_flattens_if_blocks(self):
+        """Depth is the indent level, with if clauses flattened."""
+        definition = self.tree.statements[0]
+        if_block = definition.body[0]
+        foreach = if_block.else_statement.body[0]
+        self.assertEqual([definition.depth,
+                          definition.header.depth,
+                          definition.footer.depth,
+                          if_block.depth,
+                          if_block.elseif_statements[0].header.depth,
+                          if_block.if_statement.body[0].depth,
+                          foreach.footer.depth],
+                         [0, 0, 0, 1, 1, 2, 2])
+
+    def test_end_lines(self):
+        """End lines include footers and arguments spanning lines."""
+        definition = self.tree.statements[0]
+        if_block = definition.body[0]
+        self.assertEqual([self.tree.end_line,
+                          definition.end_line,
+                          if_block.end_line,
+                          if_block.if_statement.end_line,
+                          if_block.if_statement.body[0].end_line,
+                          if_block.elseif_statements[0].end_line,
+                          self.tree.statements[1].end_line],
+                         [11, 10, 9, 4, 4, 5, 11])
+
+    def test_built_tree_returned_as_it_is(self):
+        """Building a tree which is already built returns it."""
+        self.assertIs(ir.build(self.tree), self.tree)
+
+    def test_deeply_nested(self):
+        """Trees nested thousands deep are built."""
+        depth = 3000
+        contents = ("foreach (VAR LIST)\n" * depth +
+                    "call (${VAR})\n" +
+                    "endforeach ()\n" * depth)
+        node = ir.build(util.parse(contents))
+        while node.kind != Kind.FunctionCall:
+            node = node.statements[0] if node.parent is None else node.body[0]
+
+        self.assertEqual(node.depth, depth)
+
+
+def _shape(node):
+    """Return a list of the kind, position and text of node and below it."""
+    shape = []
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        shape.append((node.kind,
+                      node.line,
+                      node.col,
+                      node.end_line,
+                      node.depth,
+                      getattr(node, "name", None),
+                      getattr(node, "type", None),
+                      getattr(node, "contents", None),
+                      None if node.parent is None else node.parent.kind))
+        children = ir._children(node)  # suppress(protected-access)
+        stack.extend(reversed([c for (_, c) in children]))
+
+    return shape
+
+
+class TestSerialize(TestCase):
+    """Test serializing built trees to bytes and back."""
+
+    def test_round_trip(self):
+        """Trees have the same nodes after being deserialized."""
+        tree = ir.build(ast.parse(_SCRIPT))
+        self.assertEqual(_shape(ir.deserialize(ir.serialize(tree))),
+                         _shape(tree))
+
+    def test_attributes_in_place(self):
+        """Deserialized nodes are in the same attributes of their parent."""
+        tree = ir.deserialize(ir.serialize(ast.parse(_SCRIPT)))
+        if_block = tree.statements[0].body[0]
+        self.assertEqual([tree.statements[0].footer.name,
+                          if_block.footer.name,
+                          if_block.else_statement.body[0].header.name,
+                          len(if_block.elseif_statements)],
+                         ["endfunction", "endif", "foreach", 1])
+
+    def test_non_ascii_strings(self):
+        """Strings which are not ASCII are deserialized."""
+        contents = u"message (\"été\")\n"
+        tree = ir.deserialize(ir.serialize(ast.parse(contents)))
+        self.assertEqual(tree.statements[0].arguments[0].contents,
+                         u"\"été\"")
+
+    def test_deserialize_from_buffer(self):
+        """Trees are deserialized from buffers holding serialized data."""
+        data = ir.serialize(ast.parse(_SCRIPT))
+        self.assertEqual(_shape(ir.deserialize(memoryview(data))),
+                         _shape(ir.deserialize(data)))
+
+    def test_empty_tree(self):
+        """Trees with no statements are serialized."""
+        tree = ir.deserialize(ir.serialize(ast.parse("")))
+        self.assertEqual(tree.statements, [])
+
+    def test_bad_magic(self):
+        """Data which is not a serialized tree raises ValueError."""
+        data = ir.serialize(ast.parse(_SCRIPT))
+        self.assertRaises(ValueError, ir.deserialize, b"XXXX" + data[4:])
+
+    def test_truncated(self):
+        """Serialized trees which are cut short raise ValueError."""
+        data = ir.serialize(ast.parse(_SCRIPT))
+        for length in (2, len(data) // 2, len(data) - 1):
+            self.assertRaises(ValueError, ir.deserialize, data[:length])
+
+    def _corrupted(self, array, index, value):
+        """Return _SCRIPT serialized with one value in array replaced.
+
+        array is the number of the array, where the byte arrays come
+        first and then the integer arrays.
+        """
+        data = bytearray(ir.serialize(ast.parse(_SCRIPT)))
+        header = ir._Header  # suppress(protected-access)
+        count = header.unpack_from(bytes(data), 0)[2]
+        byte_arrays = ir._BYTE_ARRAYS  # suppress(protected-access)
+        if array < byte_arrays:
+            struct.pack_into("<B", data, header.size + array * count + index,
+                             value)
+        else:
+            struct.pack_into("<i",
+                             data,
+                             (header.size + byte_arrays * count +
+                              4 * ((array - byte_arrays) * count + index)),
+                             value)
+
+        return bytes(data)
+
+    def test_unknown_kind(self):
+        """Serialized trees with an unknown node kind raise ValueError."""
+        for index in (0, 1):
+            self.assertRaises(ValueError,
+                              ir.deserialize,
+                              self._corrupted(0, index, 255))
+
+    def test_unknown_role(self):
+        """Serialized trees with an unknown role raise ValueError."""
+        self.assertRaises(ValueError,
+                          ir.deserialize,
+                          self._corrupted(1, 2, 255))
+
+    def test_role_not_in_parent(self):
+        """Nodes in attributes their parent does not have raise ValueError."""
+        self.assertRaises(ValueError,
+                          ir.deserialize,
+                          self._corrupted(1, 1, ir.Role.If))
+
+    def test_bad_parent(self):
+        """Serialized trees with a second root raise ValueError."""
+        self.assertRaises(ValueError,
+                          ir.deserialize,
+                          self._corrupted(3, 1, -1))
+
+    def test_bad_string_index(self):
+        """Serialized trees with a bad string index raise ValueError."""
+        shape = _shape(ir.build(ast.parse(_SCRIPT)))
+        for index in (2, 3):
+            self.assertIn(shape[index][0], (Kind.FunctionCall, Kind.Word))
+            for string_index in (-1, 1000):
+                self.assertRaises(ValueError,
+                                  ir.deserialize,
+                                  self._corrupted(8, index, string_index))
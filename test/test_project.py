@@ -0,0 +1,171 @@
+# /test/test_project.py
+#
+# Test cases for the project index of exports from each file.
+#
+# See /LICENCE.md for Copyright information
+"""Test cases for the project index of exports from each file."""
+
+import os
+
+import shutil
+
+import tempfile
+
+from polysquarecmakelinter import cache
+from polysquarecmakelinter import linter
+from polysquarecmakelinter import project
+from polysquarecmakelinter import util
+
+from testtools import TestCase
+
+_DEFINES = ("macro (_ns_private)\n"
+            "endmacro ()\n"
+            "set (_NS_VARIABLE VALUE)\n")
+
+_USES = ("_ns_private ()\n"
+         "message (${_NS_VARIABLE})\n")
+
+_CODES = ("unused/private",
+          "unused/private_var",
+          "access/other_private",
+          "access/private_var")
+
+
+class TestProjectIndex(TestCase):
+    """Test cases for project.ProjectIndex."""
+
+    def __init__(self, *args, **kwargs):
+        """Initialize class variables."""
+        super(TestProjectIndex, self).__init__(*args,  # suppress(R903)
+                                               **kwargs)
+        self._directory = None
+        self._parsed = []
+
+    def setUp(self):  # NOQA
+        """Create a module of two files in a temporary directory."""
+        super(TestProjectIndex, self).setUp()
+        self._directory = tempfile.mkdtemp()
+        self._write("ns.cmake", _DEFINES)
+        self._write("ns_internal.cmake", _USES)
+        self._write("notes.txt", _USES)
+
+    def tearDown(self):  # NOQA
+        """Remove the temporary directory."""
+        shutil.rmtree(self._directory)
+        super(TestProjectIndex, self).tearDown()
+
+    def _write(self, name, contents):
+        """Write contents to name in the temporary directory."""
+        with open(self._path(name), "w") as written:
+            written.write(contents)
+
+    def _path(self, name):
+        """Return the path to name in the temporary directory."""
+        return os.path.join(self._directory, name)
+
+    def _exports_of(self, contents):
+        """Record that contents were parsed and return their exports."""
+        self._parsed.append(contents)
+        return linter.file_exports(contents)
+
+    def _index(self, store, boundary="directory"):
+        """Return a ProjectIndex using store."""
+        return project.ProjectIndex(store, self._exports_of, _CODES, boundary)
+
+    def test_members_are_cmake_files_in_directory(self):
+        """A module is all the CMake files in a directory."""
+        self.assertEqual(project.module_members(self._path("ns.cmake"),
+                                                "directory"),
+                         [self._path("ns.cmake"),
+                          self._path("ns_internal.cmake")])
+
+    def test_exports_of_other_files(self):
+        """Exports are of all other files in the module."""
+        index = self._index(cache.MemoryStore())
+        index.refresh([self._path("ns_internal.cmake")])
+
+        keys, exports = index.module_exports(self._path("ns_internal.cmake"))
+        self.assertEqual(len(keys), 1)
+        self.assertEqual(exports["access/other_private"][0].definitions,
+                         set(["_ns_private"]))
+        self.assertEqual(exports["access/other_private"][0].calls, [])
+
+    def test_file_boundary_has_no_exports(self):
+        """With the file boundary, there are no other files to export."""
+        index = self._index(cache.MemoryStore(), "file")
+        index.refresh([self._path("ns.cmake")])
+        self.assertEqual(index.module_exports(self._path("ns.cmake")),
+                         ([], dict()))
+
+    def test_unchanged_files_not_parsed_again(self):
+        """Only files which changed are parsed when refreshing from store."""
+        store = cache.MemoryStore()
+        self._index(store).refresh([self._path("ns.cmake")])
+        self.assertEqual(len(self._parsed), 2)
+
+        self._write("ns_internal.cmake", _USES + "\n")
+        index = self._index(store)
+        index.refresh([self._path("ns.cmake")])
+        self.assertEqual(self._parsed[2:], [_USES + "\n"])
+
+    def test_exports_same_when_read_from_store(self):
+        """Exports read back from the store are the same as when parsed."""
+        store = cache.MemoryStore()
+        index = self._index(store)
+        index.refresh([self._path("ns.cmake")])
+        parsed = index.module_exports(self._path("ns.cmake"))
+
+        index = self._index(store)
+        index.refresh([self._path("ns.cmake")])
+        self.assertEqual(index.module_exports(self._path("ns.cmake")),
+                         parsed)
+        self.assertEqual(len(self._parsed), 2)
+
+    def test_bad_stored_exports_parsed_again(self):
+        """Files are parsed again if their stored exports are bad."""
+        store = cache.MemoryStore()
+        self._index(store).refresh([self._path("ns.cmake")])
+        for key in list(store._values.keys()):  # suppress(W0212)
+            store.put(key, b"cos\nsystem\n(S'true'\ntR.")
+
+        self._index(store).refresh([self._path("ns.cmake")])
+        self.assertEqual(len(self._parsed), 4)
+
+
+class TestModuleLint(TestCase):
+    """Test cases for linting with exports from other files."""
+
+    def test_definition_used_in_other_file(self):
+        """Private definitions used by other files are not unused."""
+        exports = linter.file_exports(_USES)
+        errors = linter.lint(_DEFINES,
+                             whitelist=list(_CODES),
+                             module_exports={
+                                 k: [v] for (k, v) in exports.items()
+                             })
+        self.assertEqual(errors, [])
+
+    def test_private_from_other_file_used(self):
+        """Privates from other files in the module can be used."""
+        exports = linter.file_exports(_DEFINES)
+        errors = linter.lint(_USES,
+                             whitelist=list(_CODES),
+                             module_exports={
+                                 k: [v] for (k, v) in exports.items()
+                             })
+        self.assertEqual(errors, [])
+
+    def test_too_deep_to_parse_exports_nothing(self):
+        """Files too deeply nested to parse export nothing."""
+        def _parse(contents):
+            """Fail as if contents were nested too deeply."""
+            raise RuntimeError("maximum recursion depth exceeded")
+
+        self.patch(util, "parse", _parse)
+        self.assertEqual(linter.file_exports(_DEFINES), dict())
+
+    def test_privates_flagged_without_module(self):
+        """Privates from other files are flagged without module_exports."""
+        self.assertEqual(sorted([e[0] for e in linter.lint(_USES)
+                                 if e[0] in _CODES]),
+                         ["access/other_private", "access/private_var"])
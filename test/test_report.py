@@ -0,0 +1,142 @@
+# /test/test_report.py
+#
+# Test cases for reporters writing linter errors in different formats.
+#
+# See /LICENCE.md for Copyright information
+"""Test cases for reporters writing linter errors in different formats."""
+
+import json
+
+from xml.etree import ElementTree
+
+from polysquarecmakelinter import report
+
+from polysquarecmakelinter.types import LinterFailure
+
+from testtools import TestCase
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+_CODES = ("style/indent", "unused/private")
+
+# (file_path, code, failure, fixed) reported in each test
+_ERRORS = (
+    ("/a/CMakeLists.txt", "style/indent", LinterFailure("Bad <indent>", 2),
+     False),
+    ("/a/CMakeLists.txt", "unused/private", LinterFailure("Unused \"x\"", 4),
+     True),
+    ("/b/Module.cmake", "style/indent", LinterFailure("Bad indent", 1),
+     False)
+)
+
+
+def _report(report_format, errors=_ERRORS):
+    """Return what a reporter for report_format writes for errors."""
+    stream = StringIO()
+    reporter = report.reporter(report_format, stream)
+    reporter.start(_CODES)
+    for error in errors:
+        reporter.error(*error)
+
+    reporter.finish()
+    return stream.getvalue()
+
+
+class TestBufferedWriter(TestCase):
+    """Test cases for report.BufferedWriter."""
+
+    def test_held_until_full(self):
+        """Text is only written once the buffer is full."""
+        stream = StringIO()
+        writer = report.BufferedWriter(stream, size=4)
+        writer.write("abc")
+        self.assertEqual(stream.getvalue(), "")
+        writer.write("de")
+        self.assertEqual(stream.getvalue(), "abcde")
+
+    def test_flush(self):
+        """Flushing writes everything held."""
+        stream = StringIO()
+        writer = report.BufferedWriter(stream)
+        writer.write("abc")
+        writer.flush()
+        self.assertEqual(stream.getvalue(), "abc")
+
+    def test_unbuffered(self):
+        """With a size of zero, text is written straight away."""
+        stream = StringIO()
+        writer = report.BufferedWriter(stream, size=0)
+        writer.write("abc")
+        self.assertEqual(stream.getvalue(), "abc")
+
+
+class TestReporters(TestCase):
+    """Test cases for each reporter."""
+
+    def test_human(self):
+        """Human reporter writes a line for each error."""
+        self.assertEqual(_report("human").splitlines(),
+                         ["/a/CMakeLists.txt:2 [style/indent] Bad <indent>",
+                          "/a/CMakeLists.txt:4 [unused/private] "
+                          "Unused \"x\" ... FIXED",
+                          "/b/Module.cmake:1 [style/indent] Bad indent"])
+
+    def test_human_written_straight_away(self):
+        """Human reporter writes each error as it is reported."""
+        stream = StringIO()
+        reporter = report.reporter("human", stream)
+        reporter.start(_CODES)
+        reporter.error(*_ERRORS[0])
+        self.assertEqual(stream.getvalue(),
+                         "/a/CMakeLists.txt:2 [style/indent] Bad <indent>\n")
+
+    def test_jsonl(self):
+        """JSON Lines reporter writes an object on each line."""
+        errors = [json.loads(line) for line in _report("jsonl").splitlines()]
+        self.assertEqual(errors[1], {
+            "file": "/a/CMakeLists.txt",
+            "line": 4,
+            "code": "unused/private",
+            "description": "Unused \"x\"",
+            "fixed": True
+        })
+        self.assertEqual(len(errors), 3)
+
+    def test_sarif(self):
+        """SARIF reporter writes a log with a result for each error."""
+        log = json.loads(_report("sarif"))
+        self.assertEqual(log["version"], "2.1.0")
+
+        run = log["runs"][0]
+        self.assertEqual([r["id"] for r in run["tool"]["driver"]["rules"]],
+                         list(_CODES))
+        self.assertEqual([(r["ruleId"],
+                           r["locations"][0]["physicalLocation"]["region"]
+                           ["startLine"])
+                          for r in run["results"]],
+                         [("style/indent", 2),
+                          ("unused/private", 4),
+                          ("style/indent", 1)])
+        self.assertEqual(run["results"][2]["locations"][0]
+                         ["physicalLocation"]["artifactLocation"]["uri"],
+                         "file:///b/Module.cmake")
+
+    def test_sarif_no_errors(self):
+        """SARIF reporter writes a valid log with no errors."""
+        self.assertEqual(json.loads(_report("sarif", ()))["runs"][0]
+                         ["results"], [])
+
+    def test_checkstyle(self):
+        """Checkstyle reporter groups errors by file."""
+        root = ElementTree.fromstring(_report("checkstyle"))
+        files = root.findall("file")
+        self.assertEqual([f.get("name") for f in files],
+                         ["/a/CMakeLists.txt", "/b/Module.cmake"])
+        self.assertEqual([(e.get("line"), e.get("severity"),
+                           e.get("message"), e.get("source"))
+                          for e in files[0].findall("error")],
+                         [("2", "warning", "Bad <indent>", "style/indent"),
+                          ("4", "info", "Unused \"x\"", "unused/private")])
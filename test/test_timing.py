@@ -0,0 +1,60 @@
+# /test/test_timing.py
+#
+# Test cases for timing phases and checks with --profile.
+#
+# See /LICENCE.md for Copyright information
+"""Test cases for timing phases and checks with --profile."""
+
+import pickle
+
+from polysquarecmakelinter import linter
+from polysquarecmakelinter import timing
+
+from testtools import TestCase
+
+
+class TestProfile(TestCase):
+    """Test that timing.Profile records self time in each timer."""
+
+    def test_nested_time_excluded_from_outer(self):
+        """Time spent in a nested timer is not counted in the outer one."""
+        clock = [0.0]
+        self.patch(timing, "_wall_time", lambda: clock[0])
+        self.patch(timing, "_cpu_time", lambda: clock[0])
+
+        profile = timing.Profile()
+        with profile.timer("phase", "outer"):
+            clock[0] += 1.0
+            with profile.timer("analysis", "inner"):
+                clock[0] += 2.0
+
+        self.assertEqual(profile.totals[("phase", "outer")], [1.0, 1.0, 1])
+        self.assertEqual(profile.totals[("analysis", "inner")],
+                         [2.0, 2.0, 1])
+
+    def test_merge_pickled(self):
+        """Profiles merge after being pickled, as from a worker process."""
+        profile = timing.Profile()
+        profile.add("check", "style/indent", 1.0, 0.5)
+        profile.add_file("a.cmake", 1.0)
+
+        merged = timing.Profile()
+        merged.merge(pickle.loads(pickle.dumps(profile)))
+        merged.merge(profile)
+
+        self.assertEqual(merged.totals[("check", "style/indent")],
+                         [2.0, 1.0, 2])
+        self.assertEqual(merged.slowest_files(1), [("a.cmake", 2.0)])
+
+    def test_lint_times_each_check(self):
+        """Linting with a profile times each enabled check and phase."""
+        profile = timing.Profile()
+        linter.lint("function_call()\n",
+                    whitelist=["style/space_before_func",
+                               "unused/var_in_func"],
+                    profile=profile)
+        timers = set(profile.totals.keys())
+        self.assertTrue(set([("phase", "parse"),
+                             ("check", "style/space_before_func"),
+                             ("check", "unused/var_in_func"),
+                             ("analysis", "set_and_used_scopes")]) <= timers)
@@ -0,0 +1,180 @@
+# /test/test_vcs.py
+#
+# Test cases for finding files and lines changed since a git revision.
+#
+# See /LICENCE.md for Copyright information
+"""Test cases for finding files and lines changed since a git revision."""
+
+import os
+
+import shutil
+
+import subprocess
+
+import tempfile
+
+from polysquarecmakelinter import vcs
+
+from testtools import TestCase
+
+_DIFF = """diff --git a/CMakeLists.txt b/CMakeLists.txt
+index 1111111..2222222 100644
+--- a/CMakeLists.txt
++++ b/CMakeLists.txt
+@@ -2 +2 @@ project (test)
+-message (OLD)
++message (NEW)
+@@ -10,0 +11,3 @@ endfunction ()
++call (A)
+++++ b/looks_like_a_header
++call (C)
+\\ No newline at end of file
+@@ -20,2 +23,0 @@ endfunction ()
+-call (D)
+--- a/looks_like_a_header
+diff --git a/gone.cmake b/gone.cmake
+deleted file mode 100644
+--- a/gone.cmake
++++ /dev/null
+@@ -1 +0,0 @@
+-call (F)
+"""
+
+
+def _git(directory, *arguments):
+    """Run git with arguments in directory."""
+    with open(os.devnull, "w") as devnull:
+        subprocess.check_call(["git",
+                               "-c", "user.name=test",
+                               "-c", "user.email=test@example.com"] +
+                              list(arguments),
+                              cwd=directory,
+                              stdout=devnull,
+                              stderr=devnull)
+
+
+class TestLineIntervals(TestCase):
+    """Test cases for vcs.LineIntervals."""
+
+    def test_contains(self):
+        """Lines are only in the intervals that cover them."""
+        intervals = vcs.LineIntervals([(5, 7), (1, 2)])
+        self.assertEqual([line for line in range(0, 10) if line in intervals],
+                         [1, 2, 5, 6, 7])
+
+    def test_adjacent_merged(self):
+        """Overlapping and adjacent intervals are merged."""
+        intervals = vcs.LineIntervals([(1, 2), (3, 4), (4, 8), (10, 10)])
+        self.assertEqual(intervals.intervals(), [(1, 8), (10, 10)])
+
+
+class TestParseDiff(TestCase):
+    """Test cases for vcs.parse_diff."""
+
+    def test_added_lines(self):
+        """Lines added or changed in hunks are changed."""
+        changed = vcs.parse_diff(_DIFF, "/top")
+        self.assertEqual(changed["/top/CMakeLists.txt"].intervals(),
+                         [(2, 2), (11, 13)])
+
+    def test_path_with_space(self):
+        """The tab after paths with spaces is not part of the path."""
+        changed = vcs.parse_diff("+++ b/sp ace.cmake\t\n@@ -1 +1 @@\n",
+                                 "/top")
+        self.assertEqual(list(changed.keys()), ["/top/sp ace.cmake"])
+
+    def test_quoted_path(self):
+        """Quoted paths with escapes are unquoted."""
+        changed = vcs.parse_diff("+++ \"b/\\303\\251 \\\"q\\\".cmake\"\t\n"
+                                 "@@ -1 +1 @@\n",
+                                 "/top")
+        self.assertEqual(list(changed.keys()),
+                         [u"/top/\u00e9 \"q\".cmake"])
+
+    def test_deleted_files_not_changed(self):
+        """Deleted files are not changed files."""
+        self.assertEqual(list(vcs.parse_diff(_DIFF, "/top").keys()),
+                         ["/top/CMakeLists.txt"])
+
+
+class TestChangedLines(TestCase):
+    """Test cases for vcs.changed_lines in a git repository."""
+
+    def __init__(self, *args, **kwargs):
+        """Initialize class variables."""
+        super(TestChangedLines, self).__init__(*args,  # suppress(R903)
+                                               **kwargs)
+        self._directory = None
+
+    def setUp(self):  # NOQA
+        """Create a git repository with one commit."""
+        super(TestChangedLines, self).setUp()
+        self._directory = os.path.realpath(tempfile.mkdtemp())
+        try:
+            _git(self._directory, "init")
+        except (OSError, subprocess.CalledProcessError):
+            shutil.rmtree(self._directory)
+            self.skipTest("git is not available")
+
+        self._write("CMakeLists.txt", "call (A)\ncall (B)\n")
+        self._write("unchanged.cmake", "call (A)\n")
+        _git(self._directory, "add", ".")
+        _git(self._directory, "commit", "-m", "Initial")
+
+    def tearDown(self):  # NOQA
+        """Remove the repository."""
+        shutil.rmtree(self._directory)
+        super(TestChangedLines, self).tearDown()
+
+    def _write(self, name, contents):
+        """Write contents to name in the repository."""
+        with open(os.path.join(self._directory, name), "w") as written:
+            written.write(contents)
+
+    def test_changed_and_untracked_files(self):
+        """Modified and untracked files are changed."""
+        self._write("CMakeLists.txt", "call (A)\ncall (C)\ncall (B)\n")
+        self._write("new.cmake", "call (D)\n")
+
+        changed = vcs.changed_lines("HEAD", self._directory)
+        self.assertEqual(sorted(changed.keys()),
+                         [os.path.join(self._directory, "CMakeLists.txt"),
+                          os.path.join(self._directory, "new.cmake")])
+        self.assertEqual(changed[os.path.join(self._directory,
+                                              "CMakeLists.txt")]
+                         .intervals(),
+                         [(2, 2)])
+        self.assertIn(1000, changed[os.path.join(self._directory,
+                                                 "new.cmake")])
+
+    def test_prefixes_configured_away(self):
+        """Files are found when diff.noprefix is set."""
+        _git(self._directory, "config", "diff.noprefix", "true")
+        self._write("CMakeLists.txt", "call (A)\ncall (C)\n")
+
+        changed = vcs.changed_lines("HEAD", self._directory)
+        self.assertEqual(list(changed.keys()),
+                         [os.path.join(self._directory, "CMakeLists.txt")])
+
+    def test_unusual_file_names(self):
+        """Files with spaces and quotes in their names are found."""
+        names = ["sp ace.cmake", "qu\"ote.cmake"]
+        for name in names:
+            self._write(name, "call (A)\n")
+
+        _git(self._directory, "add", ".")
+        _git(self._directory, "commit", "-m", "Unusual names")
+        for name in names:
+            self._write(name, "call (B)\n")
+
+        changed = vcs.changed_lines("HEAD", self._directory)
+        self.assertEqual(sorted(changed.keys()),
+                         sorted([os.path.join(self._directory, n)
+                                 for n in names]))
+
+    def test_bad_revision(self):
+        """Unknown revisions raise RuntimeError."""
+        self.assertRaises(RuntimeError,
+                          vcs.changed_lines,
+                          "no-such-revision",
+                          self._directory)
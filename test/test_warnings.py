@@ -5,7 +5,12 @@
 # See /LICENCE.md for Copyright information
 """Test the linter to ensure that each lint use-case triggers warnings."""
 
+import sys
+
+from cmakeast import ast
+
 from polysquarecmakelinter import linter
+from polysquarecmakelinter import nolint
 
 from testtools import TestCase
 
@@ -31,3 +36,151 @@ class TestIgnoreLines(TestCase):
         """Ignore lines that match the NOLINT."""
         self.assertTrue(linter.should_ignore(" # NOLINT:some/warning\n",
                                              "some/warning"))
+
+
+class TestSuppressionMap(TestCase):
+    """Test case for NOLINT suppression maps."""
+
+    def test_suppress_line(self):
+        """Codes named on a line are suppressed on that line only."""
+        suppressions = nolint.SuppressionMap(["call () # NOLINT:some/code\n",
+                                              "call ()\n"])
+        self.assertTrue(suppressions.suppressed("some/code", 1))
+        self.assertFalse(suppressions.suppressed("other/code", 1))
+        self.assertFalse(suppressions.suppressed("some/code", 2))
+
+    def test_suppress_multiple_codes(self):
+        """Codes can be separated by commas."""
+        suppressions = nolint.SuppressionMap(["call () # NOLINT:a/b,c/d\n"])
+        self.assertTrue(suppressions.suppressed("a/b", 1))
+        self.assertTrue(suppressions.suppressed("c/d", 1))
+
+    def test_suppress_block(self):
+        """Codes are suppressed between NOLINT-BEGIN and NOLINT-END."""
+        suppressions = nolint.SuppressionMap(["# NOLINT-BEGIN:some/code\n",
+                                              "call ()\n",
+                                              "# NOLINT-END\n",
+                                              "call ()\n"])
+        self.assertTrue(suppressions.suppressed("some/code", 2))
+        self.assertFalse(suppressions.suppressed("some/code", 4))
+
+    def test_suppress_nested_blocks(self):
+        """NOLINT-END ends the innermost block."""
+        suppressions = nolint.SuppressionMap(["# NOLINT-BEGIN:a/b\n",
+                                              "# NOLINT-BEGIN:c/d\n",
+                                              "call ()\n",
+                                              "# NOLINT-END\n",
+                                              "call ()\n"])
+        self.assertTrue(suppressions.suppressed("c/d", 3))
+        self.assertFalse(suppressions.suppressed("c/d", 5))
+        self.assertTrue(suppressions.suppressed("a/b", 5))
+
+    def test_suppress_file(self):
+        """NOLINT-FILE suppresses codes on every line."""
+        suppressions = nolint.SuppressionMap(["call ()\n",
+                                              "# NOLINT-FILE:*\n"])
+        self.assertTrue(suppressions.suppressed_in_file("some/code"))
+        self.assertTrue(suppressions.suppressed("some/code", 1))
+
+
+class TestLintSuppressions(TestCase):
+    """Test case for linter.lint honoring NOLINT comments."""
+
+    def test_line_suppressed(self):
+        """Errors on lines with NOLINT are not returned."""
+        self.assertEqual(linter.lint("call() # NOLINT:*\n",
+                                     whitelist=["style/space_before_func"]),
+                         [])
+
+    def test_block_suppressed(self):
+        """Errors inside NOLINT-BEGIN blocks are not returned."""
+        contents = ("# NOLINT-BEGIN:style/space_before_func\n"
+                    "call()\n"
+                    "# NOLINT-END\n"
+                    "call()\n")
+        errors = linter.lint(contents,
+                             whitelist=["style/space_before_func"])
+        self.assertEqual([e[1].line for e in errors], [4])
+
+    def test_first_unsuppressed_violation(self):
+        """Checks reporting one error report one which is not suppressed."""
+        contents = ("# NOLINT-BEGIN:style/set_var_case\n"
+                    "set (lower VALUE)\n"
+                    "# NOLINT-END\n"
+                    "set (other VALUE)\n")
+        for whitelist in (None, ["style/set_var_case"]):
+            errors = [e for e in linter.lint(contents, whitelist=whitelist)
+                      if e[0] == "style/set_var_case"]
+            self.assertEqual([e[1].line for e in errors], [4])
+
+    def test_file_suppressed_not_parsed(self):
+        """Files where every check is suppressed are not parsed."""
+        def _parse(contents):
+            """Fail, as the file should not be parsed."""
+            raise AssertionError("Parsed {0}".format(contents))
+
+        self.patch(ast, "parse", _parse)
+        self.assertEqual(linter.lint("# NOLINT-FILE:*\ncall()\n"), [])
+
+
+class TestLinter(TestCase):
+    """Test case for linting many files with one linter.Linter."""
+
+    def test_same_errors_as_lint(self):
+        """Linter.lint returns the same errors as linter.lint."""
+        contents = ("function (Foo_call)\n"
+                    "endfunction ()\n"
+                    "Foo_call()\n")
+        self.assertEqual(linter.Linter(namespace="ns").lint(contents),
+                         linter.lint(contents, namespace="ns"))
+
+    def test_reused_for_other_contents(self):
+        """A Linter finds errors in each file it lints."""
+        lint = linter.Linter(whitelist=["style/space_before_func"]).lint
+        self.assertEqual([[e[1].line for e in lint(c)]
+                          for c in ("call()\n",
+                                    "call ()\n",
+                                    "call ()\ncall()\n")],
+                         [[1], [], [2]])
+
+    def test_suppressed_in_one_file_only(self):
+        """Checks suppressed in one file still run on other files."""
+        lint = linter.Linter(whitelist=["style/space_before_func",
+                                        "style/lowercase_func"]).lint
+        self.assertEqual([[e[0] for e in lint(c)]
+                          for c in ("# NOLINT-FILE:style/space_before_func\n"
+                                    "CALL()\n",
+                                    "CALL()\n")],
+                         [["style/lowercase_func"],
+                          ["style/space_before_func",
+                           "style/lowercase_func"]])
+
+    def test_unknown_option(self):
+        """Options no check accepts are rejected."""
+        self.assertRaises(TypeError, linter.Linter, namespce="ns")
+
+
+class TestDeeplyNested(TestCase):
+    """Test linting scripts with blocks nested thousands deep."""
+
+    def test_unused_variable_deep_inside(self):
+        """Find an unused variable set inside thousands of blocks."""
+        depth = 3000
+        contents = ("function (my_function ARGUMENT)\n" +
+                    "foreach (LOOP_VAR ${ARGUMENT})\n" * depth +
+                    "set (UNUSED ${LOOP_VAR})\n" +
+                    "endforeach ()\n" * depth +
+                    "endfunction ()\n")
+        errors = linter.lint(contents,
+                             whitelist=["unused/var_in_func",
+                                        "access/private_var"])
+        self.assertEqual([(e[0], e[1].line) for e in errors],
+                         [("unused/var_in_func", depth + 2)])
+
+    def test_recursion_limit_restored(self):
+        """The recursion limit is the same after linting as before it."""
+        limit = sys.getrecursionlimit()
+        contents = ("foreach (LOOP_VAR LIST)\n" * 3000 +
+                    "endforeach ()\n" * 3000)
+        linter.lint(contents, whitelist=["unused/var_in_func"])
+        self.assertEqual(sys.getrecursionlimit(), limit)
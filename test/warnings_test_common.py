@@ -43,7 +43,8 @@ def _after_arg_mixin(argument):
                      other_transform,
                      match_transform):
             """Generate argument list of ARGUMENT__ {argument} VALUE."""
-            args_before = other_transform("ARGUMENT__ {0}".format(argument))
+            args_before = "{0} {1}".format(other_transform("ARGUMENT__"),
+                                           argument)
             match_arg = match_transform("VALUE")
             subcommand = sub + " " if sub is not None else ""
             return subcommand + " ".join([args_before, match_arg])